@@ -0,0 +1,185 @@
+import gzip
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+
+_HEADER = struct.Struct('>16sI')
+_ENTRY = struct.Struct('>16sQI')  # Digest, Position der Daten, Länge
+
+
+class PageArchive:
+    # Rohseiten zum späteren Nachextrahieren, nur anhängend:
+    #   blobs-JJJJ-MM.dat    jeder Seiteninhalt einmal je Monat (Digest, Länge, zlib-Daten); die
+    #                        Uhrzeit im Skript ist ausgeblendet, gleiche Seiten haben denselben Digest
+    #   blobs-JJJJ-MM.idx    Verzeichnis dazu (Digest, Position, Länge), wird erst bei Bedarf je
+    #                        Monat geladen; fehlt es oder ist es kürzer, wird der Rest der .dat gelesen
+    #   index/JJJJ-MM-TT.jsonl.gz  je gespeicherter Stichprobe [timestamp, Gerät, [Digests]],
+    #                        gesammelt als gzip-Member alle flush_records Einträge; null für eine
+    #                        Seite, die nicht geladen werden konnte
+    # Ein beim Absturz abgeschnittener letzter Eintrag wird beim Lesen übergangen.
+
+    def __init__(self, directory, flush_records=300, compression=6, readonly=False):
+        self.directory = directory
+        self.readonly = readonly
+        self.flush_records = flush_records
+        self.compression = compression
+        self.blobs_written = 0
+        self.bytes_written = 0
+        self.records_written = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Monat -> {Digest: (Position, Länge)}; beim Schreiben nur der laufende Monat
+        self._months = {}
+        os.makedirs(os.path.join(directory, 'index'), exist_ok=True)
+
+    def __contains__(self, digest):
+        return any(digest in blobs for blobs in self._months.values())
+
+    def put(self, digest, content):
+        # Neuen Seiteninhalt speichern; False, wenn er in diesem Monat schon im Archiv liegt
+        month = f'{datetime.now():%Y-%m}'
+        blobs = self._months.get(month)
+        if blobs is not None and digest in blobs:
+            return False
+        data = zlib.compress(content.encode('utf-8'), self.compression)
+        with self._lock:
+            if month not in self._months:
+                # Monatswechsel: ältere Monate nicht im Speicher halten
+                self._months = {month: self._load_month(month)}
+            blobs = self._months[month]
+            if digest in blobs:
+                return False
+            with open(self._path(month, 'dat'), 'ab') as f:
+                offset = f.tell()
+                f.write(_HEADER.pack(digest, len(data)) + data)
+            with open(self._path(month, 'idx'), 'ab') as f:
+                f.write(_ENTRY.pack(digest, offset + _HEADER.size, len(data)))
+            blobs[digest] = (offset + _HEADER.size, len(data))
+            self.blobs_written += 1
+            self.bytes_written += _HEADER.size + len(data)
+        return True
+
+    def load(self, digest, month=None):
+        # Zuerst im Monat der Stichprobe (und den Nachbarmonaten) suchen, dann in allen übrigen
+        for candidate in self._candidates(month):
+            with self._lock:
+                if candidate not in self._months:
+                    self._months[candidate] = self._load_month(candidate)
+                entry = self._months[candidate].get(digest)
+            if entry is not None:
+                offset, length = entry
+                with open(self._path(candidate, 'dat'), 'rb') as f:
+                    f.seek(offset)
+                    return zlib.decompress(f.read(length)).decode('utf-8')
+        raise KeyError(digest)
+
+    def record(self, timestamp, device_id, digests):
+        day = timestamp.strftime('%Y-%m-%d')
+        line = json.dumps([timestamp.isoformat(), device_id, [digest and digest.hex() for digest in digests]])
+        with self._lock:
+            lines = self._pending.setdefault(day, [])
+            lines.append(line)
+            self.records_written += 1
+            if len(lines) >= self.flush_records or len(self._pending) > 1:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def days(self):
+        names = os.listdir(os.path.join(self.directory, 'index'))
+        return sorted(name[:-len('.jsonl.gz')] for name in names if name.endswith('.jsonl.gz'))
+
+    def records(self, day):
+        # (timestamp, Gerät, (Digests)) eines Tages in Aufnahmereihenfolge
+        path = os.path.join(self.directory, 'index', f'{day}.jsonl.gz')
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        timestamp, device_id, digests = json.loads(line)
+                    except ValueError:
+                        continue
+                    yield (datetime.fromisoformat(timestamp), device_id,
+                           tuple(digest and bytes.fromhex(digest) for digest in digests))
+        except (EOFError, OSError) as e:
+            print(f"Archive index {path} truncated: {e}")
+
+    def stats(self):
+        return {
+            'blobs': sum(len(blobs) for blobs in self._months.values()),
+            'blobs_written': self.blobs_written,
+            'bytes_written': self.bytes_written,
+            'records_written': self.records_written,
+        }
+
+    def _flush(self):
+        for day, lines in self._pending.items():
+            path = os.path.join(self.directory, 'index', f'{day}.jsonl.gz')
+            with open(path, 'ab') as f:
+                f.write(gzip.compress(('\n'.join(lines) + '\n').encode('utf-8')))
+        self._pending = {}
+
+    def _path(self, month, suffix):
+        return os.path.join(self.directory, f'blobs-{month}.{suffix}')
+
+    def _candidates(self, month):
+        months = sorted(name[len('blobs-'):-len('.dat')] for name in os.listdir(self.directory)
+                        if name.startswith('blobs-') and name.endswith('.dat'))
+        if month in months:
+            i = months.index(month)
+            near = [months[i]] + months[i + 1:i + 2] + months[max(i - 1, 0):i]
+            return near + [m for m in reversed(months) if m not in near]
+        return list(reversed(months))
+
+    def _load_month(self, month):
+        blobs = {}
+        path = self._path(month, 'dat')
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        index = self._path(month, 'idx')
+        data = b''
+        if os.path.exists(index):
+            with open(index, 'rb') as f:
+                data = f.read()
+        end = 0
+        count = len(data) // _ENTRY.size
+        for i in range(count):
+            digest, offset, length = _ENTRY.unpack_from(data, i * _ENTRY.size)
+            if offset + length > size:
+                count = i
+                break
+            blobs[digest] = (offset, length)
+            end = offset + length
+        if count * _ENTRY.size != len(data) and not self.readonly:
+            # Abgeschnittener Eintrag oder Einträge hinter dem Ende der .dat
+            os.truncate(index, count * _ENTRY.size)
+        if end < size:
+            # Altes Archiv ohne Verzeichnis oder Absturz zwischen .dat und .idx: Rest einlesen
+            added = self._scan(path, end, size, blobs)
+            if added and not self.readonly:
+                with open(index, 'ab') as f:
+                    f.write(b''.join(_ENTRY.pack(digest, *blobs[digest]) for digest in added))
+        return blobs
+
+    def _scan(self, path, offset, size, blobs):
+        added = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while offset + _HEADER.size <= size:
+                digest, length = _HEADER.unpack(f.read(_HEADER.size))
+                if offset + _HEADER.size + length > size:
+                    break
+                blobs[digest] = (offset + _HEADER.size, length)
+                added.append(digest)
+                offset += _HEADER.size + length
+                f.seek(offset)
+        if offset < size:
+            print(f"Archive file {path} truncated at {offset}.")
+            if not self.readonly:
+                # Sonst lägen neue Einträge hinter dem unvollständigen und wären unauffindbar
+                os.truncate(path, offset)
+        return added
@@ -0,0 +1,556 @@
+import argparse
+import os
+import random
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bs4 import BeautifulSoup
+from psycopg2.extras import execute_values
+
+import ringbuffer
+import scraper
+from coldstore import ColdStore, read_range, tier_data
+from devices import Device
+from ringbuffer import SampleRing
+from scheduler import DeadlineScheduler
+from timing import StageTimer
+from writer import BatchWriter
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'pages')
+PAGES = ('status', 'heatpump', 'energy')
+PAGE_QUERIES = {'1,0': 'status', '1,1': 'heatpump', '1,8': 'energy'}
+
+
+def load_pages():
+    pages = {}
+    for name in PAGES:
+        with open(os.path.join(PAGES_DIR, f'{name}.html'), encoding='utf-8') as f:
+            pages[name] = f.read()
+    return pages
+
+
+class FakeIsgHandler(BaseHTTPRequestHandler):
+    # Antwortet nach latency ± jitter Sekunden; mit failure_rate entweder HTTP 500 oder ein
+    # abgebrochener Verbindungsaufbau ohne Antwort, wie bei einem überlasteten ISG
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = self.path.partition('?s=')[2]
+        name = PAGE_QUERIES.get(query)
+        if name is None:
+            self.send_error(404)
+            return
+
+        server = self.server
+        time.sleep(max(server.latency + server.random.uniform(-server.jitter, server.jitter), 0.0))
+        if server.random.random() < server.failure_rate:
+            server.failures += 1
+            if server.random.random() < 0.5:
+                self.send_error(500)
+            else:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        body = self.server.pages[name].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_isg(pages, latency=0.0, jitter=0.0, failure_rate=0.0, seed=1):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeIsgHandler)
+    server.daemon_threads = True
+    server.pages = pages
+    server.latency = latency
+    server.jitter = jitter
+    server.failure_rate = failure_rate
+    server.failures = 0
+    server.random = random.Random(seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def page_urls(server):
+    host, port = server.server_address
+    return [f'http://{host}:{port}/?s={query}' for query in PAGE_QUERIES]
+
+
+def legacy_extract_sample(soups):
+    # Alter Pfad: jede Feldabfrage durchsucht den kompletten Baum erneut
+    lookup = scraper.lookup
+    scraper.lookup = scraper.extract_data
+    try:
+        pages = [scraper.Page(soup, scraper.extract_timestamp(soup)) for soup in soups]
+        return scraper.extract_sample(*pages)
+    finally:
+        scraper.lookup = lookup
+
+
+def measure(fn, cycles):
+    start = time.process_time()
+    for _ in range(cycles):
+        fn()
+    return (time.process_time() - start) / cycles
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+# Randfälle für verify_edge_cases: Kopf als Teil eines späteren Kopfs, Entitäten, leere Zellen,
+# Markup und Kommentare in Zellen, Tabellen ohne Klasse "info" oder ohne Kopf
+EDGE_PAGE = """<html><head><script>var x = 1;</script>
+<script>var timestampunterschied = 1700000000 * 1000;</script></head><body>
+<table class="info"><tr><th>WP HEIZUNG</th></tr>
+<tr><td>ISTWERT</td><td>1,5&nbsp;&deg;C</td></tr></table>
+<table class="info"><tr><th colspan="2">HEIZUNG</th></tr>
+<tr><td>ISTWERT</td><td>2,5&#176;C</td></tr>
+<tr><td>SOLLWERT</td><td>20 &amp; 21</td></tr>
+<tr><td>LEER</td><td></td></tr>
+<tr><td>MARKUP</td><td><span>3</span> kWh</td></tr>
+<tr><td>KOMMENTAR</td><td>4<!-- alt --></td></tr>
+<tr><td>BILD</td><td><img src="x.png"></td></tr>
+<tr><td>ENDE</td></tr></table>
+<table><tr><th>OHNE KLASSE</th></tr><tr><td>X</td><td>1</td></tr></table>
+<table class="info"><tr><td>OHNE KOPF</td><td>1</td></tr></table>
+<table class="info"><tr><th>HEIZUNG</th></tr><tr><td>SPÄTER</td><td>5</td></tr></table>
+</body></html>"""
+EDGE_LOOKUPS = {
+    ('HEIZUNG', 'ISTWERT'): '1,5\xa0°C',  # erster Kopf, der "HEIZUNG" enthält
+    ('WP HEIZUNG', 'ISTWERT'): '1,5\xa0°C',
+    ('HEIZUNG', 'SOLLWERT'): '20 & 21',
+    ('HEIZUNG', 'LEER'): None,
+    ('HEIZUNG', 'MARKUP'): None,
+    ('HEIZUNG', 'KOMMENTAR'): None,
+    ('HEIZUNG', 'BILD'): None,
+    ('HEIZUNG', 'ENDE'): None,
+    ('HEIZUNG', 'SPÄTER'): '5',
+    ('OHNE KLASSE', 'X'): None,
+    ('WARMWASSER', 'ISTWERT'): None,  # fehlende Tabelle
+}
+
+
+def verify_edge_cases():
+    # Beide Backends, auch in kleinen Stücken, die Tags und Entitäten zerteilen, gegen bs4, den alten
+    # Pfad (extract_data) und feste Erwartungswerte
+    soup = BeautifulSoup(EDGE_PAGE, 'html.parser')
+    reference = scraper.soup_page([EDGE_PAGE])
+    if reference.timestamp != datetime.fromtimestamp(1700000000):
+        raise SystemExit(f'Zeitstempel {reference.timestamp} statt 1700000000')
+    for (header, label), expected in EDGE_LOOKUPS.items():
+        value = scraper.lookup(reference.tables, header, label)
+        if value != expected:
+            raise SystemExit(f'{header}/{label}: {value!r} statt {expected!r}')
+        # extract_data scheitert an einer Beschriftung ohne Wertzelle
+        if label != 'ENDE' and scraper.extract_data(soup, header, label) != expected:
+            raise SystemExit(f'{header}/{label} weicht vom alten Pfad ab')
+
+    for backend, extract_page in scraper.EXTRACT_BACKENDS.items():
+        for size in (None, 1, 2, 3, 5, 7, 64):
+            result = extract_page([EDGE_PAGE] if size is None else chunked(EDGE_PAGE, size))
+            if result != reference:
+                raise SystemExit(f'Backend {backend} (chunk size {size}) weicht bei Randfällen von bs4 ab')
+        # Seite ohne Info-Tabellen, z.B. eine Fehlerseite des ISG
+        for html in ('', '<html><body><p>Fehler</p></body></html>'):
+            page = extract_page(chunked(html, 3))
+            if page.tables or page.timestamp is not None:
+                raise SystemExit(f'Backend {backend} findet Tabellen in einer leeren Seite')
+            if any(scraper.extract_sample(page, page, page)[1]):
+                raise SystemExit(f'Backend {backend} liefert Werte aus einer leeren Seite')
+
+
+def verify_backends(pages):
+    verify_edge_cases()
+    reference = [scraper.soup_page([pages[name]]) for name in PAGES]
+    legacy = legacy_extract_sample([BeautifulSoup(pages[name], 'html.parser') for name in PAGES])
+    if legacy != scraper.extract_sample(*reference):
+        raise SystemExit('Extraktion weicht vom alten Pfad ab')
+
+    for backend, extract_page in scraper.EXTRACT_BACKENDS.items():
+        for size in (None, 4096, 7, 1):
+            result = [extract_page([pages[name]] if size is None else chunked(pages[name], size))
+                      for name in PAGES]
+            if result != reference:
+                raise SystemExit(f'Backend {backend} (chunk size {size}) weicht von bs4 ab')
+
+
+def bench_extract(pages, cycles):
+    verify_backends(pages)
+
+    def legacy():
+        legacy_extract_sample([BeautifulSoup(pages[name], 'html.parser') for name in PAGES])
+
+    stages = [('bs4 + extract_data', legacy)]
+    for backend, extract_page in scraper.EXTRACT_BACKENDS.items():
+        stages.append((f'{backend} + index',
+                       lambda extract_page=extract_page: scraper.extract_sample(
+                           *[extract_page(chunked(pages[name], 4096)) for name in PAGES])))
+
+    print(f"{'parse + extract':<24}{'CPU ms/cycle':>14}{'peak KiB':>10}")
+    baseline = None
+    for name, fn in stages:
+        cpu = measure(fn, cycles)
+        baseline = baseline or cpu
+        print(f"{name:<24}{cpu * 1000:>14.3f}{peak_memory(fn) / 1024:>10.0f}  ({baseline / cpu:.1f}x)")
+
+
+def bench_fetch(pages, cycles, latency):
+    server = start_fake_isg(pages, latency)
+    urls = page_urls(server)
+    session = scraper.create_session()
+    cache = {}
+    scraper.POLL_INTERVALS = {'1,8': 60}
+
+    modes = [
+        ('serial (requests.get)', lambda: [scraper.timed_parse(url) for url in urls]),
+        ('serial (session)', lambda: [scraper.timed_parse(url, session) for url in urls]),
+        ('concurrent (session)',
+         lambda: [f.result() for f in [scraper.fetch_executor.submit(scraper.timed_parse, url, session)
+                                       for url in urls]]),
+        ('serial (tiers + hash)', lambda: [scraper.timed_parse(url, session, None, cache) for url in urls]),
+    ]
+
+    print(f"\nfetch, {latency * 1000:.0f} ms simulated ISG latency")
+    print(f"{'mode':<24}{'cycle ms':>10}" + ''.join(f"{'?s=' + q + ' ms':>12}" for q in PAGE_QUERIES))
+    for name, fn in modes:
+        fn()  # Verbindungen aufwärmen
+        cycle_total = 0.0
+        page_totals = [0.0] * len(urls)
+        for _ in range(cycles):
+            start = time.perf_counter()
+            results = fn()
+            cycle_total += time.perf_counter() - start
+            for i, (_, elapsed, _) in enumerate(results):
+                page_totals[i] += elapsed
+        print(f"{name:<24}{cycle_total / cycles * 1000:>10.1f}"
+              + ''.join(f"{total / cycles * 1000:>12.1f}" for total in page_totals))
+
+    server.shutdown()
+    print(', '.join(f"{key}={value}" for key, value in scraper.page_stats.items()))
+
+
+class CountingWriter:
+    # Ersetzt den BatchWriter, damit nur Abruf und Extraktion gemessen werden
+    def __init__(self):
+        self.rows = 0
+
+    def put(self, target, row):
+        self.rows += 1
+        return True
+
+
+def bench_devices(pages, counts, interval, duration, latency, workers):
+    # Viele simulierte ISGs hinter einem Server; jedes Gerät hat eigene Session und eigenen Zeitplan
+    server = start_fake_isg(pages, latency)
+    host = '%s:%d' % server.server_address
+    scraper.POLL_INTERVALS = {'1,8': 60}
+    scraper.RECORD_MODE = 'full'
+
+    print(f"\ndevices, {interval:g} s interval, {latency * 1000:.0f} ms simulated ISG latency, "
+          f"{duration:g} s per run")
+    print(f"{'devices':>8}{'workers':>9}{'target/s':>10}{'rows/s':>9}{'missed':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for count in counts:
+        pool_size = min(count, workers)
+        scraper.writer = CountingWriter()
+        scraper.fetch_executor = ThreadPoolExecutor(3 * pool_size)
+        executor = ThreadPoolExecutor(pool_size)
+        scheduler = DeadlineScheduler(executor=executor)
+        devices = [Device(f'wp{i}', host) for i in range(count)]
+        for i, device in enumerate(devices):
+            device.session = scraper.create_session()
+            device.job = scheduler.add(partial(scraper.scrape_and_store, device), interval,
+                                       name=device.id, delay=i * interval / count)
+
+        timer = threading.Timer(duration, scheduler.stop)
+        timer.start()
+        scheduler.run()
+        executor.shutdown()
+        scraper.fetch_executor.shutdown()
+
+        stats = [device.stats() for device in devices]
+        missed = sum(device.job.missed for device in devices)
+        p95 = sorted(s['latency_p95_seconds'] for s in stats)
+        p50 = sorted(s['latency_p50_seconds'] for s in stats)
+        print(f"{count:>8}{pool_size:>9}{count / interval:>10.1f}{scraper.writer.rows / duration:>9.1f}"
+              f"{missed:>8}{p50[len(p50) // 2] * 1000:>9.1f}{p95[-1] * 1000:>9.1f}"
+              f"{max(s['latency_max_seconds'] for s in stats) * 1000:>9.1f}")
+
+    server.shutdown()
+
+
+class ThrowawayPostgres:
+    # Lokale Wegwerf-Instanz über initdb/pg_ctl, nur per Unix-Socket erreichbar und ohne fsync.
+    # Ohne PostgreSQL-Binaries liefert start() False und der Lauf misst ohne Datenbank.
+
+    def __init__(self):
+        self.directory = None
+        self.bindir = None
+
+    def start(self):
+        self.bindir = self._find_bindir()
+        if self.bindir is None:
+            return False
+        self.directory = tempfile.mkdtemp(prefix='isg-bench-pg-')
+        data = os.path.join(self.directory, 'data')
+        self._run('initdb', '-D', data, '-U', 'bench', '--auth=trust', '-E', 'UTF8', '--no-locale')
+        self._run('pg_ctl', '-D', data, '-l', os.path.join(self.directory, 'log'), '-w', 'start',
+                  '-o', f"-k {self.directory} -c listen_addresses='' -c fsync=off "
+                        f"-c synchronous_commit=off -c full_page_writes=off")
+        return True
+
+    def stop(self):
+        if self.directory is None:
+            return
+        self._run('pg_ctl', '-D', os.path.join(self.directory, 'data'), '-m', 'fast', '-w', 'stop')
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+
+    def configure(self):
+        # Verbindungsdaten für scraper.connect()
+        scraper.DB_HOST = self.directory
+        scraper.DB_PORT = '5432'
+        scraper.DB_NAME = 'postgres'
+        scraper.DB_USER = 'bench'
+        scraper.DB_PASSWORD = None
+
+    def _run(self, tool, *args):
+        subprocess.run([os.path.join(self.bindir, tool), *args], check=True, capture_output=True)
+
+    @staticmethod
+    def _find_bindir():
+        if shutil.which('initdb'):
+            return os.path.dirname(shutil.which('initdb'))
+        try:
+            bindir = subprocess.run(['pg_config', '--bindir'], check=True, capture_output=True,
+                                    text=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return bindir if os.path.exists(os.path.join(bindir, 'initdb')) else None
+
+
+def bench_cycles(pages, cycles, latency, jitter, failure_rate, use_database):
+    # Ganze Zyklen wie im Betrieb: Abruf, Extraktion, Übergabe an den Writer und (mit
+    # Datenbank) das Schreiben; Zyklen laufen direkt hintereinander
+    server = start_fake_isg(pages, latency, jitter, failure_rate)
+    scraper.POLL_INTERVALS = {'1,8': 60}
+    scraper.RECORD_MODE = 'full'
+    scraper.stage_timer = StageTimer(window=cycles)
+    device = Device('bench', '%s:%d' % server.server_address)
+    device.session = scraper.create_session()
+
+    postgres = ThrowawayPostgres()
+    database = use_database and postgres.start()
+    if use_database and not database:
+        print("\nPostgreSQL binaries (initdb, pg_ctl) not found, measuring without database.")
+    try:
+        if database:
+            postgres.configure()
+            scraper.conn = scraper.connect()
+            scraper.conn.autocommit = True
+            scraper.create_schema()
+            scraper.writer = BatchWriter(scraper.connect, timer=scraper.stage_timer)
+            scraper.writer.register('data', scraper.DATA_EXECUTE, prepare=scraper.DATA_PREPARE)
+            scraper.writer.start()
+        else:
+            scraper.writer = CountingWriter()
+
+        scraper.scrape_and_store(device)  # Verbindungen aufwärmen
+        samples, failures, partial = device.samples, device.failures, device.partial
+        injected = server.failures
+        start = time.perf_counter()
+        for _ in range(cycles):
+            scraper.scrape_and_store(device)
+        elapsed = time.perf_counter() - start
+        samples, failures = device.samples - samples, device.failures - failures
+        partial = device.partial - partial
+        injected = server.failures - injected
+        if database:
+            scraper.writer.close()
+
+        # Speicher getrennt messen, tracemalloc bremst jeden Zyklus deutlich
+        memory_cycles = min(cycles, 50)
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for _ in range(memory_cycles):
+            tracemalloc.reset_peak()
+            scraper.scrape_and_store(device)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+    finally:
+        if database:
+            scraper.conn.close()
+        postgres.stop()
+        server.shutdown()
+
+    print(f"\ncycles, {latency * 1000:.0f}±{jitter * 1000:.0f} ms ISG latency, "
+          f"{failure_rate:.0%} injected failures, {'PostgreSQL' if database else 'no database'}")
+    print(f"{cycles / elapsed:.1f} cycles/s, {samples} samples ({partial} partial), "
+          f"{failures} failed cycles, {injected} injected failures")
+    print(f"memory per cycle: peak {peak / 1024:.0f} KiB, retained {retained / memory_cycles / 1024:.1f} KiB")
+    stats = scraper.stage_timer.stats()
+    print(f"{'stage':<12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for stage in sorted({key.rsplit('_', 2)[0] for key in stats}):
+        print(f"{stage:<12}" + ''.join(f"{stats[f'{stage}_{p}_ms']:>9.2f}" for p in ('p50', 'p95', 'p99')))
+
+
+def bench_history(pages, seconds):
+    # SampleRing für seconds Sekunden mit 1 Hz: Speicher, Anhängen und Fensterabfragen
+    page_list = [scraper.stream_page([pages[name]]) for name in PAGES]
+    timestamp, values = scraper.extract_sample(*page_list)
+    values = scraper.numeric_values(values)
+    tracemalloc.start()
+    ring = SampleRing(scraper.VALUE_COLUMNS, seconds)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(seconds):
+        ring.append(timestamp + timedelta(seconds=i), values)
+    append = (time.perf_counter() - start) / seconds
+
+    print(f"\nhistory, {len(scraper.VALUE_COLUMNS)} columns x {seconds} samples "
+          f"({'numpy' if ringbuffer.numpy is not None else 'pure Python'})")
+    print(f"memory {allocated / 1e6:.1f} MB (expected {ring.nbytes / 1e6:.1f} MB), "
+          f"append {append * 1e6:.1f} us")
+    for window in (60, 3600, seconds):
+        query = measure(lambda window=window: ring.summary('aussentemp', window), 20)
+        print(f"summary over {window:>6} s: {query * 1000:8.3f} ms")
+
+
+def bench_cold(pages, seconds, use_database):
+    # Ein Tag mit 1 Hz in der kalten Stufe: Schreiben, Dateigröße, Lesen ganzer Tag und einer Stunde.
+    # Die Messwerte wandern alle 10 s um ±0,1 wie langsam veränderliche Temperaturen.
+    page_list = [scraper.stream_page([pages[name]]) for name in PAGES]
+    timestamp, values = scraper.extract_sample(*page_list)
+    values = list(scraper.numeric_values(values))
+    types = {column: 'real' if column in scraper.NUMBER_COLUMNS else 'text'
+             for column in scraper.DATA_COLUMNS}
+    types.update(timestamp='timestamp without time zone', device_id='text')
+    rng = random.Random(1)
+    rows = []
+    for i in range(seconds):
+        if i % 10 == 0:
+            values = [round(value + rng.choice((-0.1, 0.0, 0.1)), 1) if isinstance(value, float) else value
+                      for value in values]
+        rows.append((timestamp + timedelta(seconds=i), scraper.DEFAULT_DEVICE, None, *values))
+
+    directory = tempfile.mkdtemp(prefix='cold-')
+    try:
+        store = ColdStore(directory)
+        start = time.perf_counter()
+        writer = store.writer(timestamp.strftime('%Y-%m-%d'), scraper.DATA_COLUMNS, types)
+        for row in rows:
+            writer.append(row)
+        cold_file = store.open(writer.close())
+        write = time.perf_counter() - start
+        size = os.path.getsize(cold_file.path)
+        start = time.perf_counter()
+        assert list(cold_file.read()) == rows
+        read = time.perf_counter() - start
+        hour = timestamp + timedelta(seconds=seconds // 2)
+        window = (hour, hour + timedelta(hours=1))
+        query = measure(lambda: list(cold_file.read(['timestamp', 'aussentemp'], *window)), 20)
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"\ncold storage, {len(scraper.DATA_COLUMNS)} columns x {len(rows)} rows")
+    print(f"file {size / 1e6:.2f} MB ({size / len(rows):.1f} bytes/row), write {write:.2f} s, "
+          f"read all {read:.2f} s, 1 h of one column {query * 1000:.1f} ms")
+    if use_database:
+        bench_tiers(rows[:3600], types)
+
+
+def bench_tiers(rows, types):
+    # Rundlauf über beide Stufen: zwei Tage in data, tier verschiebt den ersten, read_range muss
+    # wieder genau beide Tage liefern
+    rows = rows + [(row[0] + timedelta(days=1), *row[1:]) for row in rows]
+    postgres = ThrowawayPostgres()
+    if not postgres.start():
+        print("PostgreSQL binaries (initdb, pg_ctl) not found, skipping the read_range round trip.")
+        return
+    directory = tempfile.mkdtemp(prefix='cold-')
+    try:
+        postgres.configure()
+        scraper.conn = scraper.connect()
+        scraper.conn.autocommit = True
+        scraper.create_schema('REAL')
+        with scraper.conn.cursor() as cur:
+            execute_values(cur, scraper.DATA_INSERT, rows, page_size=1000)
+        store = ColdStore(directory)
+        moved = tier_data(scraper.conn, store, scraper.DATA_COLUMNS, types, 0, today=rows[-1][0].date())
+        start = time.perf_counter()
+        end = rows[-1][0] + timedelta(days=1)
+        read = list(read_range(scraper.conn, store, scraper.DATA_COLUMNS, rows[0][0], end))
+        elapsed = time.perf_counter() - start
+        store.close()
+        assert moved == len(rows) // 2, moved
+        assert read == rows, "read_range differs from the rows written"
+        print(f"read_range over cold + hot day: {len(read)} rows in {elapsed:.2f} s, identical to input")
+    finally:
+        scraper.conn.close()
+        postgres.stop()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline-Benchmark mit aufgezeichneten ISG-Seiten')
+    parser.add_argument('--cycles', type=int, default=200)
+    parser.add_argument('--fetch-cycles', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulierte ISG-Latenz in Sekunden')
+    parser.add_argument('--devices', default='1,4,16,64', help='Anzahl simulierter Geräte je Lauf')
+    parser.add_argument('--device-interval', type=float, default=1.0)
+    parser.add_argument('--device-duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--jitter', type=float, default=0.01, help='Streuung der ISG-Latenz in Sekunden')
+    parser.add_argument('--failure-rate', type=float, default=0.02, help='Anteil fehlerhafter Antworten')
+    parser.add_argument('--no-database', action='store_true',
+                        help='keine Wegwerf-PostgreSQL-Instanz starten, nur bis zum Writer messen')
+    parser.add_argument('--history-seconds', type=int, default=86400)
+    parser.add_argument('--cold-seconds', type=int, default=86400)
+    parser.add_argument('--only', choices=['extract', 'fetch', 'devices', 'cycles', 'history', 'cold'],
+                        help='nur einen Teil ausführen')
+    args = parser.parse_args()
+
+    pages = load_pages()
+    if args.only in (None, 'extract'):
+        bench_extract(pages, args.cycles)
+    if args.only in (None, 'fetch'):
+        bench_fetch(pages, args.fetch_cycles, args.latency)
+    if args.only in (None, 'cycles'):
+        bench_cycles(pages, args.cycles, args.latency, args.jitter, args.failure_rate, not args.no_database)
+    if args.only in (None, 'history'):
+        bench_history(pages, args.history_seconds)
+    if args.only in (None, 'cold'):
+        bench_cold(pages, args.cold_seconds, not args.no_database)
+    if args.only in (None, 'devices'):
+        bench_devices(pages, [int(count) for count in args.devices.split(',')], args.device_interval,
+                      args.device_duration, args.latency, args.workers)
@@ -0,0 +1,56 @@
+import time
+
+
+class CircuitBreaker:
+    # Nach threshold Zyklen in Folge ohne eine einzige geladene Seite wird das Gerät für cooldown
+    # Sekunden nicht mehr abgefragt (open). Danach folgt ein Probeabruf (half-open): Erfolg schließt
+    # den Schalter wieder, ein weiterer Fehlschlag verdoppelt die Pause bis höchstens max_cooldown.
+
+    def __init__(self, name='device', threshold=3, cooldown=30.0, max_cooldown=600.0, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self.skipped = 0
+        self._cooldown = cooldown
+        self._until = 0.0
+
+    def allow(self):
+        if self.state == 'open':
+            if self.clock() < self._until:
+                self.skipped += 1
+                return False
+            self.state = 'half-open'
+        return True
+
+    def success(self):
+        if self.state != 'closed':
+            print(f"{self.name}: reachable again, circuit closed.")
+        self.state = 'closed'
+        self.failures = 0
+        self._cooldown = self.base_cooldown
+
+    def failure(self):
+        self.failures += 1
+        if self.state == 'half-open':
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+        elif self.failures < self.threshold:
+            return
+        self.state = 'open'
+        self.opened += 1
+        self._until = self.clock() + self._cooldown
+        print(f"{self.name}: unreachable after {self.failures} failed cycles, "
+              f"pausing for {self._cooldown:.0f}s.")
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'open': self.state == 'open',
+            'consecutive_failures': self.failures,
+            'opened': self.opened,
+            'skipped_cycles': self.skipped,
+        }
@@ -0,0 +1,111 @@
+from devices import DEFAULT_DEVICE
+from values import to_number
+
+# Schmale Änderungstabelle statt einer breiten Zeile pro Sekunde. data_at(ts, gerät)
+# setzt daraus die vollständige data-Zeile zu einem Zeitpunkt zusammen,
+# data_series(von, bis, schritt, gerät) eine Zeitreihe solcher Zeilen.
+CHANGES_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS data_changes (
+    timestamp TIMESTAMP NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT
+    );
+
+    ALTER TABLE data_changes ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT '{DEFAULT_DEVICE}';
+
+    DROP INDEX IF EXISTS idx_data_changes_field_timestamp;
+    CREATE INDEX IF NOT EXISTS idx_data_changes_device_field_timestamp
+        ON data_changes (device_id, field, timestamp DESC);
+
+    -- Vorgängerversionen ohne Gerät, sonst wären Aufrufe mit einem Argument mehrdeutig
+    DROP FUNCTION IF EXISTS data_series(TIMESTAMP, TIMESTAMP, INTERVAL);
+    DROP FUNCTION IF EXISTS data_at(TIMESTAMP);
+
+    CREATE OR REPLACE FUNCTION data_at(ts TIMESTAMP, device TEXT DEFAULT '{DEFAULT_DEVICE}')
+    RETURNS data AS $$
+        -- Ein Indexzugriff je Spalte von data statt eines Scans über die ganze Historie
+        SELECT jsonb_populate_record(NULL::data,
+                                     COALESCE(jsonb_object_agg(a.attname, latest.value), '{{}}'::jsonb)
+                                     || jsonb_build_object('timestamp', ts, 'device_id', device))
+        FROM pg_attribute AS a
+        CROSS JOIN LATERAL (
+            SELECT value
+            FROM data_changes
+            WHERE device_id = device AND field = a.attname AND timestamp <= ts
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) AS latest
+        WHERE a.attrelid = 'data'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+    $$ LANGUAGE sql STABLE;
+
+    CREATE OR REPLACE FUNCTION data_series(start_ts TIMESTAMP, end_ts TIMESTAMP, step INTERVAL,
+                                           device TEXT DEFAULT '{DEFAULT_DEVICE}')
+    RETURNS SETOF data AS $$
+        SELECT d.*
+        FROM generate_series(start_ts, end_ts, step) AS t(ts),
+             LATERAL data_at(t.ts, device) AS d
+    $$ LANGUAGE sql STABLE;
+'''
+
+CHANGES_INSERT = 'INSERT INTO data_changes (timestamp, device_id, field, value) VALUES %s'
+
+
+def parse_deadbands(spec):
+    # "aussentemperatur=0.2,vorlauftemperatur=0.1"
+    deadbands = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        field, _, value = item.partition('=')
+        deadbands[field.strip()] = float(value)
+    return deadbands
+
+
+class ChangeRecorder:
+    # Meldet pro Feld nur Werte, die sich seit dem zuletzt gespeicherten Wert um
+    # mindestens das Totband geändert haben. Nach spätestens heartbeat Sekunden
+    # wird ein Feld auch ohne Änderung erneut gespeichert.
+
+    def __init__(self, columns, deadbands=None, default_deadband=0.0, heartbeat=900):
+        self.columns = columns
+        self.deadbands = deadbands or {}
+        self.default_deadband = default_deadband
+        self.heartbeat = heartbeat
+        self.samples = 0
+        self.values_seen = 0
+        self.values_recorded = 0
+        self._last = {}
+
+    def changes(self, timestamp, row, skip=()):
+        # row: Werte in der Reihenfolge von columns, ohne timestamp; skip: nicht gelesene Spalten
+        changes = []
+        for column, value in zip(self.columns, row):
+            if column in skip:
+                continue
+            last = self._last.get(column)
+            if last is None or self._changed(column, last[0], value) \
+                    or (timestamp - last[1]).total_seconds() >= self.heartbeat:
+                self._last[column] = (value, timestamp)
+                changes.append((timestamp, column, None if value is None else str(value)))
+
+        self.samples += 1
+        self.values_seen += len(self.columns)
+        self.values_recorded += len(changes)
+        return changes
+
+    def _changed(self, column, old, new):
+        if old is None or new is None:
+            return old is not new
+        old_number = old if isinstance(old, float) else to_number(old)
+        new_number = new if isinstance(new, float) else to_number(new)
+        if old_number is None or new_number is None:
+            return old != new
+        deadband = self.deadbands.get(column, self.default_deadband)
+        if deadband <= 0:
+            return old_number != new_number
+        return abs(new_number - old_number) >= deadband
+
+    def stats(self):
+        return {
+            'samples': self.samples,
+            'values_recorded': self.values_recorded,
+            'recorded_ratio': self.values_recorded / self.values_seen if self.values_seen else 0.0,
+        }
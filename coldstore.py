@@ -0,0 +1,356 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+MAGIC = b'ISGCOLD1'
+_FOOTER = struct.Struct('<I8s')  # Länge des JSON-Verzeichnisses, MAGIC
+FILE_RE = re.compile(r'^data-(\d{4}-\d{2}-\d{2})\.(\d+)\.col$')
+EPOCH = datetime(1970, 1, 1)
+NUMBER_TYPES = ('real', 'double precision', 'numeric', 'smallint', 'integer', 'bigint')
+# Zeilen je Block; eine Abfrage entpackt nur die Blöcke ihres Zeitraums
+BLOCK_ROWS = 4096
+# Dezimalstellen, mit denen Zahlen noch als skalierte Ganzzahlen gespeichert werden (ISG: meist 1)
+SCALES = (1, 10, 100, 1000)
+KEY = ('timestamp', 'device_id')
+
+
+def micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def shuffle(data, width):
+    # Bytes gleicher Wertigkeit hintereinander, zlib findet dann die Wiederholungen in Exponent/Vorzeichen
+    return b''.join(data[i::width] for i in range(width))
+
+
+def unshuffle(data, width):
+    count = len(data) // width
+    out = bytearray(len(data))
+    for i in range(width):
+        out[i::width] = data[i * count:(i + 1) * count]
+    return out
+
+
+def encode_column(values, data_type, compression):
+    # -> (Kodierung, Parameter, zlib-Daten); vor den Werten steht bei NULLs eine Maske (1 Byte je Zeile)
+    masked = None in values
+    mask = bytes(value is None for value in values) if masked else b''
+    if data_type.startswith('timestamp'):
+        points = [micros(value) for value in values]
+        data = array('q', [points[0]] + [b - a for a, b in zip(points, points[1:])]).tobytes()
+        return 'time', None, zlib.compress(data, compression)
+    if data_type in NUMBER_TYPES:
+        numbers = [0.0 if value is None else float(value) for value in values]
+        # Geprüft werden nur die verschiedenen Werte; NaN und Unendlich lassen sich nicht skalieren
+        distinct = set(numbers)
+        for scale in SCALES if all(map(math.isfinite, distinct)) else ():
+            scaled = {value: round(value * scale) for value in distinct}
+            if all(abs(n) < 2 ** 53 and n / scale == value for value, n in scaled.items()):
+                # Skalierte Ganzzahlen als Differenzen: langsam veränderliche Messwerte werden fast 0
+                points = [scaled[value] for value in numbers]
+                data = array('q', [points[0]] + [b - a for a, b in zip(points, points[1:])]).tobytes()
+                return 'delta', scale, zlib.compress(mask + data, compression)
+        data = shuffle(array('d', numbers).tobytes(), 8)
+        return 'float', None, zlib.compress(mask + data, compression)
+    # Text (auch Gerät, fehlende Seiten) als Wörterbuch je Block, Index 0 = NULL
+    dictionary = {}
+    indexes = array('I', [0 if value is None else dictionary.setdefault(str(value), len(dictionary) + 1)
+                          for value in values])
+    return 'dict', list(dictionary), zlib.compress(shuffle(indexes.tobytes(), indexes.itemsize), compression)
+
+
+def decode_column(encoding, param, data, rows):
+    data = zlib.decompress(data)
+    if encoding == 'time':
+        return list(accumulate(array('q', data)))
+    if encoding == 'dict':
+        indexes = array('I', unshuffle(data, 4))
+        lookup = [None] + param
+        return [lookup[i] for i in indexes]
+    mask = data[:rows] if len(data) > rows * 8 else None
+    body = data[rows:] if mask is not None else data
+    if encoding == 'delta':
+        values = [value / param for value in accumulate(array('q', body))] if param != 1 \
+            else [float(value) for value in accumulate(array('q', body))]
+    else:
+        values = array('d', unshuffle(body, 8)).tolist()
+    if mask is not None:
+        values = [None if null else value for value, null in zip(values, mask)]
+    return values
+
+
+class ColdWriter:
+    # Schreibt Zeilen (nach timestamp, device_id sortiert) blockweise spaltenorientiert; die Datei wird
+    # erst durch close() unter ihrem Namen sichtbar und ist dann bereits auf der Platte (fsync).
+
+    def __init__(self, path, columns, types, compression=6):
+        if list(columns[:2]) != list(KEY):
+            raise ValueError("columns must start with timestamp, device_id")
+        self.path = path
+        self.columns = list(columns)
+        self.types = [types[column] for column in columns]
+        self.compression = compression
+        self.rows = 0
+        self._pending = []
+        self._blocks = []
+        self._file = open(path + '.tmp', 'wb')
+
+    def append(self, row):
+        self._pending.append(row)
+        self.rows += 1
+        if len(self._pending) >= BLOCK_ROWS:
+            self._write_block()
+
+    def close(self):
+        if self._pending:
+            self._write_block()
+        meta = json.dumps({'rows': self.rows, 'columns': list(zip(self.columns, self.types)),
+                           'blocks': self._blocks}, separators=(',', ':')).encode('utf-8')
+        self._file.write(meta + _FOOTER.pack(len(meta), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+        return self.path
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path + '.tmp')
+
+    def _write_block(self):
+        rows = self._pending
+        self._pending = []
+        entries = []
+        for i, data_type in enumerate(self.types):
+            encoding, param, data = encode_column([row[i] for row in rows], data_type, self.compression)
+            entries.append([self._file.tell(), len(data), encoding, param])
+            self._file.write(data)
+        self._blocks.append({'rows': len(rows), 'first': micros(rows[0][0]), 'last': micros(rows[-1][0]),
+                             'columns': entries})
+
+
+class ColdFile:
+    # Liest eine Datei über mmap: nur das Verzeichnis am Ende wird beim Öffnen gelesen, eine Abfrage
+    # entpackt die Zeitstempel der Blöcke im Zeitraum und danach nur die verlangten Spalten.
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        end = len(self._map) - _FOOTER.size
+        length, magic = _FOOTER.unpack_from(self._map, end)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a cold storage file")
+        meta = json.loads(self._map[end - length:end])
+        self.rows = meta['rows']
+        self.columns = [column for column, _ in meta['columns']]
+        self.types = dict(meta['columns'])
+        self.blocks = meta['blocks']
+        self._lasts = [block['last'] for block in self.blocks]
+
+    def close(self):
+        self._map.close()
+
+    def read(self, columns=None, start=None, end=None, device_id=None):
+        # Tupel in der Reihenfolge von columns für start <= timestamp < end, sortiert wie die Datei;
+        # Spalten, die es beim Schreiben noch nicht gab, sind None
+        columns = self.columns if columns is None else columns
+        indexes = [self.columns.index(column) if column in self.types else None for column in columns]
+        low = micros(start) if start is not None else None
+        high = micros(end) if end is not None else None
+        first = bisect_left(self._lasts, low) if low is not None else 0
+        for block in self.blocks[first:]:
+            if high is not None and block['first'] >= high:
+                break
+            times = self._column(block, 0)
+            a = bisect_left(times, low) if low is not None else 0
+            b = bisect_left(times, high) if high is not None else len(times)
+            if a >= b:
+                continue
+            decoded = {0: times}
+            values = []
+            for index in indexes:
+                if index is None:
+                    values.append([None] * (b - a))
+                    continue
+                if index not in decoded:
+                    decoded[index] = self._column(block, index)
+                part = decoded[index][a:b]
+                values.append([EPOCH + timedelta(microseconds=value) for value in part] if index == 0
+                              else part)
+            rows = zip(*values)
+            if device_id is not None:
+                devices = (decoded[1] if 1 in decoded else self._column(block, 1))[a:b]
+                rows = (row for row, device in zip(rows, devices) if device == device_id)
+            yield from rows
+
+    def _column(self, block, index):
+        offset, length, encoding, param = block['columns'][index]
+        return decode_column(encoding, param, self._map[offset:offset + length], block['rows'])
+
+
+class ColdStore:
+    # Tage außerhalb von data, je Tag eine oder mehrere Dateien data-JJJJ-MM-TT.N.col (N = Teil,
+    # ein späterer Lauf für denselben Tag legt einen weiteren Teil an statt umzuschreiben)
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._open = {}
+
+    def files(self, day=None):
+        # {Tag: [Pfade]}, mit day nur die Pfade dieses Tages
+        parts = {}
+        for name in os.listdir(self.directory):
+            match = FILE_RE.match(name)
+            if match:
+                parts.setdefault(match.group(1), []).append((int(match.group(2)), name))
+        files = {key: [os.path.join(self.directory, name) for _, name in sorted(names)]
+                 for key, names in sorted(parts.items())}
+        return files.get(day, []) if day is not None else files
+
+    def days(self):
+        return list(self.files())
+
+    def writer(self, day, columns, types, compression=6):
+        part = len(self.files(day))
+        return ColdWriter(os.path.join(self.directory, f'data-{day}.{part}.col'), columns, types, compression)
+
+    def open(self, path):
+        if path not in self._open:
+            self._open[path] = ColdFile(path)
+        return self._open[path]
+
+    def read(self, columns, start, end, device_id=None):
+        # Alle Teile der Tage im Zeitraum, je Tag nach timestamp, device_id zusammengeführt
+        for day in day_range(start, end):
+            sources = [self.open(path).read(columns, start, end, device_id) for path in self.files(day)]
+            yield from heapq.merge(*sources, key=lambda row: (row[0], row[1]))
+
+    def remove(self, path):
+        cold_file = self._open.pop(path, None)
+        if cold_file is not None:
+            cold_file.close()
+        os.remove(path)
+
+    def stats(self):
+        files = [path for paths in self.files().values() for path in paths]
+        return {'days': len(self.files()), 'files': len(files),
+                'bytes': sum(os.path.getsize(path) for path in files)}
+
+    def close(self):
+        for cold_file in self._open.values():
+            cold_file.close()
+        self._open = {}
+
+
+def day_range(start, end):
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def key_columns(columns):
+    # timestamp und device_id immer vorne, sie sortieren beide Stufen gleich
+    return list(KEY) + [column for column in columns if column not in KEY]
+
+
+def read_range(conn, store, columns, start, end, device_id=None, itersize=5000):
+    # Zeilen aus kalter und heißer Stufe (data) als ein Strom, sortiert nach timestamp, device_id;
+    # die Spalten sind key_columns(columns). Liegt ein Tag (noch) in beiden Stufen, werden beide gelesen.
+    columns = key_columns(columns)
+    device_filter = 'AND device_id = %(device)s' if device_id is not None else ''
+    with conn.cursor(name='read_range', withhold=True) as cur:
+        cur.itersize = itersize
+        cur.execute(f'''
+            SELECT {", ".join(f'"{column}"' for column in columns)} FROM data
+            WHERE timestamp >= %(start)s AND timestamp < %(end)s {device_filter}
+            ORDER BY timestamp, device_id
+        ''', {'start': start, 'end': end, 'device': device_id})
+        yield from heapq.merge(store.read(columns, start, end, device_id), cur,
+                               key=lambda row: (row[0], row[1]))
+
+
+def tier_day(conn, store, day, columns, types):
+    # Ein Tag in einer Transaktion (REPEATABLE READ): lesen, Datei schreiben und fsyncen, prüfen, aus
+    # data löschen. Gelöscht wird genau, was gelesen wurde; später eingefügte Zeilen bleiben in data.
+    start = datetime.strptime(day, '%Y-%m-%d')
+    end = start + timedelta(days=1)
+    bounds = {'start': start, 'end': end}
+    columns = key_columns(columns)
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    writer = None
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            with conn.cursor(name='tier') as reader:
+                reader.itersize = BLOCK_ROWS
+                reader.execute(f'''
+                    SELECT {", ".join(f'"{column}"' for column in columns)} FROM data
+                    WHERE timestamp >= %(start)s AND timestamp < %(end)s ORDER BY timestamp, device_id
+                ''', bounds)
+                writer = store.writer(day, columns, types)
+                for row in reader:
+                    writer.append(tuple(float(value) if isinstance(value, Decimal) else value
+                                        for value in row))
+            if not writer.rows:
+                writer.abort()
+                conn.rollback()
+                return 0
+            path = writer.close()
+            rows = store.open(path).rows
+            cur.execute('DELETE FROM data WHERE timestamp >= %(start)s AND timestamp < %(end)s', bounds)
+            if rows != writer.rows or cur.rowcount != rows:
+                raise RuntimeError(f"{day}: wrote {rows} of {writer.rows} rows, deleting {cur.rowcount}")
+        conn.commit()
+        return rows
+    except BaseException:
+        conn.rollback()
+        if writer is not None:
+            if os.path.exists(writer.path + '.tmp'):
+                writer.abort()
+            elif os.path.exists(writer.path):
+                # Zeilen sind noch in data, die Datei darf sie nicht verdoppeln
+                store.remove(writer.path)
+        raise
+    finally:
+        conn.autocommit = autocommit
+
+
+def tier_data(conn, store, columns, types, older_than_days, today=None):
+    # Alle Tage vor heute - older_than_days aus data in die kalte Stufe verschieben
+    cutoff = (today or datetime.now().date()) - timedelta(days=older_than_days)
+    with conn.cursor() as cur:
+        cur.execute('SELECT min(timestamp) FROM data WHERE timestamp < %s', (cutoff,))
+        first = cur.fetchone()[0]
+    if first is None:
+        print(f"No rows before {cutoff} in table data.")
+        return 0
+    start = time.perf_counter()
+    total = 0
+    for day in day_range(first, datetime.combine(cutoff, datetime.min.time())):
+        day_start = time.perf_counter()
+        rows = tier_day(conn, store, day, columns, types)
+        if rows:
+            size = os.path.getsize(store.files(day)[-1])
+            print(f"{day}: moved {rows} rows, {size / 1e6:.1f} MB in {time.perf_counter() - day_start:.1f}s")
+        total += rows
+    with conn.cursor() as cur:
+        # Gibt den Platz zur Wiederverwendung frei, data wird dadurch nicht kleiner
+        cur.execute('VACUUM ANALYZE data')
+    print(f"Moved {total} rows before {cutoff} to {store.directory} in {time.perf_counter() - start:.1f}s.")
+    return total
@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from rollups import counter_delta
+from values import to_number
+
+# Wasser: spezifische Wärmekapazität in kJ/(kg K), 1 l ≈ 1 kg
+SPECIFIC_HEAT = 4.186
+# Größere Lücken zwischen zwei Stichproben werden nicht integriert (z.B. nach einem Ausfall)
+MAX_GAP_SECONDS = 300
+
+# Tageszähler des ISG (kWh, Rücksetzung um Mitternacht), zum Abgleich mit den integrierten Werten
+HEAT_COUNTERS = ('waermemenge_vd_heizen_tag', 'waermemenge_vd_warmwasser_tag')
+ELECTRICAL_COUNTERS = ('leistungsaufnahme_vd_heizen_tag', 'leistungsaufnahme_vd_warmwasser_tag')
+
+DERIVED_COLUMNS = ['bucket', 'device_id', 'resolution', 'samples', 'seconds', 'thermal_energy_kwh',
+                   'electrical_energy_kwh', 'thermal_power_max_kw', 'heat_counter_kwh',
+                   'electrical_counter_kwh']
+
+# Ein Eintrag je Gerät, Auflösung (Sekunden) und Zeitraum. Leistungen und COP ergeben sich aus den
+# Energien, damit sich Teilergebnisse (z.B. nach einem Neustart) exakt zusammenführen lassen.
+DERIVED_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS derived (
+    bucket TIMESTAMP NOT NULL,
+    device_id TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    seconds DOUBLE PRECISION NOT NULL,
+    thermal_energy_kwh DOUBLE PRECISION NOT NULL,
+    electrical_energy_kwh DOUBLE PRECISION NOT NULL,
+    thermal_power_max_kw REAL,
+    heat_counter_kwh DOUBLE PRECISION NOT NULL,
+    electrical_counter_kwh DOUBLE PRECISION NOT NULL,
+    thermal_power_kw REAL GENERATED ALWAYS AS
+        (CASE WHEN seconds > 0 THEN thermal_energy_kwh * 3600 / seconds END) STORED,
+    electrical_power_kw REAL GENERATED ALWAYS AS
+        (CASE WHEN seconds > 0 THEN electrical_energy_kwh * 3600 / seconds END) STORED,
+    cop REAL GENERATED ALWAYS AS
+        (CASE WHEN electrical_energy_kwh > 0 THEN thermal_energy_kwh / electrical_energy_kwh END) STORED,
+    PRIMARY KEY (device_id, resolution, bucket)
+    );
+'''
+
+DERIVED_INSERT = f'''
+    INSERT INTO derived AS d ({", ".join(DERIVED_COLUMNS)}) VALUES %s
+    ON CONFLICT (device_id, resolution, bucket) DO UPDATE SET
+        samples = d.samples + EXCLUDED.samples,
+        seconds = d.seconds + EXCLUDED.seconds,
+        thermal_energy_kwh = d.thermal_energy_kwh + EXCLUDED.thermal_energy_kwh,
+        electrical_energy_kwh = d.electrical_energy_kwh + EXCLUDED.electrical_energy_kwh,
+        thermal_power_max_kw = GREATEST(d.thermal_power_max_kw, EXCLUDED.thermal_power_max_kw),
+        heat_counter_kwh = d.heat_counter_kwh + EXCLUDED.heat_counter_kwh,
+        electrical_counter_kwh = d.electrical_counter_kwh + EXCLUDED.electrical_counter_kwh
+'''
+
+
+def thermal_power(flow, supply, return_):
+    # kW aus Volumenstrom (l/min) und Spreizung (K)
+    return flow * (supply - return_) * SPECIFIC_HEAT / 60
+
+
+def bucket_start(timestamp, resolution):
+    # Zeiträume von resolution Sekunden ab Mitternacht
+    midnight = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = (timestamp - midnight).total_seconds()
+    return midnight + timedelta(seconds=offset - offset % resolution)
+
+
+def merge(a, b):
+    # Zwei Teilergebnisse desselben Eintrags (Zeilen im Format von DERIVED_COLUMNS)
+    peaks = [peak for peak in (a[7], b[7]) if peak is not None]
+    return (a[0], a[1], a[2], a[3] + b[3], a[4] + b[4], a[5] + b[5], a[6] + b[6],
+            max(peaks) if peaks else None, a[8] + b[8], a[9] + b[9])
+
+
+def combine_rows(rows):
+    # Wie rollups.combine_rows: ein Schlüssel darf in einem ON CONFLICT-Batch nur einmal vorkommen
+    combined = {}
+    for row in rows:
+        key = (row[0], row[1], row[2])
+        combined[key] = merge(combined[key], row) if key in combined else row
+    return list(combined.values())
+
+
+class DerivedMetrics:
+    # Berechnet je Stichprobe in konstanter Zeit Wärmeleistung, elektrische Leistung und COP und
+    # integriert beide Leistungen (Trapezregel) zu Energien je Zeitraum von resolution Sekunden.
+    # Daneben die Zunahme der ISG-Tageszähler im selben Zeitraum; sie lösen nur in ganzen kWh auf.
+
+    def __init__(self, device_id, columns, resolution=60):
+        if not 0 < resolution <= 86400:
+            raise ValueError("resolution must be between 1 and 86400 seconds")
+        self.device_id = device_id
+        self.resolution = resolution
+        self._flow = columns.index('wp_wasservolumenstrom')
+        self._supply = columns.index('vorlauftemperatur')
+        self._return = columns.index('ruecklauftemperatur')
+        self._electrical = columns.index('inverter_aufnahmeleistung')
+        self._heat_counters = [columns.index(column) for column in HEAT_COUNTERS]
+        self._electrical_counters = [columns.index(column) for column in ELECTRICAL_COUNTERS]
+        self.rows_emitted = 0
+        # Letzte Momentanwerte für stats() bzw. /metrics
+        self.thermal_power_kw = None
+        self.electrical_power_kw = None
+        self.cop = None
+        self._bucket = None
+        self._open = None
+        self._previous = None  # (timestamp, Wärmeleistung, elektrische Leistung)
+        self._counters = {}
+
+    def add(self, timestamp, row):
+        # row: Werte in der Reihenfolge von columns; liefert abgeschlossene Zeilen (DERIVED_COLUMNS)
+        bucket = bucket_start(timestamp, self.resolution)
+        closed = self.flush() if self._bucket is not None and bucket != self._bucket else []
+        self._bucket = bucket
+        if self._open is None:
+            self._open = [0, 0.0, 0.0, 0.0, None, 0.0, 0.0]
+
+        flow, supply, return_, electrical = (self._number(row[index]) for index in
+                                             (self._flow, self._supply, self._return, self._electrical))
+        thermal = None
+        if flow is not None and supply is not None and return_ is not None:
+            thermal = thermal_power(flow, supply, return_)
+        self.thermal_power_kw = thermal
+        self.electrical_power_kw = electrical
+        self.cop = thermal / electrical if thermal is not None and electrical else None
+
+        current = self._open
+        current[0] += 1
+        if thermal is not None and (current[4] is None or thermal > current[4]):
+            current[4] = thermal
+        valid = thermal is not None and electrical is not None
+        previous = self._previous
+        if previous is not None and valid:
+            seconds = (timestamp - previous[0]).total_seconds()
+            if 0 < seconds <= MAX_GAP_SECONDS:
+                current[1] += seconds
+                current[2] += (previous[1] + thermal) / 2 * seconds / 3600
+                current[3] += (previous[2] + electrical) / 2 * seconds / 3600
+        self._previous = (timestamp, thermal, electrical) if valid else None
+
+        current[5] += self._counter_delta(row, self._heat_counters)
+        current[6] += self._counter_delta(row, self._electrical_counters)
+        return closed
+
+    def flush(self):
+        # Laufenden Zeitraum abschließen, auch beim Beenden
+        if self._open is None:
+            return []
+        samples, seconds, thermal, electrical, peak, heat_counter, electrical_counter = self._open
+        self._open = None
+        self.rows_emitted += 1
+        return [(self._bucket, self.device_id, self.resolution, samples, seconds, thermal, electrical, peak,
+                 heat_counter, electrical_counter)]
+
+    def stats(self):
+        return {
+            'resolution_seconds': self.resolution,
+            'rows_emitted': self.rows_emitted,
+            'thermal_power_kw': self.thermal_power_kw,
+            'electrical_power_kw': self.electrical_power_kw,
+            'cop': self.cop,
+        }
+
+    def _counter_delta(self, row, indexes):
+        total = 0.0
+        for index in indexes:
+            value = self._number(row[index])
+            if value is None:
+                continue
+            total += counter_delta(self._counters.get(index), value)
+            self._counters[index] = value
+        return total
+
+    @staticmethod
+    def _number(value):
+        if value is None or isinstance(value, float):
+            return value
+        return to_number(value)
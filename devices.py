@@ -0,0 +1,83 @@
+import json
+from collections import deque
+
+from timing import percentile
+
+# Gerätekennung für Installationen mit nur einem ISG und für Zeilen aus der Zeit davor
+DEFAULT_DEVICE = 'default'
+
+
+class Device:
+    # Ein ISG mit eigenem Zeitplan, eigener HTTP-Session und eigenem Seiten-Cache.
+    # Ein Gerät wird nie von zwei Threads gleichzeitig abgefragt (siehe DeadlineScheduler).
+
+    def __init__(self, id, host, interval=None):
+        self.id = id
+        self.host = host
+        self.interval = interval
+        self.session = None
+        self.page_cache = {}
+        self.refresh_tracker = None
+        self.recorder = None
+        self.rollups = None
+        self.derived = None
+        self.events = None
+        self.breaker = None
+        self.history = None
+        self.job = None
+        self.samples = 0
+        self.failures = 0
+        self.partial = 0
+        # Letzter Stand (timestamp, Werte ohne Schlüsselspalten) und monotone Zeit des letzten Abrufs
+        self.latest = None
+        self.last_success = None
+        self._latencies = deque(maxlen=300)
+
+    def urls(self, queries):
+        return [f'http://{self.host}/?s={query}' for query in queries]
+
+    def record(self, latency):
+        self.samples += 1
+        self._latencies.append(latency)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            'samples': self.samples,
+            'failures': self.failures,
+            'partial_samples': self.partial,
+            'latency_p50_seconds': percentile(latencies, 0.5),
+            'latency_p95_seconds': percentile(latencies, 0.95),
+            'latency_max_seconds': latencies[-1] if latencies else 0.0,
+        }
+
+
+def parse_devices(spec):
+    # "wp1=192.168.1.118,wp2=192.168.1.119:8080"
+    devices = []
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        device_id, _, host = item.partition('=')
+        if not host:
+            raise ValueError(f"Expected id=host, got {item!r}")
+        devices.append(Device(device_id.strip(), host.strip()))
+    return devices
+
+
+def load_devices(path=None, spec=None, default_host=None, default_id=DEFAULT_DEVICE):
+    # Reihenfolge: JSON-Datei [{"id": ..., "host": ..., "interval": ...}], dann id=host-Liste,
+    # sonst ein einzelnes Gerät
+    if path:
+        with open(path, encoding='utf-8') as f:
+            devices = [Device(entry['id'], entry['host'], entry.get('interval')) for entry in json.load(f)]
+    elif spec:
+        devices = parse_devices(spec)
+    else:
+        devices = [Device(default_id, default_host)]
+
+    ids = [device.id for device in devices]
+    duplicates = sorted({device_id for device_id in ids if ids.count(device_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate device ids: {', '.join(duplicates)}")
+    if not devices:
+        raise ValueError("No devices configured")
+    return devices
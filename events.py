@@ -0,0 +1,244 @@
+import time
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from derived import MAX_GAP_SECONDS, thermal_power
+from values import to_number
+
+EVENT_KINDS = ('compressor', 'defrost', 'nhz')
+# Abtauen endet, sobald der Vorlauf wieder wärmer als der Rücklauf ist, spätestens nach dieser Zeit
+MAX_DEFROST_SECONDS = 1800
+# Der Nachheizer (NHZ) läuft, wenn er den Vorlauf der Wärmepumpe um mindestens so viel anhebt
+NHZ_DELTA_K = 1.5
+# Laufzeitzähler des NHZ; das ISG zählt nur ganze Stunden
+NHZ_COUNTERS = ('laufzeit_nhz_1', 'laufzeit_nhz_2', 'laufzeit_nhz_1_2')
+
+EVENT_FIELDS = ['istdrehzahl_verdichter', 'starts_verdichter', 'laufzeit_starts_abtauen', 'vorlauftemperatur',
+                'ruecklauftemperatur', 'vorlaufisttemp_wp', 'vorlaufisttemp_nhz', 'wp_wasservolumenstrom',
+                'inverter_aufnahmeleistung', *NHZ_COUNTERS]
+EVENT_COLUMNS = ['device_id', 'kind', 'start_ts', 'end_ts', 'samples', 'thermal_energy_kwh',
+                 'electrical_energy_kwh']
+
+EVENTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS events (
+    device_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start_ts TIMESTAMP NOT NULL,
+    end_ts TIMESTAMP NOT NULL,
+    samples INTEGER NOT NULL,
+    thermal_energy_kwh DOUBLE PRECISION,
+    electrical_energy_kwh DOUBLE PRECISION,
+    duration_seconds DOUBLE PRECISION GENERATED ALWAYS AS (EXTRACT(EPOCH FROM end_ts - start_ts)) STORED,
+    PRIMARY KEY (device_id, kind, start_ts)
+    );
+    CREATE INDEX IF NOT EXISTS idx_events_kind_start ON events (kind, start_ts);
+'''
+
+# Ein bereits geschriebenes Ereignis (z.B. aus rebuild-events) wird ersetzt
+EVENTS_INSERT = f'''
+    INSERT INTO events ({", ".join(EVENT_COLUMNS)}) VALUES %s
+    ON CONFLICT (device_id, kind, start_ts) DO UPDATE SET
+        end_ts = EXCLUDED.end_ts,
+        samples = EXCLUDED.samples,
+        thermal_energy_kwh = EXCLUDED.thermal_energy_kwh,
+        electrical_energy_kwh = EXCLUDED.electrical_energy_kwh
+'''
+
+
+class EventDetector:
+    # Zustandsautomat je Gerät, konstante Zeit je Stichprobe:
+    #   compressor  Verdichter dreht (istdrehzahl_verdichter > 0); steigt starts_verdichter während
+    #               eines Laufs, lag zwischen zwei Stichproben ein Stopp und es beginnt ein neuer Lauf
+    #   defrost     beginnt mit jeder Erhöhung von laufzeit_starts_abtauen, endet wenn der Vorlauf
+    #               nach der Umkehr wieder wärmer als der Rücklauf ist (siehe MAX_DEFROST_SECONDS)
+    #   nhz         vorlaufisttemp_nhz liegt mindestens NHZ_DELTA_K über vorlaufisttemp_wp. Die Zähler
+    #               laufzeit_nhz_* zählen nur ganze Stunden und taugen nicht für Beginn und Ende; sie
+    #               dienen als Gegenprobe: steigt einer, ohne dass in der Stunde davor ein NHZ-Ereignis
+    #               lief, zählt nhz_unmatched (stats) eine von der Temperatur übersehene Stunde
+    # Je Ereignis werden Wärme (Volumenstrom * Spreizung, beim NHZ dessen Anhebung) und beim Verdichter
+    # und Abtauen die elektrische Energie des Inverters integriert. Fehlt ein Wert (z.B. Seite nicht
+    # geladen), bleibt der Zustand unverändert; nach einer Lücke über MAX_GAP_SECONDS wird geschlossen.
+
+    def __init__(self, device_id, columns):
+        self.device_id = device_id
+        self.fields = [(columns.index(field), field) for field in EVENT_FIELDS]
+        self.events_emitted = 0
+        self.nhz_unmatched = 0
+        self._nhz_seen = None  # letzte Stichprobe mit laufendem NHZ-Ereignis
+        self._open = {}  # Art -> [start, Ende, Stichproben, Wärme, Strom, Umkehr gesehen]
+        self._last = None  # (timestamp, Werte) der vorigen Stichprobe
+
+    def add(self, timestamp, row):
+        # row: Werte in der Reihenfolge von columns; liefert abgeschlossene Ereignisse (EVENT_COLUMNS)
+        values = {}
+        for index, field in self.fields:
+            value = row[index]
+            # Text bei TEXT-Spalten, Decimal bei NUMERIC im Nachberechnen
+            if isinstance(value, str):
+                value = to_number(value)
+            values[field] = None if value is None else float(value)
+
+        closed = []
+        if self._last is not None and (timestamp - self._last[0]).total_seconds() > MAX_GAP_SECONDS:
+            closed = self.flush()
+        last = self._last[1] if self._last is not None else {}
+        self._integrate(timestamp, values)
+
+        speed = values['istdrehzahl_verdichter']
+        if speed is not None:
+            restarted = increased(last.get('starts_verdichter'), values['starts_verdichter'])
+            if 'compressor' in self._open and (speed <= 0 or restarted):
+                closed.append(self._close('compressor'))
+            if speed > 0 and 'compressor' not in self._open:
+                self._start('compressor', timestamp)
+
+        supply, return_ = values['vorlauftemperatur'], values['ruecklauftemperatur']
+        defrost = self._open.get('defrost')
+        if defrost is not None:
+            # Erst nach der Umkehr (Vorlauf kälter als Rücklauf) zählt ein wärmerer Vorlauf als Ende
+            if supply is not None and return_ is not None:
+                if supply < return_:
+                    defrost[5] = True
+                elif defrost[5]:
+                    closed.append(self._close('defrost'))
+            if 'defrost' in self._open and (timestamp - defrost[0]).total_seconds() > MAX_DEFROST_SECONDS:
+                closed.append(self._close('defrost'))
+        if increased(last.get('laufzeit_starts_abtauen'), values['laufzeit_starts_abtauen']):
+            if 'defrost' in self._open:
+                closed.append(self._close('defrost'))
+            self._start('defrost', timestamp)
+
+        heater, heat_pump = values['vorlaufisttemp_nhz'], values['vorlaufisttemp_wp']
+        if heater is not None and heat_pump is not None:
+            active = heater - heat_pump >= NHZ_DELTA_K
+            if active and 'nhz' not in self._open:
+                self._start('nhz', timestamp)
+            elif not active and 'nhz' in self._open:
+                closed.append(self._close('nhz'))
+        if 'nhz' in self._open:
+            self._nhz_seen = timestamp
+        if any(increased(last.get(counter), values[counter]) for counter in NHZ_COUNTERS):
+            if self._nhz_seen is None or (timestamp - self._nhz_seen).total_seconds() > 3600:
+                self.nhz_unmatched += 1
+
+        self._last = (timestamp, values)
+        return closed
+
+    def flush(self):
+        # Offene Ereignisse mit der letzten Stichprobe abschließen (Lücke oder Beenden)
+        return [self._close(kind) for kind in list(self._open)]
+
+    def stats(self):
+        stats = {'events_emitted': self.events_emitted, 'nhz_unmatched': self.nhz_unmatched}
+        for kind in EVENT_KINDS:
+            stats[f'{kind}_active'] = kind in self._open
+        return stats
+
+    def _start(self, kind, timestamp):
+        self._open[kind] = [timestamp, timestamp, 1, 0.0, None if kind == 'nhz' else 0.0, False]
+
+    def _close(self, kind):
+        start, end, samples, thermal, electrical, _ = self._open.pop(kind)
+        self.events_emitted += 1
+        return (self.device_id, kind, start, end, samples, thermal, electrical)
+
+    def _integrate(self, timestamp, values):
+        # Trapezregel von der vorigen bis zu dieser Stichprobe für alle offenen Ereignisse
+        if not self._open or self._last is None:
+            return
+        last_ts, last = self._last
+        hours = (timestamp - last_ts).total_seconds() / 3600
+        powers = power_values(values)
+        last_powers = power_values(last)
+        for kind, event in self._open.items():
+            event[1] = timestamp
+            event[2] += 1
+            for slot, power, last_power in zip((3, 4), powers[kind], last_powers[kind]):
+                if event[slot] is not None and power is not None and last_power is not None:
+                    event[slot] += (power + last_power) / 2 * hours
+
+
+def combine_rows(rows):
+    # Gleicher Beginn zweimal (z.B. Stichproben mit gleichem Zeitstempel): das spätere Ereignis gilt
+    return list({(row[0], row[1], row[2]): row for row in rows}.values())
+
+
+def increased(previous, value):
+    return previous is not None and value is not None and value > previous
+
+
+def power_values(values):
+    # {Art: (Wärmeleistung, elektrische Leistung)} in kW
+    flow = values['wp_wasservolumenstrom']
+    supply, return_ = values['vorlauftemperatur'], values['ruecklauftemperatur']
+    heater, heat_pump = values['vorlaufisttemp_nhz'], values['vorlaufisttemp_wp']
+    heat = thermal_power(flow, supply, return_) if None not in (flow, supply, return_) else None
+    heater_heat = thermal_power(flow, heater, heat_pump) if None not in (flow, heater, heat_pump) else None
+    electrical = values['inverter_aufnahmeleistung']
+    return {
+        'compressor': (heat, electrical),
+        'defrost': (heat, electrical),
+        'nhz': (heater_heat, None),
+    }
+
+
+def rebuild_events(conn, since=None, page_size=5000):
+    # Alle Ereignisse in einem Durchlauf über data neu bestimmen (serverseitiger Cursor, nach Gerät
+    # und Zeit sortiert); eine Transaktion, der laufende Scraper sollte dabei gestoppt sein
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    start = time.perf_counter()
+    samples = 0
+    events = 0
+    try:
+        with conn.cursor() as cur:
+            params = {'since': None}
+            if since is not None:
+                # Ein bei since noch laufendes Ereignis wird ab seinem Beginn neu bestimmt, sonst stünde
+                # derselbe Lauf zweimal in events; das kann den Beginn schrittweise weiter vorverlegen
+                scan_from = datetime(since.year, since.month, since.day)
+                while True:
+                    cur.execute('SELECT min(start_ts) FROM events WHERE end_ts >= %s', (scan_from,))
+                    first = cur.fetchone()[0]
+                    if first is None or first >= scan_from:
+                        break
+                    scan_from = first
+                params['since'] = scan_from
+                cur.execute('DELETE FROM events WHERE end_ts >= %(since)s', params)
+            else:
+                cur.execute('DELETE FROM events')
+            since_filter = 'WHERE timestamp >= %(since)s' if since is not None else ''
+            reader = conn.cursor(name='rebuild_events')
+            reader.itersize = page_size
+            reader.execute(f'SELECT timestamp, device_id, {", ".join(EVENT_FIELDS)} FROM data {since_filter} '
+                           f'ORDER BY device_id, timestamp', params)
+            detector = None
+            pending = []
+            for row in reader:
+                if detector is None or detector.device_id != row[1]:
+                    if detector is not None:
+                        pending.extend(detector.flush())
+                    detector = EventDetector(row[1], EVENT_FIELDS)
+                pending.extend(detector.add(row[0], row[2:]))
+                samples += 1
+                if len(pending) >= page_size:
+                    pending = combine_rows(pending)
+                    execute_values(cur, EVENTS_INSERT, pending, page_size=page_size)
+                    events += len(pending)
+                    pending = []
+            reader.close()
+            if detector is not None:
+                pending.extend(detector.flush())
+            if pending:
+                pending = combine_rows(pending)
+                execute_values(cur, EVENTS_INSERT, pending, page_size=page_size)
+                events += len(pending)
+            cur.execute('ANALYZE events')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+    print(f"Rebuilt {events} events from {samples} samples in {time.perf_counter() - start:.1f}s.")
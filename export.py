@@ -0,0 +1,232 @@
+import csv
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from itertools import islice
+
+import psycopg2
+
+from coldstore import ColdStore, read_range
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ('csv', 'parquet')
+STATE_FILE = 'export_state.json'
+# Ein Tag gilt erst als abgeschlossen, wenn er beim Export so lange vorbei war (Writer, Spool)
+SETTLE_SECONDS = 3600
+# Zeilen je Abruf aus dem serverseitigen Cursor bzw. je Parquet-Row-Group
+CHUNK_ROWS = 50000
+# gzip-Stufe für CSV: 3 statt 9 kostet ca. 10 % Größe, schreibt aber ein Vielfaches schneller
+CSV_COMPRESSLEVEL = 3
+
+
+def parquet_type(data_type):
+    # Spaltentyp aus information_schema -> (pyarrow-Typ, Cast in der Abfrage)
+    if data_type == 'real':
+        return pyarrow.float32(), ''
+    if data_type in ('double precision', 'numeric'):
+        return pyarrow.float64(), '::double precision'
+    if data_type in ('smallint', 'integer', 'bigint'):
+        return pyarrow.int64(), ''
+    if data_type.startswith('timestamp'):
+        return pyarrow.timestamp('us'), ''
+    return pyarrow.string(), '::text'
+
+
+def day_file(day, export_format):
+    return f"data-{day}.csv.gz" if export_format == 'csv' else f"data-{day}.parquet"
+
+
+def select_sql(columns, casts=None):
+    casts = casts or [''] * len(columns)
+    selected = ', '.join(f'"{column}"{cast}' for column, cast in zip(columns, casts))
+    # Sortiert wie coldstore.read_range, damit Tage aus beiden Stufen gleich aussehen
+    return (f'SELECT {selected} FROM data WHERE timestamp >= %(start)s AND timestamp < %(end)s '
+            f'ORDER BY timestamp, device_id')
+
+
+def export_csv(conn, path, columns, start, end):
+    # COPY ... TO STDOUT schreibt direkt in die gzip-Datei, der Speicher bleibt konstant
+    with conn.cursor() as cur, gzip.open(path, 'wb', compresslevel=CSV_COMPRESSLEVEL) as f:
+        query = cur.mogrify(select_sql(columns), {'start': start, 'end': end}).decode()
+        cur.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)', f)
+        return cur.rowcount
+
+
+def export_parquet(conn, path, columns, column_types, start, end):
+    # Serverseitiger Cursor, je CHUNK_ROWS Zeilen eine Row-Group
+    casts = [parquet_type(column_types[column])[1] for column in columns]
+    with conn.cursor(name='export') as cur:
+        cur.itersize = CHUNK_ROWS
+        cur.execute(select_sql(columns, casts), {'start': start, 'end': end})
+        return write_parquet(path, columns, column_types, cur)
+
+
+def write_parquet(path, columns, column_types, rows):
+    types = [parquet_type(column_types[column])[0] for column in columns]
+    schema = pyarrow.schema(list(zip(columns, types)))
+    count = 0
+    rows = iter(rows)
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            chunk = list(islice(rows, CHUNK_ROWS))
+            if not chunk:
+                break
+            arrays = [pyarrow.array(values, type=arrow_type)
+                      for values, arrow_type in zip(zip(*chunk), types)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def write_csv(path, columns, rows):
+    # Wie COPY ... CSV HEADER: NULL als leeres Feld, Zeilenende \n
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=CSV_COMPRESSLEVEL) as f:
+        out = csv.writer(f, lineterminator='\n')
+        out.writerow(columns)
+        for row in rows:
+            out.writerow(row)
+            count += 1
+    return count
+
+
+def export_cold(conn, cold_dir, path, columns, column_types, export_format, start, end):
+    # Tag liegt (auch) in der kalten Stufe: beide Stufen über read_range lesen
+    store = ColdStore(cold_dir)
+    try:
+        rows = read_range(conn, store, columns, start, end)
+        if export_format == 'csv':
+            return write_csv(path, columns, rows)
+        return write_parquet(path, columns, column_types, rows)
+    finally:
+        store.close()
+
+
+def export_day(connect, directory, day, columns, column_types, export_format, cold=False, cold_dir=None):
+    # Läuft im Thread-Pool mit eigener Verbindung; erst die fertige Datei ersetzt die alte
+    start = datetime.strptime(day, '%Y-%m-%d')
+    end = start + timedelta(days=1)
+    path = os.path.join(directory, day_file(day, export_format))
+    tmp = path + '.tmp'
+    began = time.perf_counter()
+    conn = connect()
+    try:
+        conn.set_session(readonly=True)
+        if cold:
+            rows = export_cold(conn, cold_dir, tmp, columns, column_types, export_format, start, end)
+        elif export_format == 'csv':
+            rows = export_csv(conn, tmp, columns, start, end)
+        else:
+            rows = export_parquet(conn, tmp, columns, column_types, start, end)
+        conn.commit()
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return rows, time.perf_counter() - began
+
+
+def load_state(directory, columns, export_format):
+    # Andere Spalten oder anderes Format: alle Tage neu exportieren
+    try:
+        with open(os.path.join(directory, STATE_FILE), encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        state = None
+    if state is None or state.get('columns') != columns or state.get('format') != export_format:
+        state = {'columns': columns, 'format': export_format, 'days': {}}
+    return state
+
+
+def save_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def first_day(conn, cold_days=()):
+    with conn.cursor() as cur:
+        cur.execute('SELECT min(timestamp) FROM data')
+        first = cur.fetchone()[0]
+    days = [first.date()] if first is not None else []
+    days += [datetime.strptime(day, '%Y-%m-%d').date() for day in cold_days[:1]]
+    return min(days) if days else None
+
+
+def export_days(conn, connect, directory, columns, column_types, since=None, until=None, export_format='csv',
+                workers=None, overwrite=False, cold_dir=None):
+    # Exportiert data tageweise nach directory (eine Datei je Tag) und merkt sich in STATE_FILE, welche
+    # Tage abgeschlossen sind. Ein erneuter Lauf (z.B. nächtlich) überspringt diese und schreibt nur
+    # neue Tage sowie den noch offenen letzten Tag neu; ein abgebrochener Lauf setzt dort wieder an.
+    # Tage, die tier nach cold_dir verschoben hat, kommen von dort (siehe coldstore.read_range).
+    if export_format == 'parquet' and pyarrow is None:
+        raise SystemExit("Parquet export needs pyarrow (pip install pyarrow).")
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(directory, columns, export_format)
+    done = state['days']
+    cold_days = ColdStore(cold_dir).days() if cold_dir and os.path.isdir(cold_dir) else []
+    if since is None:
+        # Ab dem ersten offenen (z.B. fehlgeschlagenen) Tag, sonst nach dem letzten abgeschlossenen
+        open_days = [day for day, entry in done.items() if not entry['complete']]
+        if open_days or done:
+            since = datetime.strptime(min(open_days) if open_days else max(done), '%Y-%m-%d').date()
+        else:
+            since = first_day(conn, cold_days)
+        if since is None:
+            print("Table data is empty, nothing to export.")
+            return
+    now = datetime.now()
+    if until is None:
+        until = now.date() + timedelta(days=1)
+    days = []
+    day = since
+    while day < until:
+        key = day.isoformat()
+        if overwrite or not done.get(key, {}).get('complete'):
+            days.append(key)
+        day += timedelta(days=1)
+
+    # Alle geplanten Tage vorher als offen vermerken: bricht der Lauf ab oder scheitert ein Tag, beginnt
+    # der nächste Lauf dort, auch wenn spätere Tage (as_completed) schon fertig sind
+    for day in days:
+        done[day] = dict(done.get(day, {}), complete=False)
+    save_state(directory, state)
+
+    start = time.perf_counter()
+    total = 0
+    failed = 0
+    with ThreadPoolExecutor(workers or min(4, os.cpu_count() or 1), thread_name_prefix='export') as pool:
+        futures = {pool.submit(export_day, connect, directory, day, columns, column_types, export_format,
+                               day in cold_days, cold_dir): day for day in days}
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                rows, seconds = future.result()
+            except (psycopg2.Error, OSError) as e:
+                # Bleibt offen (complete=False) und wird beim nächsten Lauf wiederholt
+                print(f"{day}: export failed:", e)
+                failed += 1
+                continue
+            end = datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)
+            done[day] = {'rows': rows, 'complete': (now - end).total_seconds() >= SETTLE_SECONDS,
+                         'exported': now.isoformat(timespec='seconds')}
+            save_state(directory, state)
+            total += rows
+            print(f"{day}: {rows} rows in {seconds:.1f}s")
+    elapsed = time.perf_counter() - start
+    print(f"Exported {total} rows from {len(days)} days to {directory} in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed > 0 else 0:.0f} rows/s).")
+    if failed:
+        raise SystemExit(f"{failed} days failed, run export again to retry them.")
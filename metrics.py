@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rollups import COUNTER_RE
+from values import normalize_value
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+_invalid_re = re.compile(r'[^a-zA-Z0-9_]')
+_camel_re = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+
+def metric_name(*parts):
+    name = '_'.join(parts).replace('ä', 'ae').replace('ö', 'oe').replace('ü', 'ue').replace('ß', 'ss')
+    return _invalid_re.sub('_', _camel_re.sub('_', name)).lower()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    # Liefert den letzten Stand jedes Geräts aus dem Speicher als OpenMetrics. Gelesen werden
+    # nur Referenzen, die der Abruf am Ende eines Zyklus austauscht; keine Datenbank, keine Sperren.
+    # Zählerstände (siehe rollups.COUNTER_RE) werden als counter, alles andere als gauge ausgegeben.
+    daemon_threads = True
+
+    def __init__(self, address, devices, columns, sources, units=None):
+        super().__init__(address, MetricsHandler)
+        self.devices = devices
+        self.columns = columns
+        self.units = units or {}
+        self.sources = sources
+        self.requests = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='metrics', daemon=True).start()
+        return self
+
+    def render(self):
+        self.requests += 1
+        families = {}
+
+        def add(name, kind, help, labels, value):
+            family = families.setdefault(name, (kind, help, []))
+            label_text = ','.join(f'{key}="{escape(label)}"' for key, label in labels.items())
+            suffix = '_total' if kind == 'counter' else ''
+            label_text = f'{{{label_text}}}' if label_text else ''
+            family[2].append(f'{name}{suffix}{label_text} {value!r}')
+
+        now = time.monotonic()
+        for device in self.devices:
+            labels = {'device': device.id}
+            if device.last_success is not None:
+                add('scraper_last_success_age_seconds', 'gauge', 'Sekunden seit dem letzten gültigen Abruf',
+                    labels, now - device.last_success)
+            latest = device.latest
+            if latest is not None:
+                timestamp, row = latest
+                add('isg_sample_timestamp_seconds', 'gauge', 'Zeitstempel des letzten Werts laut ISG',
+                    labels, timestamp.timestamp())
+                for column, value in zip(self.columns, row):
+                    number, unit = (value, None) if isinstance(value, float) else normalize_value(value)
+                    if number is None:
+                        continue
+                    unit = self.units.get(column, unit)
+                    kind = 'counter' if COUNTER_RE.match(column) else 'gauge'
+                    add(metric_name('isg', column), kind, f'{column} [{unit}]' if unit else column,
+                        labels, number)
+
+            stats = device.stats()
+            add('scraper_samples', 'counter', 'Gespeicherte Stichproben', labels, stats['samples'])
+            add('scraper_fetch_failures', 'counter', 'Fehlgeschlagene Abrufe', labels, stats['failures'])
+            add('scraper_partial_samples', 'counter', 'Gespeicherte Stichproben mit fehlenden Seiten',
+                labels, stats['partial_samples'])
+            for quantile in ('p50', 'p95', 'max'):
+                add('scraper_cycle_seconds', 'gauge', 'Dauer eines Zyklus vom Abruf bis zum Writer',
+                    dict(labels, quantile=quantile), stats[f'latency_{quantile}_seconds'])
+
+        # Übrige Kennzahlen aus stats_sources, z.B. "Writer" oder "Scheduler wp1"
+        for source, stats in list(self.sources.items()):
+            if source.startswith('Device '):
+                continue
+            prefix, _, device_id = source.partition(' ')
+            labels = {'device': device_id} if device_id else {}
+            for key, value in stats().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    add(metric_name('scraper', prefix, key), 'gauge', f'{prefix}: {key}', labels,
+                        float(value))
+
+        lines = []
+        for name, (kind, help, samples) in families.items():
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'# HELP {name} {escape(help)}')
+            lines.extend(samples)
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
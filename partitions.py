@@ -0,0 +1,194 @@
+import re
+import time
+from datetime import date
+
+# Monatspartitionen data_JJJJ_MM; Zeilen außerhalb aller Bereiche (z.B. falsch gestellte
+# Geräteuhr, NULL) landen in data_default statt den Batch scheitern zu lassen
+PARTITION_RE = re.compile(r'^data_(\d{4})_(\d{2})$')
+BRIN_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_data_timestamp_brin ON data USING brin (timestamp)'
+# Abfragen je Gerät (Rollups, Export, data_at) brauchen weiterhin den B-Baum
+DEVICE_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_data_device_timestamp ON data (device_id, timestamp)'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'data_{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('data')")
+        row = cur.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions(conn):
+    # Vorhandene Monatspartitionen als {Monat: Name}
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT c.relname FROM pg_inherits AS i
+            JOIN pg_class AS c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'data'::regclass
+        ''')
+        names = [name for name, in cur.fetchall()]
+    months = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+
+def create_partition(cur, month):
+    name = partition_name(month)
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF data
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+    ''')
+    return name
+
+
+def move_from_default(cur, month):
+    # Zeilen des Monats liegen schon in data_default (z.B. weil die Wartung ausgefallen war): eine neue
+    # Partition würde daran scheitern. data_default abhängen, Partition anlegen, Zeilen umziehen und
+    # data_default wieder anhängen, alles in der Transaktion des Aufrufers.
+    bounds = (month, add_months(month, 1))
+    cur.execute('ALTER TABLE data DETACH PARTITION data_default')
+    name = create_partition(cur, month)
+    cur.execute(f'INSERT INTO {name} SELECT * FROM data_default WHERE timestamp >= %s AND timestamp < %s',
+                bounds)
+    moved = cur.rowcount
+    cur.execute('DELETE FROM data_default WHERE timestamp >= %s AND timestamp < %s', bounds)
+    cur.execute('ALTER TABLE data ATTACH PARTITION data_default DEFAULT')
+    print(f"{name}: moved {moved} rows out of data_default")
+    return name
+
+
+def ensure_partitions(conn, months_ahead=2, today=None):
+    # Partitionen für den laufenden und die nächsten months_ahead Monate anlegen
+    current = month_start(today or date.today())
+    existing = partitions(conn)
+    created = []
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute('CREATE TABLE IF NOT EXISTS data_default PARTITION OF data DEFAULT')
+            for offset in range(months_ahead + 1):
+                month = add_months(current, offset)
+                if month in existing:
+                    continue
+                cur.execute('''
+                    SELECT EXISTS (SELECT 1 FROM data_default WHERE timestamp >= %s AND timestamp < %s)
+                ''', (month, add_months(month, 1)))
+                if cur.fetchone()[0]:
+                    created.append(move_from_default(cur, month))
+                else:
+                    created.append(create_partition(cur, month))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+    if created:
+        print(f"Created partitions {', '.join(created)}.")
+    return created
+
+
+def drop_expired_partitions(conn, retention_months, today=None):
+    # Ganze Monate löschen, die vollständig älter als retention_months sind, und die gleich alten
+    # Zeilen in data_default; 0 = alles behalten
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    dropped = []
+    with conn.cursor() as cur:
+        for month, name in sorted(partitions(conn).items()):
+            if month < cutoff:
+                cur.execute(f'DROP TABLE {name}')
+                dropped.append(name)
+        cur.execute("SELECT to_regclass('data_default') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute('DELETE FROM data_default WHERE timestamp < %s', (cutoff,))
+            expired = cur.rowcount
+        else:
+            expired = 0
+    conn.commit()
+    if dropped:
+        print(f"Dropped partitions {', '.join(dropped)} (retention {retention_months} months).")
+    if expired:
+        print(f"Deleted {expired} expired rows from data_default.")
+    return dropped
+
+
+def maintain_partitions(conn, months_ahead=2, retention_months=0):
+    ensure_partitions(conn, months_ahead)
+    drop_expired_partitions(conn, retention_months)
+
+
+def migrate_partitions(conn, months_ahead=2):
+    # Einmalige Umstellung der bestehenden Tabelle in einer Transaktion: umbenennen,
+    # partitionierte Tabelle mit gleichen Spalten anlegen, monatsweise umkopieren
+    if is_partitioned(conn):
+        print("Table data is already partitioned.")
+        return False
+
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            # Der Rückgabetyp von data_at hängt an der alten Tabelle und wird danach neu angelegt
+            cur.execute('DROP FUNCTION IF EXISTS data_series(TIMESTAMP, TIMESTAMP, INTERVAL, TEXT)')
+            cur.execute('DROP FUNCTION IF EXISTS data_at(TIMESTAMP, TEXT)')
+            cur.execute('ALTER TABLE data RENAME TO data_unpartitioned')
+            cur.execute('''
+                CREATE TABLE data (LIKE data_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (timestamp)
+            ''')
+            cur.execute('CREATE TABLE data_default PARTITION OF data DEFAULT')
+            cur.execute('SELECT min(timestamp), max(timestamp) FROM data_unpartitioned')
+            first, last = cur.fetchone()
+
+            moved = 0
+            if first is not None:
+                month, end = month_start(first), month_start(last)
+                while month <= end:
+                    # Direkt in die Partition, ohne Routing über die Elterntabelle
+                    name = create_partition(cur, month)
+                    cur.execute(f'''
+                        INSERT INTO {name} SELECT * FROM data_unpartitioned
+                        WHERE timestamp >= %s AND timestamp < %s
+                    ''', (month, add_months(month, 1)))
+                    moved += cur.rowcount
+                    print(f"{name}: {cur.rowcount} rows")
+                    month = add_months(month, 1)
+            cur.execute('INSERT INTO data SELECT * FROM data_unpartitioned WHERE timestamp IS NULL')
+            moved += cur.rowcount
+
+            cur.execute('DROP TABLE data_unpartitioned')
+            # Indizes erst nach dem Kopieren: BRIN für Zeiträume, B-Baum für Abfragen je Gerät
+            cur.execute(BRIN_INDEX_SQL)
+            cur.execute(DEVICE_INDEX_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+
+    ensure_partitions(conn, months_ahead)
+    with conn.cursor() as cur:
+        cur.execute('ANALYZE data')
+    conn.commit()
+    print(f"Moved {moved} rows into monthly partitions in {time.perf_counter() - start:.1f}s.")
+    return True
@@ -0,0 +1,132 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+class CycleProfiler:
+    # Profiliert die nächsten N Zyklen, ausgelöst per arm() (PROFILE_CYCLES beim Start oder SIGUSR1).
+    #   cprofile  deterministisch, pro Zyklus im Thread des Zyklus; läuft schon ein Profil in einem
+    #             anderen Thread, wird der Zyklus übersprungen (nur ein aktiver Profiler je Prozess)
+    #   sample    ein Thread liest alle interval Sekunden die Stacks aller Threads (sys._current_frames)
+    #             und schreibt sie im "collapsed"-Format für Flamegraph/speedscope
+    # Ohne arm() kostet cycle() nur eine Abfrage eines Zählers.
+
+    def __init__(self, directory='profiles', mode='cprofile', interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {', '.join(PROFILE_MODES)}")
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.captures = 0
+        self._remaining = 0
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._stats = None
+        self._samples = None
+        self._sampler = None
+
+    def arm(self, cycles):
+        with self._lock:
+            if self._remaining:
+                return False
+            self._remaining = cycles
+            self._stats = None
+            if self.mode == 'sample':
+                self._samples = Counter()
+                self._sampler = threading.Thread(target=self._sample, name='sampler', daemon=True)
+                self._sampler.start()
+        print(f"Profiling the next {cycles} cycles ({self.mode}).")
+        return True
+
+    @contextmanager
+    def cycle(self):
+        if not self._remaining:
+            yield
+            return
+        if self.mode == 'sample':
+            try:
+                yield
+            finally:
+                self._count_cycle()
+            return
+        if not self._active.acquire(blocking=False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+        finally:
+            self._active.release()
+            self._count_cycle()
+
+    def _count_cycle(self):
+        with self._lock:
+            if not self._remaining:
+                return
+            self._remaining -= 1
+            if self._remaining:
+                return
+            stats, samples = self._stats, self._samples
+            self._stats = self._samples = None
+        self._write(stats, samples)
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while self._remaining:
+            time.sleep(self.interval)
+            samples = self._samples
+            if samples is None:
+                break
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f'{code.co_name} ({filename}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                samples[';'.join([names.get(ident, str(ident))] + stack[::-1])] += 1
+
+    def _write(self, stats, samples):
+        os.makedirs(self.directory, exist_ok=True)
+        name = os.path.join(self.directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        if samples is not None:
+            path = f'{name}.collapsed'
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in samples.most_common():
+                    f.write(f'{stack} {count}\n')
+            print(f"Wrote {sum(samples.values())} stack samples to {path}.")
+        elif stats is not None:
+            path = f'{name}.pstats'
+            stats.dump_stats(path)
+            summary = io.StringIO()
+            stats.stream = summary
+            stats.sort_stats('cumulative').print_stats(15)
+            print(f"Wrote profile to {path}.\n{summary.getvalue()}")
+        self.captures += 1
+
+    def stats(self):
+        return {'remaining_cycles': self._remaining, 'captures': self.captures}
@@ -0,0 +1,66 @@
+from collections import deque
+
+
+class RefreshTracker:
+    # Lernt aus dem Gerätezeitstempel (timestampunterschied), wie oft das ISG
+    # seine Werte tatsächlich aktualisiert, und schlägt den nächsten Abruf kurz
+    # nach der erwarteten Aktualisierung vor. Abrufe ohne neuen Zeitstempel
+    # sind Duplikate und werden nicht gespeichert.
+    #
+    # Zuordnung Gerätezeit -> monotone Uhr: Abrufzeitpunkt minus Gerätezeit ist
+    # mindestens der echte Versatz; das Minimum über die letzten Abrufe ist die
+    # beste Schätzung (Abruf direkt nach einer Aktualisierung).
+
+    def __init__(self, guard=0.2, retry=0.25, alpha=0.2, window=120):
+        self.guard = guard
+        self.retry = retry
+        self.alpha = alpha
+        self.period = None
+        self.last_timestamp = None
+        self.polls = 0
+        self.advances = 0
+        self.duplicates = 0
+        self.sample_age = 0.0
+        self._offsets = deque(maxlen=window)
+
+    def observe(self, timestamp, now):
+        # True, wenn der Zeitstempel seit dem letzten Abruf weitergelaufen ist
+        device = timestamp.timestamp()
+        self.polls += 1
+        self._offsets.append(now - device)
+
+        if self.last_timestamp is not None and device == self.last_timestamp:
+            self.duplicates += 1
+            return False
+
+        if self.last_timestamp is not None and device > self.last_timestamp:
+            delta = device - self.last_timestamp
+            self.period = delta if self.period is None else self.period + self.alpha * (delta - self.period)
+        else:
+            # Erster Abruf oder Uhr des Geräts zurückgestellt
+            self.period = None
+            self._offsets.clear()
+            self._offsets.append(now - device)
+
+        self.last_timestamp = device
+        self.advances += 1
+        self.sample_age = now - device - min(self._offsets)
+        return True
+
+    def next_poll(self, now):
+        # Monotoner Zeitpunkt für den nächsten Abruf oder None, solange noch nichts gelernt ist
+        if self.period is None:
+            return None
+        expected = self.last_timestamp + self.period + min(self._offsets) + self.guard
+        if expected > now:
+            return min(expected, now + self.period)
+        return now + self.retry
+
+    def stats(self):
+        return {
+            'polls': self.polls,
+            'advances': self.advances,
+            'duplicates_dropped': self.duplicates,
+            'refresh_period_seconds': self.period or 0.0,
+            'sample_age_seconds': self.sample_age,
+        }
@@ -0,0 +1,149 @@
+from dataclasses import dataclass, make_dataclass
+from datetime import datetime
+
+# Seiten des ISG (?s=...) und die daraus erzeugten Dataclasses
+PAGES = {
+    '1,0': 'WpStatus',
+    '1,1': 'WpData',
+    '1,8': 'WpEnergy',
+}
+FIELD_TYPES = ('number', 'text')
+
+
+@dataclass(frozen=True)
+class Field:
+    page: str  # Abfrage der Seite, siehe PAGES
+    header: str  # Tabellenkopf, muss die Beschriftung nur enthalten
+    label: str  # Zeilenbeschriftung
+    column: str  # Spalte in data
+    unit: str = None  # kanonische Einheit nach values.normalize_value
+    type: str = 'number'  # number: bei numerischer Speicherung umgerechnet, text: immer TEXT
+
+
+# Einzige Liste aller Felder: Reihenfolge der Werte in jeder Zeile, der Spalten beim Anlegen und
+# der Dataclass-Attribute. Ein neues Feld ist eine Zeile hier, die Spalte legt create_schema an.
+FIELDS = (
+    Field('1,0', 'RAUMTEMPERATUR', 'ISTTEMPERATUR 1', 'raumtemp_ist', '°C'),
+    Field('1,0', 'RAUMTEMPERATUR', 'SOLLTEMPERATUR 1', 'raumtemp_soll', '°C'),
+    Field('1,0', 'RAUMTEMPERATUR', 'RAUMFEUCHTE 1', 'raumfeuchte', '%'),
+    Field('1,0', 'RAUMTEMPERATUR', 'TAUPUNKTTEMPERATUR 1', 'taupunkttemp', '°C'),
+    Field('1,0', 'WARMWASSER', 'ISTTEMPERATUR', 'warmwasser_ist', '°C'),
+    Field('1,0', 'WARMWASSER', 'SOLLTEMPERATUR', 'warmwasser_soll', '°C'),
+    Field('1,0', 'WARMWASSER', 'VOLUMENSTROM', 'warmwasser_volumenstrom', 'l/min'),
+    Field('1,0', 'KÜHLEN', 'ISTTEMPERATUR', 'kuehlen_ist', '°C'),
+    Field('1,0', 'KÜHLEN', 'SOLLTEMPERATUR', 'kuehlen_soll', '°C'),
+    Field('1,0', 'HEIZUNG', 'AUSSENTEMPERATUR', 'aussentemp', '°C'),
+    Field('1,0', 'HEIZUNG', 'ISTTEMPERATUR HK 1', 'hk1_ist', '°C'),
+    Field('1,0', 'HEIZUNG', 'SOLLTEMPERATUR HK 1', 'hk1_soll', '°C'),
+    Field('1,0', 'HEIZUNG', 'VORLAUFISTTEMPERATUR WP', 'vorlaufisttemp_wp', '°C'),
+    Field('1,0', 'HEIZUNG', 'VORLAUFISTTEMPERATUR NHZ', 'vorlaufisttemp_nhz', '°C'),
+    Field('1,0', 'HEIZUNG', 'RÜCKLAUFISTTEMPERATUR WP', 'ruecklaufisttemp_wp', '°C'),
+    Field('1,0', 'HEIZUNG', 'PUFFERISTTEMPERATUR', 'pufferisttemp', '°C'),
+    Field('1,0', 'HEIZUNG', 'PUFFERSOLLTEMPERATUR', 'puffersolltemp', '°C'),
+    Field('1,0', 'HEIZUNG', 'HEIZUNGSDRUCK', 'heizungsdruck', 'bar'),
+    Field('1,0', 'HEIZUNG', 'FROSTSCHUTZ', 'frostschutz', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'RÜCKLAUFTEMPERATUR', 'ruecklauftemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'VORLAUFTEMPERATUR', 'vorlauftemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'FROSTSCHUTZTEMPERATUR', 'frostschutztemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'AUSSENTEMPERATUR', 'aussentemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'VERDAMPFERTEMPERATUR', 'verdampfertemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'VERDICHTEREINTRITTSTEMPERATUR', 'verdichtereintrittstemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'HEISSGASTEMPERATUR', 'heissgastemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'VERFLÜSSIGERTEMPERATUR', 'verflüssigertemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'ÖLSUMPFTEMPERATUR', 'oelsumpftemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'DRUCK NIEDERDRUCK', 'druck_niederdruck', 'bar'),
+    Field('1,1', 'PROZESSDATEN', 'DRUCK HOCHDRUCK', 'druck_hochdruck', 'bar'),
+    Field('1,1', 'PROZESSDATEN', 'WP WASSERVOLUMENSTROM', 'wp_wasservolumenstrom', 'l/min'),
+    Field('1,1', 'PROZESSDATEN', 'STROM INVERTER', 'strom_inverter', 'A'),
+    Field('1,1', 'PROZESSDATEN', 'SPANNUNG INVERTER', 'spannung_inverter', 'V'),
+    Field('1,1', 'PROZESSDATEN', 'ISTDREHZAHL VERDICHTER', 'istdrehzahl_verdichter', 'Hz'),
+    Field('1,1', 'PROZESSDATEN', 'SOLLDREHZAHL VERDICHTER', 'solldrehzahl_verdichter', 'Hz'),
+    Field('1,1', 'PROZESSDATEN', 'LÜFTERLEISTUNG REL', 'luefterleistung_rel', '%'),
+    Field('1,1', 'PROZESSDATEN', 'VERDAMPFEREINTRITTSTEMPERATUR', 'verdampfereintrittstemperatur', '°C'),
+    Field('1,1', 'PROZESSDATEN', 'EXPANSIONSVENTILEINTRITTSTEMPERATUR', 'expansionsventileintrittstemperatur',
+          '°C'),
+    Field('1,1', 'PROZESSDATEN', 'INVERTER AUFNAHMELEISTUNG', 'inverter_aufnahmeleistung', 'kW'),
+    Field('1,1', 'STARTS', 'VERDICHTER', 'starts_verdichter'),
+    Field('1,1', 'WÄRMEMENGE', 'VD HEIZEN TAG', 'waermemenge_vd_heizen_tag', 'kWh'),
+    Field('1,1', 'WÄRMEMENGE', 'VD HEIZEN SUMME', 'waermemenge_vd_heizen_summe', 'kWh'),
+    Field('1,1', 'WÄRMEMENGE', 'VD WARMWASSER TAG', 'waermemenge_vd_warmwasser_tag', 'kWh'),
+    Field('1,1', 'WÄRMEMENGE', 'VD WARMWASSER SUMME', 'waermemenge_vd_warmwasser_summe', 'kWh'),
+    Field('1,1', 'WÄRMEMENGE', 'NHZ HEIZEN SUMME', 'waermemenge_nhz_heizen_summe', 'kWh'),
+    Field('1,1', 'WÄRMEMENGE', 'NHZ WARMWASSER SUMME', 'waermemenge_nhz_warmwasser_summe', 'kWh'),
+    Field('1,1', 'LEISTUNGSAUFNAHME', 'VD HEIZEN TAG', 'leistungsaufnahme_vd_heizen_tag', 'kWh'),
+    Field('1,1', 'LEISTUNGSAUFNAHME', 'VD HEIZEN SUMME', 'leistungsaufnahme_vd_heizen_summe', 'kWh'),
+    Field('1,1', 'LEISTUNGSAUFNAHME', 'VD WARMWASSER TAG', 'leistungsaufnahme_vd_warmwasser_tag', 'kWh'),
+    Field('1,1', 'LEISTUNGSAUFNAHME', 'VD WARMWASSER SUMME', 'leistungsaufnahme_vd_warmwasser_summe', 'kWh'),
+    Field('1,1', 'LAUFZEIT', 'VD HEIZEN', 'laufzeit_vd_heizen', 'h'),
+    Field('1,1', 'LAUFZEIT', 'VD WARMWASSER', 'laufzeit_vd_warmwasser', 'h'),
+    Field('1,1', 'LAUFZEIT', 'VD KÜHLEN', 'laufzeit_vd_kuehlen', 'h'),
+    Field('1,1', 'LAUFZEIT', 'VD ABTAUEN', 'laufzeit_vd_abtauen', 'h'),
+    Field('1,1', 'LAUFZEIT', 'NHZ 1', 'laufzeit_nhz_1', 'h'),
+    Field('1,1', 'LAUFZEIT', 'NHZ 2', 'laufzeit_nhz_2', 'h'),
+    Field('1,1', 'LAUFZEIT', 'NHZ 1/2', 'laufzeit_nhz_1_2', 'h'),
+    Field('1,1', 'LAUFZEIT', 'ZEIT ABTAUEN', 'laufzeit_zeit_abtauen', 'h'),
+    Field('1,1', 'LAUFZEIT', 'STARTS ABTAUEN', 'laufzeit_starts_abtauen'),
+    Field('1,8', 'WÄRMEMENGE', 'HEIZEN 1-24 h', 'waermemenge_heizen_1_24_h', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'HEIZEN 1-12 M', 'waermemenge_heizen_1_12_m', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'HEIZEN 13-24 M', 'waermemenge_heizen_13_24_m', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'KÜHLEN 1-24 h', 'waermemenge_kuehlen_1_24_h', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'KÜHLEN 1-12 M', 'waermemenge_kuehlen_1_12_m', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'KÜHLEN 13-24 M', 'waermemenge_kuehlen_13_24_m', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'WARMWASSER 1-24 h', 'waermemenge_warmwasser_1_24_h', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'WARMWASSER 1-12 M', 'waermemenge_warmwasser_1_12_m', 'kWh'),
+    Field('1,8', 'WÄRMEMENGE', 'WARMWASSER 13-24 M', 'waermemenge_warmwasser_13_24_m', 'kWh'),
+    Field('1,8', 'EFFIZIENZ', 'HEIZEN 1-24 h', 'effizienz_heizen_1_24_h'),
+    Field('1,8', 'EFFIZIENZ', 'HEIZEN 1-12 M', 'effizienz_heizen_1_12_m'),
+    Field('1,8', 'EFFIZIENZ', 'HEIZEN 13-24 M', 'effizienz_heizen_13_24_m'),
+    Field('1,8', 'EFFIZIENZ', 'KÜHLEN 1-24 h', 'effizienz_kuehlen_1_24_h'),
+    Field('1,8', 'EFFIZIENZ', 'KÜHLEN 1-12 M', 'effizienz_kuehlen_1_12_m'),
+    Field('1,8', 'EFFIZIENZ', 'KÜHLEN 13-24 M', 'effizienz_kuehlen_13_24_m'),
+    Field('1,8', 'EFFIZIENZ', 'WARMWASSER 1-24 h', 'effizienz_warmwasser_1_24_h'),
+    Field('1,8', 'EFFIZIENZ', 'WARMWASSER 1-12 M', 'effizienz_warmwasser_1_12_m'),
+    Field('1,8', 'EFFIZIENZ', 'WARMWASSER 13-24 M', 'effizienz_warmwasser_13_24_m'),
+    Field('1,8', 'STROMVERBRAUCH', 'HEIZEN 1-24 h', 'stromverbrauch_heizen_1_24_h', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'HEIZEN 1-12 M', 'stromverbrauch_heizen_1_12_m', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'HEIZEN 13-24 M', 'stromverbrauch_heizen_13_24_m', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'KÜHLEN 1-24 h', 'stromverbrauch_kuehlen_1_24_h', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'KÜHLEN 1-12 M', 'stromverbrauch_kuehlen_1_12_m', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'KÜHLEN 13-24 M', 'stromverbrauch_kuehlen_13_24_m', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'WARMWASSER 1-24 h', 'stromverbrauch_warmwasser_1_24_h', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'WARMWASSER 1-12 M', 'stromverbrauch_warmwasser_1_12_m', 'kWh'),
+    Field('1,8', 'STROMVERBRAUCH', 'WARMWASSER 13-24 M', 'stromverbrauch_warmwasser_13_24_m', 'kWh'),
+)
+
+COLUMNS = [field.column for field in FIELDS]
+UNITS = {field.column: field.unit for field in FIELDS if field.unit}
+NUMBER_COLUMNS = frozenset(field.column for field in FIELDS if field.type == 'number')
+# Je Feld: Index der Seite in PAGES, Tabellenkopf, Beschriftung
+LOOKUPS = tuple((list(PAGES).index(field.page), field.header, field.label) for field in FIELDS)
+PAGE_COLUMNS = {page: [field.column for field in FIELDS if field.page == page] for page in PAGES}
+
+for _field in FIELDS:
+    if _field.page not in PAGES or _field.type not in FIELD_TYPES:
+        raise ValueError(f"Invalid field definition {_field}")
+if len(set(COLUMNS)) != len(COLUMNS):
+    raise ValueError("Duplicate columns in FIELDS")
+
+
+def column_definitions(value_type):
+    # value_type für Zahlenfelder (TEXT oder REAL, siehe create_schema)
+    return [f"{field.column} {value_type if field.type == 'number' else 'TEXT'}" for field in FIELDS]
+
+
+def page_dataclasses():
+    # {Seite: Dataclass mit timestamp und den Feldern der Seite}
+    return {page: make_dataclass(name, [('timestamp', datetime)]
+                                 + [(column, str) for column in PAGE_COLUMNS[page]])
+            for page, name in PAGES.items()}
+
+
+PAGE_CLASSES = page_dataclasses()
+WpStatus, WpData, WpEnergy = PAGE_CLASSES.values()
+
+
+def page_objects(timestamp, values):
+    # Eine Zeile (Werte in der Reihenfolge von COLUMNS) als Objekte je Seite, z.B. zum Debuggen
+    by_column = dict(zip(COLUMNS, values))
+    return [cls(timestamp, *[by_column[column] for column in PAGE_COLUMNS[page]])
+            for page, cls in PAGE_CLASSES.items()]
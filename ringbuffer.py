@@ -0,0 +1,154 @@
+import math
+import threading
+from array import array
+
+from values import to_number
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+
+class SampleRing:
+    # Die letzten capacity Stichproben eines Geräts im Speicher, eine array('d') je Spalte plus
+    # eine für die Zeitstempel (Sekunden seit 1970). Speicher wird beim Anlegen einmal belegt:
+    #   (Spalten + 1) * capacity * 8 Byte, bei 86 Feldern und 24 h mit 1 Hz
+    #   87 * 86400 * 8 = 60,1 MB (1 h: 2,5 MB)
+    # append() überschreibt den ältesten Eintrag, fehlende oder nicht numerische Werte sind NaN.
+    # Fenster zählen ab dem neuesten Zeitstempel (Uhr des ISG); mit numpy werden die Abfragen
+    # vektorisiert auf Sichten der Arrays gerechnet, sonst in reinem Python.
+
+    def __init__(self, columns, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.appended = 0
+        self._index = {column: i for i, column in enumerate(self.columns)}
+        self._times = array('d', [NAN]) * capacity
+        self._values = [array('d', [NAN]) * capacity for _ in self.columns]
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return (len(self._values) + 1) * self.capacity * self._times.itemsize
+
+    def append(self, timestamp, values):
+        # values in der Reihenfolge von columns, als Zahl oder ISG-Text ("21,5 °C")
+        seconds = timestamp.timestamp()
+        with self._lock:
+            i = self._next
+            self._times[i] = seconds
+            for column, value in zip(self._values, values):
+                if value.__class__ is not float:
+                    value = to_number(value) if value is not None else None
+                column[i] = NAN if value is None else value
+            self._next = i + 1 if i + 1 < self.capacity else 0
+            if self._size < self.capacity:
+                self._size += 1
+            self.appended += 1
+
+    def latest(self):
+        # (Sekunden seit 1970, {Spalte: Wert}) des neuesten Eintrags oder None
+        with self._lock:
+            if not self._size:
+                return None
+            i = self._next - 1
+            return self._times[i], {column: self._values[n][i] for column, n in self._index.items()}
+
+    def window(self, column, seconds):
+        # (Zeitstempel, Werte) der letzten seconds Sekunden ohne NaN; numpy-Arrays oder Listen
+        values = self._values[self._index[column]]
+        with self._lock:
+            if not self._size:
+                return [], []
+            start = self._start(self._times[self._next - 1] - seconds)
+            parts = self._slices(start)
+            if not parts:
+                return [], []
+            if numpy is not None:
+                times = numpy.concatenate([numpy.frombuffer(self._times, dtype='d')[a:b] for a, b in parts])
+                data = numpy.concatenate([numpy.frombuffer(values, dtype='d')[a:b] for a, b in parts])
+            else:
+                times = [t for a, b in parts for t in self._times[a:b]]
+                data = [v for a, b in parts for v in values[a:b]]
+        if numpy is not None:
+            valid = ~numpy.isnan(data)
+            return times[valid], data[valid]
+        pairs = [(t, v) for t, v in zip(times, data) if v == v]
+        return [t for t, _ in pairs], [v for _, v in pairs]
+
+    def summary(self, column, seconds):
+        # count, mean, min, max und slope (Steigung der Ausgleichsgeraden je Sekunde) im Fenster
+        times, data = self.window(column, seconds)
+        count = len(data)
+        if not count:
+            return {'count': 0, 'mean': NAN, 'min': NAN, 'max': NAN, 'slope': NAN}
+        if numpy is not None:
+            mean = float(data.mean())
+            low, high = float(data.min()), float(data.max())
+            offsets = times - times.mean()
+            spread = float((offsets * offsets).sum())
+            slope = float((offsets * (data - mean)).sum()) / spread if spread else NAN
+        else:
+            mean = math.fsum(data) / count
+            low, high = min(data), max(data)
+            time_mean = math.fsum(times) / count
+            spread = math.fsum((t - time_mean) ** 2 for t in times)
+            slope = (math.fsum((t - time_mean) * (v - mean) for t, v in zip(times, data)) / spread
+                     if spread else NAN)
+        return {'count': count, 'mean': mean, 'min': low, 'max': high, 'slope': slope}
+
+    def mean(self, column, seconds):
+        return self.summary(column, seconds)['mean']
+
+    def min(self, column, seconds):
+        return self.summary(column, seconds)['min']
+
+    def max(self, column, seconds):
+        return self.summary(column, seconds)['max']
+
+    def slope(self, column, seconds):
+        return self.summary(column, seconds)['slope']
+
+    def stats(self):
+        return {
+            'samples': self._size,
+            'capacity': self.capacity,
+            'appended': self.appended,
+            'memory_bytes': self.nbytes,
+            'span_seconds': self._times[self._next - 1] - self._times[self._oldest()] if self._size else 0.0,
+        }
+
+    def _oldest(self):
+        return self._next if self._size == self.capacity else 0
+
+    def _slices(self, start):
+        # Physische Bereiche ab dem logischen Index start (0 = ältester Eintrag) bis zum neuesten
+        first = (self._oldest() + start) % self.capacity
+        end = self._next if self._next else self.capacity
+        if start >= self._size:
+            return []
+        if first < end:
+            return [(first, end)]
+        return [(first, self.capacity), (0, self._next)]
+
+    def _start(self, since):
+        # Binäre Suche nach dem ersten logischen Index mit Zeitstempel > since
+        oldest = self._oldest()
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._times[(oldest + middle) % self.capacity] <= since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
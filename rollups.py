@@ -0,0 +1,235 @@
+import re
+from datetime import datetime
+
+from devices import DEFAULT_DEVICE
+from values import to_number
+
+RESOLUTIONS = ('minute', 'hour', 'day')
+
+# Zählerstände: statt Mittelwerten zählt die Zunahme je Zeitraum (delta)
+COUNTER_RE = re.compile(r'^(waermemenge_(vd|nhz)_.*|leistungsaufnahme_vd_.*|laufzeit_.*|starts_.*)$')
+# Fällt ein Zähler unter diesen Anteil des Vorwerts, wurde er zurückgesetzt (z.B. *_tag um Mitternacht)
+COUNTER_RESET_RATIO = 0.5
+
+DEFAULT_FIELDS = [
+    'aussentemperatur', 'vorlauftemperatur', 'ruecklauftemperatur', 'warmwasser_ist', 'raumtemp_ist',
+    'hk1_ist', 'inverter_aufnahmeleistung', 'istdrehzahl_verdichter', 'druck_hochdruck',
+    'druck_niederdruck', 'wp_wasservolumenstrom', 'heissgastemperatur', 'verdampfertemperatur',
+    'waermemenge_vd_heizen_summe', 'waermemenge_vd_warmwasser_summe', 'waermemenge_nhz_heizen_summe',
+    'waermemenge_nhz_warmwasser_summe', 'leistungsaufnahme_vd_heizen_summe',
+    'leistungsaufnahme_vd_warmwasser_summe', 'laufzeit_vd_heizen', 'laufzeit_vd_warmwasser',
+    'laufzeit_vd_abtauen', 'laufzeit_nhz_1', 'laufzeit_nhz_2', 'starts_verdichter',
+]
+
+ROLLUP_COLUMNS = ['bucket', 'device_id', 'field', 'count', 'sum', 'min', 'max', 'last', 'last_ts', 'delta']
+
+# Ein Eintrag je Gerät, Feld und Zeitraum. avg ergibt sich aus sum / count, damit sich
+# Teilergebnisse (z.B. nach einem Neustart mitten in der Stunde) exakt zusammenführen lassen.
+ROLLUP_SCHEMA = ''.join(f'''
+    CREATE TABLE IF NOT EXISTS rollup_{resolution} (
+    bucket TIMESTAMP NOT NULL,
+    device_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sum DOUBLE PRECISION NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    last REAL NOT NULL,
+    last_ts TIMESTAMP NOT NULL,
+    delta DOUBLE PRECISION,
+    avg REAL GENERATED ALWAYS AS (sum / count) STORED,
+    PRIMARY KEY (device_id, field, bucket)
+    );
+''' for resolution in RESOLUTIONS) + f'''
+    -- Zeitreihe eines Felds in der gröbsten Auflösung, die noch genug Punkte liefert
+    CREATE OR REPLACE FUNCTION rollup_series(field_name TEXT, start_ts TIMESTAMP, end_ts TIMESTAMP,
+                                             device TEXT DEFAULT '{DEFAULT_DEVICE}')
+    RETURNS TABLE (bucket TIMESTAMP, min REAL, max REAL, avg REAL, last REAL, delta DOUBLE PRECISION) AS $$
+    BEGIN
+        RETURN QUERY EXECUTE format(
+            'SELECT bucket, min, max, avg, last, delta FROM %I
+             WHERE device_id = $1 AND field = $2 AND bucket >= $3 AND bucket < $4 ORDER BY bucket',
+            CASE WHEN end_ts - start_ts <= INTERVAL '2 days' THEN 'rollup_minute'
+                 WHEN end_ts - start_ts <= INTERVAL '120 days' THEN 'rollup_hour'
+                 ELSE 'rollup_day' END)
+        USING device, field_name, start_ts, end_ts;
+    END
+    $$ LANGUAGE plpgsql STABLE;
+'''
+
+
+def rollup_insert(resolution):
+    # Upsert: ein Teilergebnis wird mit dem vorhandenen Eintrag zusammengeführt
+    return f'''
+    INSERT INTO rollup_{resolution} AS r ({", ".join(ROLLUP_COLUMNS)}) VALUES %s
+    ON CONFLICT (device_id, field, bucket) DO UPDATE SET
+        count = r.count + EXCLUDED.count,
+        sum = r.sum + EXCLUDED.sum,
+        min = LEAST(r.min, EXCLUDED.min),
+        max = GREATEST(r.max, EXCLUDED.max),
+        last = CASE WHEN EXCLUDED.last_ts >= r.last_ts THEN EXCLUDED.last ELSE r.last END,
+        last_ts = GREATEST(r.last_ts, EXCLUDED.last_ts),
+        delta = r.delta + EXCLUDED.delta
+'''
+
+
+def truncate(timestamp, resolution):
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def counter_delta(previous, value):
+    if previous is None:
+        return 0.0
+    if value >= previous:
+        return value - previous
+    if value < previous * COUNTER_RESET_RATIO:
+        return value
+    return 0.0
+
+
+def merge(a, b):
+    # Zwei Teilergebnisse desselben Eintrags (Zeilen im Format von ROLLUP_COLUMNS)
+    newer = b if b[8] >= a[8] else a
+    delta = None if a[9] is None else a[9] + b[9]
+    return (a[0], a[1], a[2], a[3] + b[3], a[4] + b[4], min(a[5], b[5]), max(a[6], b[6]),
+            newer[7], newer[8], delta)
+
+
+def combine_rows(rows):
+    # Mehrfache Einträge je Schlüssel in einem Batch vorab zusammenführen, sonst
+    # scheitert ON CONFLICT DO UPDATE ("cannot affect row a second time")
+    combined = {}
+    for row in rows:
+        key = (row[0], row[1], row[2])
+        combined[key] = merge(combined[key], row) if key in combined else row
+    return list(combined.values())
+
+
+class RollupAggregator:
+    # Sammelt die Werte der laufenden Minute eines Geräts. Ist die Minute vorbei, geht ihr
+    # Ergebnis als Teilergebnis in alle drei Tabellen; Stunde und Tag wachsen so minütlich mit.
+
+    def __init__(self, device_id, columns, fields=None):
+        fields = DEFAULT_FIELDS if fields is None else fields
+        self.device_id = device_id
+        self.fields = [(columns.index(field), field, bool(COUNTER_RE.match(field)))
+                       for field in fields if field in columns]
+        self.rows_emitted = 0
+        self._minute = None
+        self._open = {}
+        self._previous = {}
+
+    def add(self, timestamp, row):
+        # row: Werte in der Reihenfolge von columns; liefert (Auflösung, Zeile) abgeschlossener Minuten
+        minute = truncate(timestamp, 'minute')
+        closed = self.flush() if self._minute is not None and minute != self._minute else []
+        self._minute = minute
+
+        for index, field, counter in self.fields:
+            value = row[index]
+            if value is not None and not isinstance(value, float):
+                value = to_number(value)
+            if value is None:
+                continue
+            delta = None
+            if counter:
+                delta = counter_delta(self._previous.get(field), value)
+                self._previous[field] = value
+
+            current = self._open.get(field)
+            if current is None:
+                self._open[field] = [1, value, value, value, value, timestamp, delta]
+            else:
+                current[0] += 1
+                current[1] += value
+                current[2] = min(current[2], value)
+                current[3] = max(current[3], value)
+                current[4] = value
+                current[5] = timestamp
+                if counter:
+                    current[6] += delta
+        return closed
+
+    def flush(self):
+        # Laufende Minute abschließen, auch beim Beenden
+        rows = []
+        for field, (count, total, low, high, last, last_ts, delta) in self._open.items():
+            for resolution in RESOLUTIONS:
+                rows.append((resolution, (truncate(self._minute, resolution), self.device_id, field,
+                                          count, total, low, high, last, last_ts, delta)))
+        self._open = {}
+        self.rows_emitted += len(rows)
+        return rows
+
+    def stats(self):
+        return {'fields': len(self.fields), 'rows_emitted': self.rows_emitted}
+
+
+def rebuild_sql(fields, numeric, since=None):
+    # Minutenwerte aus den Rohdaten, Stunden und Tage daraus; since wird auf den Tag abgerundet
+    counters = [field for field in fields if COUNTER_RE.match(field)]
+    values = ',\n                '.join(
+        f"('{field}', {f'd.{field}' if numeric else f'isg_number(d.{field})'}::DOUBLE PRECISION)"
+        for field in fields)
+    since_filter = 'WHERE d.timestamp >= %(since)s - INTERVAL \'1 day\'' if since else ''
+    bucket_filter = 'AND timestamp >= %(since)s' if since else ''
+    delete_filter = 'WHERE bucket >= %(since)s' if since else ''
+
+    statements = [f'DELETE FROM rollup_{resolution} {delete_filter}' for resolution in RESOLUTIONS]
+    statements.append(f'''
+        INSERT INTO rollup_minute ({", ".join(ROLLUP_COLUMNS)})
+        SELECT date_trunc('minute', timestamp), device_id, field, count(*), sum(value), min(value),
+               max(value), (array_agg(value ORDER BY timestamp DESC))[1], max(timestamp),
+               CASE WHEN field = ANY(%(counters)s) THEN sum(
+                   CASE WHEN previous IS NULL THEN 0
+                        WHEN value >= previous THEN value - previous
+                        WHEN value < previous * {COUNTER_RESET_RATIO} THEN value
+                        ELSE 0 END) END
+        FROM (
+            SELECT d.timestamp, d.device_id, f.field, f.value,
+                   lag(f.value) OVER (PARTITION BY d.device_id, f.field ORDER BY d.timestamp) AS previous
+            FROM data AS d
+            CROSS JOIN LATERAL (VALUES
+                {values}
+            ) AS f(field, value)
+            {since_filter}
+        ) AS samples
+        WHERE value IS NOT NULL {bucket_filter}
+        GROUP BY 1, 2, 3
+    ''')
+    for resolution, source in (('hour', 'minute'), ('day', 'hour')):
+        statements.append(f'''
+        INSERT INTO rollup_{resolution} ({", ".join(ROLLUP_COLUMNS)})
+        SELECT date_trunc('{resolution}', bucket), device_id, field, sum(count), sum(sum), min(min),
+               max(max), (array_agg(last ORDER BY last_ts DESC))[1], max(last_ts), sum(delta)
+        FROM rollup_{source} {delete_filter}
+        GROUP BY 1, 2, 3
+    ''')
+    return statements, {'since': since, 'counters': counters}
+
+
+def rebuild_rollups(conn, fields, numeric, since=None):
+    # Nachberechnung aus data in einer Transaktion; der laufende Scraper sollte dabei gestoppt sein
+    statements, params = rebuild_sql(fields, numeric, since)
+    if since is not None:
+        params['since'] = datetime(since.year, since.month, since.day)
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            for statement in statements:
+                cur.execute(statement, params)
+                if statement.lstrip().startswith('INSERT'):
+                    print(f"{statement.split()[2]}: {cur.rowcount} rows")
+            for resolution in RESOLUTIONS:
+                cur.execute(f'ANALYZE rollup_{resolution}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
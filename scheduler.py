@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+
+POLICIES = ('skip', 'catch-up', 'coalesce')
+
+
+class Job:
+    # Läuft auf festen Terminen start + n * period (monotone Uhr), unabhängig
+    # davon, wie lange der einzelne Lauf dauert. Ist ein Lauf über den nächsten
+    # Termin hinaus gelaufen, entscheidet die Policy:
+    #   skip      verpasste Termine auslassen, weiter am nächsten Termin im Raster
+    #   catch-up  verpasste Termine direkt nacheinander nachholen (max. max_backlog)
+    #   coalesce  verpasste Termine zu einem sofortigen Lauf zusammenfassen
+
+    def __init__(self, fn, period, policy='skip', name=None, max_backlog=10):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.fn = fn
+        self.period = period
+        self.policy = policy
+        self.name = name or getattr(fn, '__name__', 'job')
+        self.max_backlog = max_backlog
+        self.deadline = None
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.missed = 0
+        self.lateness_max = 0.0
+        self.lateness_total = 0.0
+        self.duration_max = 0.0
+        self.duration_last = 0.0
+        self._first_start = None
+        self._recent = deque(maxlen=60)
+        self._requested = None
+
+    def run(self, now, clock):
+        lateness = max(now - self.deadline, 0.0)
+        self.lateness_total += lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+        if self._first_start is None:
+            self._first_start = now
+        self._recent.append(now)
+
+        try:
+            self.fn()
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        finally:
+            self.runs += 1
+
+        finished = clock()
+        self.duration_last = finished - now
+        self.duration_max = max(self.duration_max, self.duration_last)
+        if self.duration_last > self.period:
+            self.overruns += 1
+
+        if self._requested is not None:
+            self.deadline, self._requested = self._requested, None
+        else:
+            self._advance(finished)
+
+    def reschedule(self, deadline):
+        # Der laufende Job legt seinen nächsten Termin selbst fest (monotone Uhr)
+        self._requested = deadline
+
+    def _advance(self, now):
+        self.deadline += self.period
+        if self.deadline > now:
+            return
+
+        behind = int((now - self.deadline) // self.period) + 1
+        if self.policy == 'skip':
+            self.missed += behind
+            self.deadline += behind * self.period
+        elif self.policy == 'catch-up':
+            if behind > self.max_backlog:
+                skipped = behind - self.max_backlog
+                self.missed += skipped
+                self.deadline += skipped * self.period
+        else:
+            # Ein Lauf sofort für alle verpassten Termine, danach wieder im Raster
+            self.missed += behind - 1
+            self.deadline += (behind - 1) * self.period
+
+    def stats(self):
+        recent = self._recent
+        elapsed = recent[-1] - self._first_start if recent else 0.0
+        recent_elapsed = recent[-1] - recent[0] if recent else 0.0
+        return {
+            'runs': self.runs,
+            'errors': self.errors,
+            'overruns': self.overruns,
+            'missed_ticks': self.missed,
+            'lateness_avg_seconds': self.lateness_total / self.runs if self.runs else 0.0,
+            'lateness_max_seconds': self.lateness_max,
+            'duration_last_seconds': self.duration_last,
+            'duration_max_seconds': self.duration_max,
+            'rate_hz': (self.runs - 1) / elapsed if elapsed > 0 else 0.0,
+            'recent_rate_hz': (len(recent) - 1) / recent_elapsed if recent_elapsed > 0 else 0.0,
+        }
+
+
+class DeadlineScheduler:
+    # Ohne executor laufen die Jobs nacheinander im aufrufenden Thread. Mit
+    # executor (z.B. ThreadPoolExecutor) laufen fällige Jobs parallel; ein Job
+    # wird erst nach dem Ende seines Laufs wieder eingeplant, läuft also nie
+    # doppelt, und verpasste Termine werden nach seiner Policy behandelt.
+
+    def __init__(self, clock=time.monotonic, executor=None):
+        self.clock = clock
+        self.executor = executor
+        self.jobs = []
+        self._heap = []
+        self._sequence = itertools.count()
+        self._cv = threading.Condition()
+        self._stopped = False
+
+    def add(self, fn, period, policy='skip', name=None, delay=0.0):
+        job = Job(fn, period, policy, name)
+        job.deadline = self.clock() + delay
+        self.jobs.append(job)
+        self._push(job)
+        return job
+
+    def run_once(self):
+        with self._cv:
+            while not self._stopped:
+                if not self._heap:
+                    self._cv.wait()
+                    continue
+                wait = self._heap[0][0] - self.clock()
+                if wait <= 0:
+                    break
+                self._cv.wait(wait)
+            if self._stopped:
+                return False
+            _, _, job = heapq.heappop(self._heap)
+
+        if self.executor is None:
+            self._run(job)
+        else:
+            self.executor.submit(self._run, job)
+        return True
+
+    def run(self):
+        while self.run_once():
+            pass
+
+    def stop(self):
+        with self._cv:
+            self._stopped = True
+            self._cv.notify_all()
+
+    def _run(self, job):
+        try:
+            job.run(self.clock(), self.clock)
+        finally:
+            self._push(job)
+
+    def _push(self, job):
+        with self._cv:
+            heapq.heappush(self._heap, (job.deadline, next(self._sequence), job))
+            self._cv.notify()
@@ -1,235 +1,280 @@
+import argparse
+import hashlib
+import io
+import math
 import os
+import random
 import re
+import signal
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
+from html.parser import HTMLParser
 
 import psycopg2
 import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from schedule import every, repeat, run_pending
+from requests.adapters import HTTPAdapter
 
+from archive import PageArchive
+from breaker import CircuitBreaker
+from changes import CHANGES_INSERT, CHANGES_SCHEMA, ChangeRecorder, parse_deadbands
+from coldstore import ColdStore, tier_data
+from derived import DERIVED_INSERT, DERIVED_SCHEMA, DerivedMetrics
+from derived import combine_rows as combine_derived
+from devices import DEFAULT_DEVICE, load_devices
+from events import EVENTS_INSERT, EVENTS_SCHEMA, EventDetector, rebuild_events
+from events import combine_rows as combine_events
+from export import EXPORT_FORMATS, export_days
+from metrics import MetricsServer
+from partitions import (BRIN_INDEX_SQL, DEVICE_INDEX_SQL, ensure_partitions, is_partitioned,
+                        maintain_partitions, migrate_partitions)
+from refresh import RefreshTracker
+from registry import COLUMNS, LOOKUPS, NUMBER_COLUMNS, PAGE_COLUMNS, PAGES, UNITS, column_definitions
+from ringbuffer import SampleRing
+from rollups import (DEFAULT_FIELDS, RESOLUTIONS, ROLLUP_SCHEMA, RollupAggregator, combine_rows,
+                     rebuild_rollups, rollup_insert)
+from profiling import PROFILE_MODES, CycleProfiler
+from scheduler import POLICIES, DeadlineScheduler
+from spool import Spool
+from timing import StageTimer
+from values import number_function_sql, to_number
+from writer import BatchWriter
 
-@dataclass
-class WpData:
-    timestamp: datetime
-    # Prozessdaten
-    ruecklauftemperatur: str
-    vorlauftemperatur: str
-    frostschutztemperatur: str
-    aussentemperatur: str
-    verdampfertemperatur: str
-    verdichtereintrittstemperatur: str
-    heissgastemperatur: str
-    verfluessigertemperatur: str
-    oelsumpftemperatur: str
-    druck_niederdruck: str
-    druck_hochdruck: str
-    wp_wasservolumenstrom: str
-    strom_inverter: str
-    spannung_inverter: str
-    istdrehzahl_verdichter: str
-    solldrehzahl_verdichter: str
-    luefterleistung_rel: str
-    verdampfereintrittstemperatur: str
-    expansionsventileintrittstemperatur: str
-    inverter_aufnahmeleistung: str
-    # Starts
-    starts_verdichter: str
-    # Wärmemenge
-    waermemenge_vd_heizen_tag: str
-    waermemenge_vd_heizen_summe: str
-    waermemenge_vd_warmwasser_tag: str
-    waermemenge_vd_warmwasser_summe: str
-    waermemenge_nhz_heizen_summe: str
-    waermemenge_nhz_warmwasser_summe: str
-    # Leistungsaufnahme
-    leistungsaufnahme_vd_heizen_tag: str
-    leistungsaufnahme_vd_heizen_summe: str
-    leistungsaufnahme_vd_warmwasser_tag: str
-    leistungsaufnahme_vd_warmwasser_summe: str
-    laufzeit_vd_heizen: str
-    laufzeit_vd_warmwasser: str
-    laufzeit_vd_kuehlen: str
-    laufzeit_vd_abtauen: str
-    laufzeit_nhz_1: str
-    laufzeit_nhz_2: str
-    laufzeit_nhz_1_2: str
-    laufzeit_zeit_abtauen: str
-    laufzeit_starts_abtauen: str
+# Standardwerte, werden in __main__ aus der Umgebung überschrieben
+FETCH_CONCURRENT = False
+FETCH_TIMING = False
+FETCH_TIMEOUT = (3.05, 5.0)  # Verbindungsaufbau, Lesen in Sekunden
+FETCH_RETRIES = 2
+FETCH_RETRY_BACKOFF = 0.2
+EXTRACT_BACKEND = 'bs4'
+NUMERIC_STORAGE = False
+NUMERIC_TYPES = ('real', 'double precision', 'numeric')
+RECORD_MODES = ('full', 'changes', 'both')
+RECORD_MODE = 'full'
+# Abrufintervall in Sekunden je Seite (?s=...), dazwischen wird der letzte Stand verwendet
+POLL_INTERVALS = {}
+PARTITION_MONTHS_AHEAD = 2
+PAGE_QUERIES = tuple(PAGES)  # Status, Wärmepumpe, Energie
+TIMESTAMP_RE = re.compile(r'var timestampunterschied = (\d+) \* 1000')
 
+# Name -> Funktion, die ein dict mit Kennzahlen liefert (siehe report_stats)
+stats_sources = {}
 
-@dataclass
-class WpStatus:
-    raumtemp_ist: str
-    raumtemp_soll: str
-    raumfeuchte: str
-    taupunkttemp: str
-    timestamp: datetime
-    warmwasser_ist: str
-    warmwasser_soll: str
-    warmwasser_volumenstrom: str
-    kuehlen_ist: str
-    kuehlen_soll: str
-    aussentemp: str
-    hk1_ist: str
-    hk1_soll: str
-    vorlaufisttemp_wp: str
-    vorlaufisttemp_nhz: str
-    ruecklaufisttemp_wp: str
-    pufferisttemp: str
-    puffersolltemp: str
-    heizungsdruck: str
-    frostschutz: str
 
+def env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
-@dataclass
-class WpEnergy:
-    timestamp: datetime
-    waermemenge_heizen_1_24_h: str
-    waermemenge_heizen_1_12_m: str
-    waermemenge_heizen_13_24_m: str
-    waermemenge_kuehlen_1_24_h: str
-    waermemenge_kuehlen_1_12_m: str
-    waermemenge_kuehlen_13_24_m: str
-    waermemenge_warmwasser_1_24_h: str
-    waermemenge_warmwasser_1_12_m: str
-    waermemenge_warmwasser_13_24_m: str
-    effizienz_heizen_1_24_h: str
-    effizienz_heizen_1_12_m: str
-    effizienz_heizen_13_24_m: str
-    effizienz_kuehlen_1_24_h: str
-    effizienz_kuehlen_1_12_m: str
-    effizienz_kuehlen_13_24_m: str
-    effizienz_warmwasser_1_24_h: str
-    effizienz_warmwasser_1_12_m: str
-    effizienz_warmwasser_13_24_m: str
-    stromverbrauch_heizen_1_24_h: str
-    stromverbrauch_heizen_1_12_m: str
-    stromverbrauch_heizen_13_24_m: str
-    stromverbrauch_kuehlen_1_24_h: str
-    stromverbrauch_kuehlen_1_12_m: str
-    stromverbrauch_kuehlen_13_24_m: str
-    stromverbrauch_warmwasser_1_24_h: str
-    stromverbrauch_warmwasser_1_12_m: str
-    stromverbrauch_warmwasser_13_24_m: str
-
-
-def create_schema():
+
+def connect():
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+        )
+
+
+def create_session(pool_size=3):
+    # Keep-Alive: alle Seiten eines Zyklus teilen sich die TCP-Verbindungen zum ISG
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+
+session = create_session()
+fetch_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='fetch')
+page_cache = {}
+page_stats = {'fetched': 0, 'parsed': 0, 'unchanged': 0, 'reused': 0, 'retries': 0, 'failed': 0}
+# Laufzeiten je Stufe: fetch/parse je Seite, extract, store (Übergabe an den Writer), insert (Writer)
+stage_timer = StageTimer()
+profiler = CycleProfiler()
+archive = None
+
+
+# Schlüsselspalten vor den Messwerten, die Messwerte kommen aus registry.FIELDS
+KEY_COLUMNS = ['timestamp', 'device_id', 'missing_pages']
+DATA_COLUMNS = KEY_COLUMNS + COLUMNS
+FIRST_VALUE = len(KEY_COLUMNS)
+VALUE_COLUMNS = DATA_COLUMNS[FIRST_VALUE:]
+NUMBER_FIELDS = tuple(column in NUMBER_COLUMNS for column in VALUE_COLUMNS)
+
+DATA_INSERT = f'INSERT INTO data ({", ".join(DATA_COLUMNS)}) VALUES %s'
+# Serverseitig vorbereitet: je Zeile gehen nur noch die Werte über die Leitung (execute_batch)
+DATA_PREPARE = (f'PREPARE data_insert AS INSERT INTO data ({", ".join(DATA_COLUMNS)}) '
+                f'VALUES ({", ".join(f"${i}" for i in range(1, len(DATA_COLUMNS) + 1))})')
+DATA_EXECUTE = f'EXECUTE data_insert ({", ".join(["%s"] * len(DATA_COLUMNS))})'
+
+
+def create_schema(value_type='TEXT', partitioned=False):
+    # partitioned wirkt nur beim Anlegen, bestehende Tabellen stellt migrate-partitions um
     c = conn.cursor()
 
-    c.execute('''
+    definitions = column_definitions(value_type)
+    columns = ',\n    '.join(definitions)
+    c.execute(f'''
     CREATE TABLE IF NOT EXISTS data (
     timestamp TIMESTAMP,
-    raumtemp_ist TEXT,
-    raumtemp_soll TEXT,
-    raumfeuchte TEXT,
-    taupunkttemp TEXT,
-    warmwasser_ist TEXT,
-    warmwasser_soll TEXT,
-    warmwasser_volumenstrom TEXT,
-    kuehlen_ist TEXT,
-    kuehlen_soll TEXT,
-    aussentemp TEXT,
-    hk1_ist TEXT,
-    hk1_soll TEXT,
-    vorlaufisttemp_wp TEXT,
-    vorlaufisttemp_nhz TEXT,
-    ruecklaufisttemp_wp TEXT,
-    pufferisttemp TEXT,
-    puffersolltemp TEXT,
-    heizungsdruck TEXT,
-    frostschutz TEXT,
-    ruecklauftemperatur TEXT,
-    vorlauftemperatur TEXT,
-    frostschutztemperatur TEXT,
-    aussentemperatur TEXT,
-    verdampfertemperatur TEXT,
-    verdichtereintrittstemperatur TEXT,
-    heissgastemperatur TEXT,
-    verflüssigertemperatur TEXT,
-    oelsumpftemperatur TEXT,
-    druck_niederdruck TEXT,
-    druck_hochdruck TEXT,
-    wp_wasservolumenstrom TEXT,
-    strom_inverter TEXT,
-    spannung_inverter TEXT,
-    istdrehzahl_verdichter TEXT,
-    solldrehzahl_verdichter TEXT,
-    luefterleistung_rel TEXT,
-    verdampfereintrittstemperatur TEXT,
-    expansionsventileintrittstemperatur TEXT,
-    inverter_aufnahmeleistung TEXT,
-    starts_verdichter TEXT,
-    waermemenge_vd_heizen_tag TEXT,
-    waermemenge_vd_heizen_summe TEXT,
-    waermemenge_vd_warmwasser_tag TEXT,
-    waermemenge_vd_warmwasser_summe TEXT,
-    waermemenge_nhz_heizen_summe TEXT,
-    waermemenge_nhz_warmwasser_summe TEXT,
-    leistungsaufnahme_vd_heizen_tag TEXT,
-    leistungsaufnahme_vd_heizen_summe TEXT,
-    leistungsaufnahme_vd_warmwasser_tag TEXT,
-    leistungsaufnahme_vd_warmwasser_summe TEXT,
-    laufzeit_vd_heizen TEXT,
-    laufzeit_vd_warmwasser TEXT,
-    laufzeit_vd_kuehlen TEXT,
-    laufzeit_vd_abtauen TEXT,
-    laufzeit_nhz_1 TEXT,
-    laufzeit_nhz_2 TEXT,
-    laufzeit_nhz_1_2 TEXT,
-    laufzeit_zeit_abtauen TEXT,
-    laufzeit_starts_abtauen TEXT
-    )
+    {columns}
+    ) {'PARTITION BY RANGE (timestamp)' if partitioned else ''}
 ''')
 
-    c.execute('''
-    ALTER TABLE data
-            ADD COLUMN IF NOT EXISTS waermemenge_heizen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_heizen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_heizen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_kuehlen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_kuehlen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_kuehlen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_warmwasser_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_warmwasser_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS waermemenge_warmwasser_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_heizen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_heizen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_heizen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_kuehlen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_kuehlen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_kuehlen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_warmwasser_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_warmwasser_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS effizienz_warmwasser_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_heizen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_heizen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_heizen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_kuehlen_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_kuehlen_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_kuehlen_13_24_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_warmwasser_1_24_h TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_warmwasser_1_12_m TEXT,
-            ADD COLUMN IF NOT EXISTS stromverbrauch_warmwasser_13_24_m TEXT;
+    # Felder, die nach dem Anlegen der Tabelle in registry.FIELDS dazugekommen sind
+    c.execute('ALTER TABLE data\n' + ',\n'.join(f'ADD COLUMN IF NOT EXISTS {definition}'
+                                               for definition in definitions))
+
+    # Bestehende Zeilen gehören zum Standardgerät; mit DEFAULT ohne Umschreiben der Tabelle
+    c.execute(f'''
+    ALTER TABLE data ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT '{DEFAULT_DEVICE}';
+    ALTER TABLE data ADD COLUMN IF NOT EXISTS missing_pages TEXT;
 ''')
 
-    c.execute('''
-    CREATE INDEX IF NOT EXISTS idx_data_timestamp ON data (timestamp);
+    if is_partitioned(conn):
+        # Zeilen kommen zeitlich sortiert an, ein BRIN-Index ist um Größenordnungen kleiner als der
+        # B-Baum auf timestamp; (device_id, timestamp) bleibt für Abfragen je Gerät
+        ensure_partitions(conn, PARTITION_MONTHS_AHEAD)
+        c.execute(BRIN_INDEX_SQL)
+        c.execute(DEVICE_INDEX_SQL)
+    else:
+        c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_data_timestamp ON data (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_data_device_timestamp ON data (device_id, timestamp);
 ''')
 
     conn.commit()
 
 
-def parse(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raises an HTTPError for bad responses
-        return BeautifulSoup(response.text, 'html.parser')
-    except requests.RequestException as e:
-        print(f"Error fetching data from {url}: {e}")
+def data_column_types():
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'data' AND column_name <> ALL(%s)
+            ORDER BY ordinal_position
+        ''', (KEY_COLUMNS,))
+        return dict(cur.fetchall())
+
+
+def number_column_types():
+    # Textfelder (registry.Field.type) bleiben bei jeder Speicherart TEXT
+    return {data_type for column, data_type in data_column_types().items() if column in NUMBER_COLUMNS}
+
+
+def migrate_numeric():
+    # Einmalige Umstellung: TEXT-Spalten werden in einem Durchlauf auf REAL umgeschrieben
+    text_columns = [column for column, data_type in data_column_types().items()
+                    if data_type == 'text' and column in NUMBER_COLUMNS]
+    if not text_columns:
+        print("Table data already uses numeric columns.")
+        return
+
+    with conn.cursor() as cur:
+        cur.execute(number_function_sql())
+        alterations = ',\n'.join(f'ALTER COLUMN "{column}" TYPE REAL USING isg_number("{column}")'
+                                  for column in text_columns)
+        start = time.perf_counter()
+        cur.execute(f'ALTER TABLE data\n{alterations}')
+        cur.execute('ANALYZE data')
+    conn.commit()
+    print(f"Migrated {len(text_columns)} columns to REAL in {time.perf_counter() - start:.1f}s.")
+
+
+def fetch_text(url, http=None):
+    # Begrenzte Wartezeit je Versuch; Wiederholung nur bei Verbindungsfehlern, Timeouts und 5xx,
+    # mit zufälliger Wartezeit bis FETCH_RETRY_BACKOFF * 2^Versuch (full jitter)
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            response = (http or requests).get(url, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()  # Raises an HTTPError for bad responses
+            return response.text
+        except requests.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            if attempt == FETCH_RETRIES or (status is not None and status < 500):
+                print(f"Error fetching data from {url}: {e}")
+                page_stats['failed'] += 1
+                return None
+        page_stats['retries'] += 1
+        time.sleep(random.uniform(0, FETCH_RETRY_BACKOFF * 2 ** attempt))
+
+
+def parse(url, http=None, backend=None, cache=None):
+    extract_page = EXTRACT_BACKENDS[backend or EXTRACT_BACKEND]
+    query = url.rsplit('?s=', 1)[-1]
+    start = time.perf_counter()
+    text = fetch_text(url, http)
+    if text is None:
         return None
+    parse_start = time.perf_counter()
+    stage_timer.record(f'fetch {query}', parse_start - start)
+    page_stats['fetched'] += 1
+    if cache is None:
+        page_stats['parsed'] += 1
+        page = extract_page([text])
+        stage_timer.record(f'parse {query}', time.perf_counter() - parse_start)
+        return page
+
+    # Die Uhrzeit im Skript ändert sich jede Sekunde und zählt nicht zum Inhalt der Seite
+    match = TIMESTAMP_RE.search(text)
+    content = text[:match.start(1)] + text[match.end(1):] if match else text
+    digest = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+    cached = cache.get(url)
+    if cached is not None and cached.digest == digest:
+        page_stats['unchanged'] += 1
+        timestamp = datetime.fromtimestamp(int(match.group(1))) if match else None
+        page = Page(tables=cached.page.tables, timestamp=timestamp)
+    else:
+        page_stats['parsed'] += 1
+        page = extract_page([text])
+        if archive is not None:
+            archive.put(digest, content)
+    cache[url] = CachedPage(digest=digest, page=page, fetched_at=time.monotonic())
+    stage_timer.record(f'parse {query}', time.perf_counter() - parse_start)
+    return page
+
+
+def page_interval(url):
+    return POLL_INTERVALS.get(url.rsplit('?s=', 1)[-1], 0)
+
+
+def timed_parse(url, http=None, backend=None, cache=None):
+    start = time.perf_counter()
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and time.monotonic() - cached.fetched_at < page_interval(url):
+        page_stats['reused'] += 1
+        return cached.page, 0.0, False
+
+    page = parse(url, http, backend, cache)
+    return page, time.perf_counter() - start, page is not None
+
+
+def fetch_pages(urls, http=None, concurrent=None, cache=None):
+    http = http or session
+    cache = page_cache if cache is None else cache
+    if concurrent is None:
+        concurrent = FETCH_CONCURRENT
+
+    if concurrent:
+        futures = [fetch_executor.submit(timed_parse, url, http, None, cache) for url in urls]
+        results = [future.result() for future in futures]
+    else:
+        results = [timed_parse(url, http, None, cache) for url in urls]
+
+    if FETCH_TIMING:
+        timings = ', '.join(f"{url.rsplit('?', 1)[-1]}={elapsed * 1000:.0f}ms"
+                            for url, (_, elapsed, _) in zip(urls, results))
+        print(f"Fetch: {timings}")
+
+    # Seiten (None, wenn sie auch nach allen Versuchen nicht geladen werden konnten) und je Seite,
+    # ob sie in diesem Zyklus geladen wurde (False auch für Seiten aus dem Cache, POLL_INTERVALS)
+    return [page for page, _, _ in results], [live for _, _, live in results]
 
 
 def extract_data(soup, header_label, label):
@@ -244,12 +289,41 @@ def extract_data(soup, header_label, label):
     return None
 
 
+def index_tables(soup):
+    # Einmaliger Durchlauf über alle Info-Tabellen: [(header, {label: value})] in Dokumentreihenfolge
+    index = []
+    for table in soup.find_all('table', class_='info'):
+        header = table.find('th')
+        if not header:
+            continue
+        values = {}
+        index.append((header.text, values))
+        for cell in table.find_all('td'):
+            label = cell.string
+            if label is None or label in values:
+                continue
+            value = cell.find_next_sibling('td')
+            values[str(label)] = str(value.string) if value and value.string is not None else None
+
+    return index
+
+
+def lookup(index, header_label, label):
+    # Wie extract_data: die erste Tabelle, deren Kopf die Beschriftung enthält und die das Feld hat.
+    # Kein Vorrang für genau passende Köpfe, sonst gewänne "HEIZUNG" gegen ein früheres "WP HEIZUNG".
+    for header, values in index:
+        if header_label in header and label in values:
+            return values[label]
+
+    return None
+
+
 def extract_timestamp(soup):
     scripts = soup.find_all('script')
     timestamp = None
     for script in scripts:
         if script.string and 'timestampunterschied' in script.string:
-            match = re.search(r'var timestampunterschied = (\d+) \* 1000', script.string)
+            match = TIMESTAMP_RE.search(script.string)
             if match:
                 timestamp = datetime.fromtimestamp(int(match.group(1)))
                 break
@@ -257,333 +331,451 @@ def extract_timestamp(soup):
     return timestamp
 
 
-@repeat(every(1).seconds)
-def scrape_and_store():
-    url_status = "http://192.168.1.118/?s=1,0"
-    url_wp = "http://192.168.1.118/?s=1,1"
-    url_energy = "http://192.168.1.118/?s=1,8"
+@dataclass
+class Page:
+    tables: dict
+    timestamp: datetime
 
-    soup_status = parse(url_status)
-    if soup_status is None:
-        return
 
-    soup_wp = parse(url_wp)
-    if soup_wp is None:
-        return
+def soup_page(chunks):
+    soup = BeautifulSoup(''.join(chunks), 'html.parser')
+    return Page(tables=index_tables(soup), timestamp=extract_timestamp(soup))
 
-    soup_energy = parse(url_energy)
-    if soup_energy is None:
-        return
 
-    timestamp = extract_timestamp(soup_wp)
+class InfoTableParser(HTMLParser):
+    # Liest die Info-Tabellen und den Zeitstempel ohne Dokumentbaum;
+    # Kopf-, Zellen- und Skripttexte werden wie bei BeautifulSoup gebildet.
+    VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                           'param', 'source', 'track', 'wbr'])
+    ASCII_SPACES = ' \n\t\x0c\r'
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []
+        self.timestamp = None
+        self._text = []
+        self._table_stack = []  # None für Tabellen ohne Klasse "info"
+        self._header = None  # Text des ersten <th>, solange es offen ist
+        self._row = None
+        self._cell = None  # Knotenstapel der offenen Zelle: [Anzahl Kinder, .string]
+        self._script = None
+        self._infos = []  # je begonnener Info-Tabelle (header, values), None ohne Kopf
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if tag == 'script':
+            self._script = []
+            return
+        if tag == 'table':
+            classes = (dict(attrs).get('class') or '').split()
+            table = {'header': None, 'rows': []} if 'info' in classes else None
+            if table is not None:
+                # Reihenfolge nach dem Beginn der Tabelle wie bei find_all, verschachtelte danach
+                table['position'] = len(self._infos)
+                self._infos.append(None)
+            self._table_stack.append(table)
+            return
+
+        table = self._table_stack[-1] if self._table_stack else None
+        if table is None:
+            return
+        if tag in ('tr', 'td', 'th'):
+            self._close_cell()
+            if tag == 'tr':
+                self._close_row()
+                self._row = []
+            elif tag == 'td':
+                self._cell = [[0, None]]
+            elif table['header'] is None and self._header is None:
+                self._header = []
+        elif self._cell is not None and tag not in self.VOID_TAGS:
+            self._add_child(None)
+            self._cell.append([0, None])
+        elif self._cell is not None:
+            self._add_child(None)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_text()
+        if self._cell is not None:
+            self._add_child(None)
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if tag == 'script':
+            if self._script is not None and self.timestamp is None:
+                self._match_timestamp(''.join(self._script))
+            self._script = None
+            return
+
+        table = self._table_stack[-1] if self._table_stack else None
+        if tag == 'table':
+            if self._table_stack:
+                self._close_row()
+                self._table_stack.pop()
+                if table is not None:
+                    self._store_table(table)
+            return
+        if table is None:
+            return
+
+        if tag == 'td':
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag == 'th':
+            if self._header is not None:
+                table['header'] = ''.join(self._header)
+                self._header = None
+        elif self._cell is not None and len(self._cell) > 1 and tag not in self.VOID_TAGS:
+            count, string = self._cell.pop()
+            parent = self._cell[-1]
+            if parent[0] == 1:
+                parent[1] = string if count == 1 else None
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._end_text()
+        if self._cell is not None:
+            self._add_child(data)
+
+    def close(self):
+        super().close()
+        self._end_text()
+        self.tables = [info for info in self._infos if info is not None]
+
+    def _end_text(self):
+        if not self._text:
+            return
+        text = ''.join(self._text)
+        self._text = []
+
+        if self._script is not None:
+            self._script.append(text)
+            return
+        if not text.strip(self.ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        if self._header is not None:
+            self._header.append(text)
+        if self._cell is not None:
+            self._add_child(text)
+
+    def _add_child(self, string):
+        node = self._cell[-1]
+        node[0] += 1
+        node[1] = string if node[0] == 1 else None
+
+    def _close_cell(self):
+        if self._cell is None:
+            return
+        count, string = self._cell[0]
+        if self._row is not None:
+            self._row.append(string if count == 1 else None)
+        self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        table = self._table_stack[-1] if self._table_stack else None
+        if self._row is not None and table is not None:
+            table['rows'].append(self._row)
+        self._row = None
+
+    def _store_table(self, table):
+        if table['header'] is None:
+            return
+        values = {}
+        self._infos[table['position']] = (table['header'], values)
+        for row in table['rows']:
+            for i, label in enumerate(row):
+                if label is None or label in values:
+                    continue
+                values[label] = row[i + 1] if i + 1 < len(row) else None
+
+    def _match_timestamp(self, script):
+        if script and 'timestampunterschied' in script:
+            match = TIMESTAMP_RE.search(script)
+            if match:
+                self.timestamp = datetime.fromtimestamp(int(match.group(1)))
+
+
+def stream_page(chunks):
+    parser = InfoTableParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return Page(tables=parser.tables, timestamp=parser.timestamp)
+
+
+EXTRACT_BACKENDS = {
+    'bs4': soup_page,
+    'stream': stream_page,
+}
+
+
+@dataclass
+class CachedPage:
+    digest: bytes
+    page: Page
+    fetched_at: float
+
+
+def extract_sample(page_status, page_wp, page_energy, timestamp=None):
+    # (timestamp, Werte in der Reihenfolge von registry.FIELDS); ohne timestamp gilt die Uhr der
+    # Wärmepumpenseite
+    timestamp = timestamp or page_wp.timestamp
     if not timestamp:
         timestamp = datetime.now()
 
-    data_status = WpStatus(timestamp=timestamp,
-                           raumtemp_ist=extract_data(soup_status, 'RAUMTEMPERATUR', 'ISTTEMPERATUR 1'),
-                           raumtemp_soll=extract_data(soup_status, 'RAUMTEMPERATUR', 'SOLLTEMPERATUR 1'),
-                           raumfeuchte=extract_data(soup_status, 'RAUMTEMPERATUR', 'RAUMFEUCHTE 1'),
-                           taupunkttemp=extract_data(soup_status, 'RAUMTEMPERATUR', 'TAUPUNKTTEMPERATUR 1'),
-                           warmwasser_ist=extract_data(soup_status, 'WARMWASSER', 'ISTTEMPERATUR'),
-                           warmwasser_soll=extract_data(soup_status, 'WARMWASSER', 'SOLLTEMPERATUR'),
-                           warmwasser_volumenstrom=extract_data(soup_status, 'WARMWASSER', 'VOLUMENSTROM'),
-                           kuehlen_ist=extract_data(soup_status, 'KÜHLEN', 'ISTTEMPERATUR'),
-                           kuehlen_soll=extract_data(soup_status, 'KÜHLEN', 'SOLLTEMPERATUR'),
-                           aussentemp=extract_data(soup_status, 'HEIZUNG', 'AUSSENTEMPERATUR'),
-                           hk1_ist=extract_data(soup_status, 'HEIZUNG', 'ISTTEMPERATUR HK 1'),
-                           hk1_soll=extract_data(soup_status, 'HEIZUNG', 'SOLLTEMPERATUR HK 1'),
-                           vorlaufisttemp_wp=extract_data(soup_status, 'HEIZUNG', 'VORLAUFISTTEMPERATUR WP'),
-                           vorlaufisttemp_nhz=extract_data(soup_status, 'HEIZUNG', 'VORLAUFISTTEMPERATUR NHZ'),
-                           ruecklaufisttemp_wp=extract_data(soup_status, 'HEIZUNG', 'RÜCKLAUFISTTEMPERATUR WP'),
-                           pufferisttemp=extract_data(soup_status, 'HEIZUNG', 'PUFFERISTTEMPERATUR'),
-                           puffersolltemp=extract_data(soup_status, 'HEIZUNG', 'PUFFERSOLLTEMPERATUR'),
-                           heizungsdruck=extract_data(soup_status, 'HEIZUNG', 'HEIZUNGSDRUCK'),
-                           frostschutz=extract_data(soup_status, 'HEIZUNG', 'FROSTSCHUTZ')
-                           )
-
-    data_wp = WpData(
-        timestamp=timestamp,
-        ruecklauftemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'RÜCKLAUFTEMPERATUR'),
-        vorlauftemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'VORLAUFTEMPERATUR'),
-        frostschutztemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'FROSTSCHUTZTEMPERATUR'),
-        aussentemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'AUSSENTEMPERATUR'),
-        verdampfertemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'VERDAMPFERTEMPERATUR'),
-        verdichtereintrittstemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'VERDICHTEREINTRITTSTEMPERATUR'),
-        heissgastemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'HEISSGASTEMPERATUR'),
-        verfluessigertemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'VERFLÜSSIGERTEMPERATUR'),
-        oelsumpftemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'ÖLSUMPFTEMPERATUR'),
-        druck_niederdruck=extract_data(soup_wp, 'PROZESSDATEN', 'DRUCK NIEDERDRUCK'),
-        druck_hochdruck=extract_data(soup_wp, 'PROZESSDATEN', 'DRUCK HOCHDRUCK'),
-        wp_wasservolumenstrom=extract_data(soup_wp, 'PROZESSDATEN', 'WP WASSERVOLUMENSTROM'),
-        strom_inverter=extract_data(soup_wp, 'PROZESSDATEN', 'STROM INVERTER'),
-        spannung_inverter=extract_data(soup_wp, 'PROZESSDATEN', 'SPANNUNG INVERTER'),
-        istdrehzahl_verdichter=extract_data(soup_wp, 'PROZESSDATEN', 'ISTDREHZAHL VERDICHTER'),
-        solldrehzahl_verdichter=extract_data(soup_wp, 'PROZESSDATEN', 'SOLLDREHZAHL VERDICHTER'),
-        luefterleistung_rel=extract_data(soup_wp, 'PROZESSDATEN', 'LÜFTERLEISTUNG REL'),
-        verdampfereintrittstemperatur=extract_data(soup_wp, 'PROZESSDATEN', 'VERDAMPFEREINTRITTSTEMPERATUR'),
-        expansionsventileintrittstemperatur=extract_data(soup_wp,
-                                                         'PROZESSDATEN',
-                                                         'EXPANSIONSVENTILEINTRITTSTEMPERATUR'),
-        inverter_aufnahmeleistung=extract_data(soup_wp, 'PROZESSDATEN', 'INVERTER AUFNAHMELEISTUNG'),
-        starts_verdichter=extract_data(soup_wp, 'STARTS', 'VERDICHTER'),
-        waermemenge_vd_heizen_tag=extract_data(soup_wp, 'WÄRMEMENGE', 'VD HEIZEN TAG'),
-        waermemenge_vd_heizen_summe=extract_data(soup_wp, 'WÄRMEMENGE', 'VD HEIZEN SUMME'),
-        waermemenge_vd_warmwasser_tag=extract_data(soup_wp, 'WÄRMEMENGE', 'VD WARMWASSER TAG'),
-        waermemenge_vd_warmwasser_summe=extract_data(soup_wp, 'WÄRMEMENGE', 'VD WARMWASSER SUMME'),
-        waermemenge_nhz_heizen_summe=extract_data(soup_wp, 'WÄRMEMENGE', 'NHZ HEIZEN SUMME'),
-        waermemenge_nhz_warmwasser_summe=extract_data(soup_wp, 'WÄRMEMENGE', 'NHZ WARMWASSER SUMME'),
-        leistungsaufnahme_vd_heizen_tag=extract_data(soup_wp, 'LEISTUNGSAUFNAHME', 'VD HEIZEN TAG'),
-        leistungsaufnahme_vd_heizen_summe=extract_data(soup_wp, 'LEISTUNGSAUFNAHME', 'VD HEIZEN SUMME'),
-        leistungsaufnahme_vd_warmwasser_tag=extract_data(soup_wp, 'LEISTUNGSAUFNAHME', 'VD WARMWASSER TAG'),
-        leistungsaufnahme_vd_warmwasser_summe=extract_data(soup_wp, 'LEISTUNGSAUFNAHME', 'VD WARMWASSER SUMME'),
-        laufzeit_vd_heizen=extract_data(soup_wp, 'LAUFZEIT', 'VD HEIZEN'),
-        laufzeit_vd_warmwasser=extract_data(soup_wp, 'LAUFZEIT', 'VD WARMWASSER'),
-        laufzeit_vd_kuehlen=extract_data(soup_wp, 'LAUFZEIT', 'VD KÜHLEN'),
-        laufzeit_vd_abtauen=extract_data(soup_wp, 'LAUFZEIT', 'VD ABTAUEN'),
-        laufzeit_nhz_1=extract_data(soup_wp, 'LAUFZEIT', 'NHZ 1'),
-        laufzeit_nhz_2=extract_data(soup_wp, 'LAUFZEIT', 'NHZ 2'),
-        laufzeit_nhz_1_2=extract_data(soup_wp, 'LAUFZEIT', 'NHZ 1/2'),
-        laufzeit_zeit_abtauen=extract_data(soup_wp, 'LAUFZEIT', 'ZEIT ABTAUEN'),
-        laufzeit_starts_abtauen=extract_data(soup_wp, 'LAUFZEIT', 'STARTS ABTAUEN'),
-        )
+    tables = (page_status.tables, page_wp.tables, page_energy.tables)
+    return timestamp, tuple([lookup(tables[page], header, label) for page, header, label in LOOKUPS])
 
-    data_energy = WpEnergy(
-        timestamp=timestamp,
-        waermemenge_heizen_1_24_h=extract_data(soup_energy, 'WÄRMEMENGE', 'HEIZEN 1-24 h'),
-        waermemenge_heizen_1_12_m=extract_data(soup_energy, 'WÄRMEMENGE', 'HEIZEN 1-12 M'),
-        waermemenge_heizen_13_24_m=extract_data(soup_energy, 'WÄRMEMENGE', 'HEIZEN 13-24 M'),
-        waermemenge_kuehlen_1_24_h=extract_data(soup_energy, 'WÄRMEMENGE', 'KÜHLEN 1-24 h'),
-        waermemenge_kuehlen_1_12_m=extract_data(soup_energy, 'WÄRMEMENGE', 'KÜHLEN 1-12 M'),
-        waermemenge_kuehlen_13_24_m=extract_data(soup_energy, 'WÄRMEMENGE', 'KÜHLEN 13-24 M'),
-        waermemenge_warmwasser_1_24_h=extract_data(soup_energy, 'WÄRMEMENGE', 'WARMWASSER 1-24 h'),
-        waermemenge_warmwasser_1_12_m=extract_data(soup_energy, 'WÄRMEMENGE', 'WARMWASSER 1-12 M'),
-        waermemenge_warmwasser_13_24_m=extract_data(soup_energy, 'WÄRMEMENGE', 'WARMWASSER 13-24 M'),
-        effizienz_heizen_1_24_h=extract_data(soup_energy, 'EFFIZIENZ', 'HEIZEN 1-24 h'),
-        effizienz_heizen_1_12_m=extract_data(soup_energy, 'EFFIZIENZ', 'HEIZEN 1-12 M'),
-        effizienz_heizen_13_24_m=extract_data(soup_energy, 'EFFIZIENZ', 'HEIZEN 13-24 M'),
-        effizienz_kuehlen_1_24_h=extract_data(soup_energy, 'EFFIZIENZ', 'KÜHLEN 1-24 h'),
-        effizienz_kuehlen_1_12_m=extract_data(soup_energy, 'EFFIZIENZ', 'KÜHLEN 1-12 M'),
-        effizienz_kuehlen_13_24_m=extract_data(soup_energy, 'EFFIZIENZ', 'KÜHLEN 13-24 M'),
-        effizienz_warmwasser_1_24_h=extract_data(soup_energy, 'EFFIZIENZ', 'WARMWASSER 1-24 h'),
-        effizienz_warmwasser_1_12_m=extract_data(soup_energy, 'EFFIZIENZ', 'WARMWASSER 1-12 M'),
-        effizienz_warmwasser_13_24_m=extract_data(soup_energy, 'EFFIZIENZ', 'WARMWASSER 13-24 M'),
-        stromverbrauch_heizen_1_24_h=extract_data(soup_energy, 'STROMVERBRAUCH', 'HEIZEN 1-24 h'),
-        stromverbrauch_heizen_1_12_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'HEIZEN 1-12 M'),
-        stromverbrauch_heizen_13_24_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'HEIZEN 13-24 M'),
-        stromverbrauch_kuehlen_1_24_h=extract_data(soup_energy, 'STROMVERBRAUCH', 'KÜHLEN 1-24 h'),
-        stromverbrauch_kuehlen_1_12_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'KÜHLEN 1-12 M'),
-        stromverbrauch_kuehlen_13_24_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'KÜHLEN 13-24 M'),
-        stromverbrauch_warmwasser_1_24_h=extract_data(soup_energy, 'STROMVERBRAUCH', 'WARMWASSER 1-24 h'),
-        stromverbrauch_warmwasser_1_12_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'WARMWASSER 1-12 M'),
-        stromverbrauch_warmwasser_13_24_m=extract_data(soup_energy, 'STROMVERBRAUCH', 'WARMWASSER 13-24 M')
-        )
 
-    try:
-        with conn.cursor() as cur:
-            data_list = [
-                data_status.timestamp,
-                data_status.raumtemp_ist,
-                data_status.raumtemp_soll,
-                data_status.raumfeuchte,
-                data_status.taupunkttemp,
-                data_status.warmwasser_ist,
-                data_status.warmwasser_soll,
-                data_status.warmwasser_volumenstrom,
-                data_status.kuehlen_ist,
-                data_status.kuehlen_soll,
-                data_status.aussentemp,
-                data_status.hk1_ist,
-                data_status.hk1_soll,
-                data_status.vorlaufisttemp_wp,
-                data_status.vorlaufisttemp_nhz,
-                data_status.ruecklaufisttemp_wp,
-                data_status.pufferisttemp,
-                data_status.puffersolltemp,
-                data_status.heizungsdruck,
-                data_status.frostschutz,
-                data_wp.ruecklauftemperatur,
-                data_wp.vorlauftemperatur,
-                data_wp.frostschutztemperatur,
-                data_wp.aussentemperatur,
-                data_wp.verdampfertemperatur,
-                data_wp.verdichtereintrittstemperatur,
-                data_wp.heissgastemperatur,
-                data_wp.verfluessigertemperatur,
-                data_wp.oelsumpftemperatur,
-                data_wp.druck_niederdruck,
-                data_wp.druck_hochdruck,
-                data_wp.wp_wasservolumenstrom,
-                data_wp.strom_inverter,
-                data_wp.spannung_inverter,
-                data_wp.istdrehzahl_verdichter,
-                data_wp.solldrehzahl_verdichter,
-                data_wp.luefterleistung_rel,
-                data_wp.verdampfereintrittstemperatur,
-                data_wp.expansionsventileintrittstemperatur,
-                data_wp.inverter_aufnahmeleistung,
-                data_wp.starts_verdichter,
-                data_wp.waermemenge_vd_heizen_tag,
-                data_wp.waermemenge_vd_heizen_summe,
-                data_wp.waermemenge_vd_warmwasser_tag,
-                data_wp.waermemenge_vd_warmwasser_summe,
-                data_wp.waermemenge_nhz_heizen_summe,
-                data_wp.waermemenge_nhz_warmwasser_summe,
-                data_wp.leistungsaufnahme_vd_heizen_tag,
-                data_wp.leistungsaufnahme_vd_heizen_summe,
-                data_wp.leistungsaufnahme_vd_warmwasser_tag,
-                data_wp.leistungsaufnahme_vd_warmwasser_summe,
-                data_wp.laufzeit_vd_heizen,
-                data_wp.laufzeit_vd_warmwasser,
-                data_wp.laufzeit_vd_kuehlen,
-                data_wp.laufzeit_vd_abtauen,
-                data_wp.laufzeit_nhz_1,
-                data_wp.laufzeit_nhz_2,
-                data_wp.laufzeit_nhz_1_2,
-                data_wp.laufzeit_zeit_abtauen,
-                data_wp.laufzeit_starts_abtauen,
-                data_energy.waermemenge_heizen_1_24_h,
-                data_energy.waermemenge_heizen_1_12_m,
-                data_energy.waermemenge_heizen_13_24_m,
-                data_energy.waermemenge_kuehlen_1_24_h,
-                data_energy.waermemenge_kuehlen_1_12_m,
-                data_energy.waermemenge_kuehlen_13_24_m,
-                data_energy.waermemenge_warmwasser_1_24_h,
-                data_energy.waermemenge_warmwasser_1_12_m,
-                data_energy.waermemenge_warmwasser_13_24_m,
-                data_energy.effizienz_heizen_1_24_h,
-                data_energy.effizienz_heizen_1_12_m,
-                data_energy.effizienz_heizen_13_24_m,
-                data_energy.effizienz_kuehlen_1_24_h,
-                data_energy.effizienz_kuehlen_1_12_m,
-                data_energy.effizienz_kuehlen_13_24_m,
-                data_energy.effizienz_warmwasser_1_24_h,
-                data_energy.effizienz_warmwasser_1_12_m,
-                data_energy.effizienz_warmwasser_13_24_m,
-                data_energy.stromverbrauch_heizen_1_24_h,
-                data_energy.stromverbrauch_heizen_1_12_m,
-                data_energy.stromverbrauch_heizen_13_24_m,
-                data_energy.stromverbrauch_kuehlen_1_24_h,
-                data_energy.stromverbrauch_kuehlen_1_12_m,
-                data_energy.stromverbrauch_kuehlen_13_24_m,
-                data_energy.stromverbrauch_warmwasser_1_24_h,
-                data_energy.stromverbrauch_warmwasser_1_12_m,
-                data_energy.stromverbrauch_warmwasser_13_24_m
-                ]
-            cur.execute('''
-                 INSERT INTO data (
-                     timestamp,
-                     raumtemp_ist, 
-                     raumtemp_soll, 
-                     raumfeuchte, 
-                     taupunkttemp,
-                     warmwasser_ist, 
-                     warmwasser_soll, 
-                     warmwasser_volumenstrom,
-                     kuehlen_ist, 
-                     kuehlen_soll,
-                     aussentemp, 
-                     hk1_ist, 
-                     hk1_soll, 
-                     vorlaufisttemp_wp, 
-                     vorlaufisttemp_nhz,
-                     ruecklaufisttemp_wp, 
-                     pufferisttemp, 
-                     puffersolltemp, 
-                     heizungsdruck,
-                     frostschutz,
-                     ruecklauftemperatur,
-                     vorlauftemperatur,
-                     frostschutztemperatur,
-                     aussentemperatur,
-                     verdampfertemperatur,
-                     verdichtereintrittstemperatur,
-                     heissgastemperatur,
-                     verflüssigertemperatur,
-                     oelsumpftemperatur,
-                     druck_niederdruck,
-                     druck_hochdruck,
-                     wp_wasservolumenstrom,
-                     strom_inverter,
-                     spannung_inverter,
-                     istdrehzahl_verdichter,
-                     solldrehzahl_verdichter,
-                     luefterleistung_rel,
-                     verdampfereintrittstemperatur,
-                     expansionsventileintrittstemperatur,
-                     inverter_aufnahmeleistung,
-                     starts_verdichter,
-                     waermemenge_vd_heizen_tag,
-                     waermemenge_vd_heizen_summe,
-                     waermemenge_vd_warmwasser_tag,
-                     waermemenge_vd_warmwasser_summe,
-                     waermemenge_nhz_heizen_summe,
-                     waermemenge_nhz_warmwasser_summe,
-                     leistungsaufnahme_vd_heizen_tag,
-                     leistungsaufnahme_vd_heizen_summe,
-                     leistungsaufnahme_vd_warmwasser_tag,
-                     leistungsaufnahme_vd_warmwasser_summe,
-                     laufzeit_vd_heizen,
-                     laufzeit_vd_warmwasser,
-                     laufzeit_vd_kuehlen,
-                     laufzeit_vd_abtauen,
-                     laufzeit_nhz_1,
-                     laufzeit_nhz_2,
-                     laufzeit_nhz_1_2,
-                     laufzeit_zeit_abtauen,
-                     laufzeit_starts_abtauen,
-                     waermemenge_heizen_1_24_h,
-                     waermemenge_heizen_1_12_m,
-                     waermemenge_heizen_13_24_m,
-                     waermemenge_kuehlen_1_24_h,
-                     waermemenge_kuehlen_1_12_m,
-                     waermemenge_kuehlen_13_24_m,
-                     waermemenge_warmwasser_1_24_h,
-                     waermemenge_warmwasser_1_12_m,
-                     waermemenge_warmwasser_13_24_m,
-                     effizienz_heizen_1_24_h,
-                     effizienz_heizen_1_12_m,
-                     effizienz_heizen_13_24_m,
-                     effizienz_kuehlen_1_24_h,
-                     effizienz_kuehlen_1_12_m,
-                     effizienz_kuehlen_13_24_m,
-                     effizienz_warmwasser_1_24_h,
-                     effizienz_warmwasser_1_12_m,
-                     effizienz_warmwasser_13_24_m,
-                     stromverbrauch_heizen_1_24_h,
-                     stromverbrauch_heizen_1_12_m,
-                     stromverbrauch_heizen_13_24_m,
-                     stromverbrauch_kuehlen_1_24_h,
-                     stromverbrauch_kuehlen_1_12_m,
-                     stromverbrauch_kuehlen_13_24_m,
-                     stromverbrauch_warmwasser_1_24_h,
-                     stromverbrauch_warmwasser_1_12_m,
-                     stromverbrauch_warmwasser_13_24_m
-                 ) VALUES (
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                     %s, %s, %s, %s, %s, %s, %s);
-                 ''', data_list)
+def numeric_values(values):
+    return tuple([to_number(value) if number else value for number, value in zip(NUMBER_FIELDS, values)])
+
+
+def scrape_and_store(device):
+    with profiler.cycle():
+        store_sample(device)
+
+
+def sample_row(device_id, timestamp, values, missing_pages=None):
+    # Eine Zeile in der Reihenfolge von DATA_COLUMNS; missing_pages z.B. "1,8" für eine fehlende Seite
+    return (timestamp, device_id, missing_pages) + values
+
+
+def sample_timestamp(pages, live):
+    # Uhr des ISG aus einer in diesem Zyklus geladenen Seite, Wärmepumpe zuerst. Eine Seite aus dem
+    # Cache trägt die Uhrzeit ihres Abrufs und würde bei jedem Zyklus dieselbe Zeit liefern.
+    for index in (1, 0, 2):
+        if live[index] and pages[index].timestamp:
+            return pages[index].timestamp
+    return datetime.now()
+
+
+def store_sample(device):
+    if device.breaker is not None and not device.breaker.allow():
+        return
+    start = time.perf_counter()
+    urls = device.urls(PAGE_QUERIES)
+    pages, live = fetch_pages(urls, device.session, cache=device.page_cache)
+    missing = [query for query, page in zip(PAGE_QUERIES, pages) if page is None]
+    if not any(live):
+        # Nur Seiten aus dem Cache (z.B. Energie, POLL_INTERVAL_ENERGY) sind keine Stichprobe; ist
+        # dabei eine Seite ausgefallen, ist der ISG nicht erreichbar
+        if missing:
+            device.failures += 1
+            if device.breaker is not None:
+                device.breaker.failure()
+        return
+    if device.breaker is not None:
+        device.breaker.success()
+    device.last_success = time.monotonic()
+    if missing:
+        # Teilweise Stichprobe: Felder der fehlenden Seiten bleiben leer, missing_pages nennt die Seiten
+        device.partial += 1
+
+    if device.refresh_tracker is not None and live[1] and pages[1].timestamp is not None:
+        # Abruf an der Aktualisierung des ISG ausrichten, unveränderte Stände verwerfen
+        now = time.monotonic()
+        fresh = device.refresh_tracker.observe(pages[1].timestamp, now)
+        next_poll = device.refresh_tracker.next_poll(now)
+        if next_poll is not None:
+            device.job.reschedule(next_poll)
+        if not fresh:
+            return
+
+    extract_start = time.perf_counter()
+    # Fehlende Seiten: keine Tabellen, die Felder bleiben leer
+    timestamp, values = extract_sample(*[Page(tables=[], timestamp=None) if page is None else page
+                                         for page in pages], timestamp=sample_timestamp(pages, live))
+    if NUMERIC_STORAGE:
+        values = numeric_values(values)
+    device.latest = (timestamp, values)
+    if device.history is not None:
+        device.history.append(timestamp, values)
+    if archive is not None:
+        archive.record(timestamp, device.id, [None if page is None else device.page_cache[url].digest
+                                              for url, page in zip(urls, pages)])
+    store_start = time.perf_counter()
+    stage_timer.record('extract', store_start - extract_start)
+    if RECORD_MODE != 'changes':
+        writer.put('data', sample_row(device.id, timestamp, values, ' '.join(missing) or None))
+    if RECORD_MODE != 'full':
+        # Felder fehlender Seiten gelten nicht als geändert
+        skip = {column for query in missing for column in PAGE_COLUMNS[query]}
+        for _, field, value in device.recorder.changes(timestamp, values, skip):
+            writer.put('data_changes', (timestamp, device.id, field, value))
+    if device.rollups is not None:
+        for resolution, row in device.rollups.add(timestamp, values):
+            writer.put(f'rollup_{resolution}', row)
+    if device.derived is not None:
+        for row in device.derived.add(timestamp, values):
+            writer.put('derived', row)
+    if device.events is not None:
+        for row in device.events.add(timestamp, values):
+            writer.put('events', row)
+    end = time.perf_counter()
+    stage_timer.record('store', end - store_start)
+    stage_timer.record('cycle', end - start)
+    device.record(end - start)
+
 
+_reextract_archive = None
+
+
+def reextract_day(directory, day, columns, numeric, backend, since=None, until=None):
+    # Läuft im Prozesspool: alle Stichproben eines Tages aus dem Archiv neu extrahieren.
+    # Gleiche Seiten ergeben dieselben Werte, geparst wird daher nur einmal je Digest-Kombination.
+    global _reextract_archive
+    if _reextract_archive is None:
+        _reextract_archive = PageArchive(directory, readonly=True)
+    indexes = [VALUE_COLUMNS.index(column) for column in columns]
+    extract_page = EXTRACT_BACKENDS[backend]
+    pages = {}
+    values = {}
+    rows = []
+    for timestamp, device_id, digests in _reextract_archive.records(day):
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue
+        key = (device_id, digests)
+        if key not in values:
+            try:
+                for digest in digests:
+                    if digest is not None and digest not in pages:
+                        pages[digest] = extract_page([_reextract_archive.load(digest, day[:7])]).tables
+            except KeyError:
+                continue  # Seite fehlt im Archiv
+            _, sample = extract_sample(*[Page(tables=pages[digest] if digest else [], timestamp=timestamp)
+                                         for digest in digests])
+            if numeric:
+                sample = numeric_values(sample)
+            missing = ' '.join(query for query, digest in zip(PAGE_QUERIES, digests) if digest is None)
+            values[key] = [missing or None] + [sample[i] for i in indexes]
+        rows.append([timestamp, device_id] + values[key])
+    return rows
+
+
+def copy_text(rows):
+    # COPY-Textformat: Tabulator, \N für NULL
+    def field(value):
+        if value is None:
+            return '\\N'
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    return io.StringIO(''.join('\t'.join(field(value) for value in row) + '\n' for row in rows))
+
+
+def backfill(directory, columns, since=None, until=None, workers=None, overwrite=False, insert_missing=False,
+             cold_days=()):
+    # Nachextrahierte Werte tageweise per COPY in eine temporäre Tabelle und von dort in data;
+    # ohne overwrite werden nur leere Felder gefüllt, jeder Tag ist eine eigene Transaktion
+    numeric = number_column_types() <= set(NUMERIC_TYPES)
+    days = PageArchive(directory, readonly=True).days()
+    days = [day for day in days if (not since or day >= since.strftime('%Y-%m-%d'))
+            and (not until or day < until.strftime('%Y-%m-%d'))]
+    # Verschobene Tage fehlen in data: UPDATE träfe nichts, --insert-missing legte sie doppelt an
+    skipped = [day for day in days if day in cold_days]
+    if skipped:
+        print(f"Skipping {len(skipped)} days in the cold tier ({skipped[0]} to {skipped[-1]}).")
+        days = [day for day in days if day not in cold_days]
+    since = datetime.combine(since, datetime.min.time()) if since else None
+    until = datetime.combine(until, datetime.min.time()) if until else None
+    quoted = [f'"{column}"' for column in KEY_COLUMNS + columns]
+    assignments = ', '.join(f'"{column}" = r."{column}"' if overwrite
+                            else f'"{column}" = COALESCE(d."{column}", r."{column}")' for column in columns)
+
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute('CREATE TEMP TABLE reextract (LIKE data) ON COMMIT DELETE ROWS')
+    conn.commit()
+    start = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(reextract_day, directory, day, columns, numeric, EXTRACT_BACKEND,
+                               since, until): day for day in days}
+        for future in as_completed(futures):
+            rows = future.result()
+            with conn.cursor() as cur:
+                cur.copy_expert(f'COPY reextract ({", ".join(quoted)}) FROM STDIN', copy_text(rows))
+                cur.execute(f'''
+                    UPDATE data AS d SET {assignments} FROM reextract AS r
+                    WHERE d.timestamp = r.timestamp AND d.device_id = r.device_id
+                ''')
+                updated = cur.rowcount
+                inserted = 0
+                if insert_missing:
+                    cur.execute(f'''
+                        INSERT INTO data ({", ".join(quoted)}) SELECT {", ".join(f"r.{c}" for c in quoted)}
+                        FROM reextract AS r WHERE NOT EXISTS (
+                            SELECT 1 FROM data AS d
+                            WHERE d.timestamp = r.timestamp AND d.device_id = r.device_id)
+                    ''')
+                    inserted = cur.rowcount
             conn.commit()
+            total += len(rows)
+            print(f"{futures[future]}: {len(rows)} samples, {updated} rows updated, {inserted} inserted")
+    conn.autocommit = True
+    elapsed = time.perf_counter() - start
+    print(f"Re-extracted {total} samples from {len(days)} days in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed > 0 else 0:.0f} samples/s).")
+
 
-    except IndexError as e:
-        print("IndexError:", e)
-        print("Überprüfe die Länge und Inhalte der Datenliste.")
-        # Weitere Debug-Informationen ausgeben
-        print("Datenliste enthält:", len(data_list), "Elemente.")
-        print(data_list)
-    except psycopg2.Error as e:
-        print("Database error:", e)
-        conn.rollback()
+def refuse_cold_days(command, cold_days, since=None):
+    # Neuberechnungen löschen ab since und lesen nur data; verschobene Tage gingen dabei verloren
+    affected = [day for day in cold_days if since is None or day >= since.isoformat()]
+    if affected:
+        after = date.fromisoformat(affected[-1]) + timedelta(days=1)
+        raise SystemExit(f"{command}: {len(affected)} days from {affected[0]} to {affected[-1]} are in the "
+                         f"cold tier (COLD_DIR), use --since {after.isoformat()} or later.")
+
+
+def partition_maintenance(months_ahead, retention_months):
+    # Eigene Verbindung je Lauf: die Verbindung vom Start überlebt keinen Neustart von PostgreSQL
+    maintenance_conn = connect()
+    try:
+        maintain_partitions(maintenance_conn, months_ahead, retention_months)
+    finally:
+        maintenance_conn.close()
+
+
+def report_stats():
+    for name, stats in stats_sources.items():
+        print(f"{name}:", ', '.join(f"{key}={value:.3g}" if isinstance(value, float) else f"{key}={value}"
+                                    for key, value in stats().items()))
 
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Stiebel Eltron ISG scraper')
+    arg_parser.add_argument('command', nargs='?', default='run',
+                            choices=['run', 'migrate-numeric', 'migrate-partitions', 'rebuild-rollups',
+                                     'rebuild-events', 'reextract', 'export', 'tier'],
+                            help='run: Daten erfassen (Standard); '
+                                 'migrate-numeric: Spalten von TEXT auf REAL umstellen; '
+                                 'migrate-partitions: Tabelle data in Monatspartitionen umziehen; '
+                                 'rebuild-rollups: Verdichtungen aus data neu berechnen; '
+                                 'rebuild-events: Verdichterläufe, Abtauen, NHZ aus data neu bestimmen; '
+                                 'reextract: Felder aus dem Seitenarchiv (ARCHIVE_DIR) nachtragen; '
+                                 'export: data tageweise nach EXPORT_DIR schreiben (fortsetzbar); '
+                                 'tier: Tage älter als COLD_AFTER_DAYS nach COLD_DIR verschieben')
+    arg_parser.add_argument('--since', type=date.fromisoformat,
+                            help='rebuild-rollups, rebuild-events, reextract, export: erst ab diesem Tag '
+                                 '(JJJJ-MM-TT)')
+    arg_parser.add_argument('--until', type=date.fromisoformat,
+                            help='reextract, export: nur vor diesem Tag (JJJJ-MM-TT)')
+    arg_parser.add_argument('--columns', help='reextract, export: Spalten, kommagetrennt (Standard: alle)')
+    arg_parser.add_argument('--workers', type=int,
+                            help='reextract: Anzahl Prozesse (Standard: CPU-Kerne); '
+                                 'export: parallele Verbindungen (Standard: 4)')
+    arg_parser.add_argument('--overwrite', action='store_true',
+                            help='reextract: vorhandene Werte ersetzen statt nur leere Felder zu füllen; '
+                                 'export: auch bereits exportierte Tage neu schreiben')
+    arg_parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv',
+                            help='export: csv (gzip) oder parquet (braucht pyarrow)')
+    arg_parser.add_argument('--insert-missing', action='store_true',
+                            help='reextract: Stichproben ohne Zeile in data neu einfügen')
+    args = arg_parser.parse_args()
+
     load_dotenv()
 
     # Umgebungsvariablen lesen
@@ -592,23 +784,298 @@ if __name__ == '__main__':
     DB_USER = os.getenv("DB_USER")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
     DB_PORT = os.getenv("DB_PORT", "5432")  # Standard-Port für PostgreSQL
+    FETCH_CONCURRENT = env_flag("FETCH_CONCURRENT")  # Seiten parallel abrufen
+    FETCH_TIMING = env_flag("FETCH_TIMING")  # Abrufzeiten je Seite ausgeben
+    FETCH_TIMEOUT = (float(os.getenv("FETCH_CONNECT_TIMEOUT", "3.05")),
+                     float(os.getenv("FETCH_READ_TIMEOUT", "5")))
+    FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))  # Wiederholungen je Seite und Zyklus
+    FETCH_RETRY_BACKOFF = float(os.getenv("FETCH_RETRY_BACKOFF", "0.2"))
+    EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "bs4")  # bs4 oder stream
+    if EXTRACT_BACKEND not in EXTRACT_BACKENDS:
+        raise SystemExit(f"Unknown EXTRACT_BACKEND {EXTRACT_BACKEND!r}, "
+                         f"expected one of {', '.join(EXTRACT_BACKENDS)}")
+    RECORD_MODE = os.getenv("RECORD_MODE", "full")  # full, changes oder both
+    if RECORD_MODE not in RECORD_MODES:
+        raise SystemExit(f"Unknown RECORD_MODE {RECORD_MODE!r}, expected one of {', '.join(RECORD_MODES)}")
+    # Geräte: DEVICES_FILE (JSON) oder DEVICES="id=host,...", sonst ein Gerät unter ISG_HOST
+    try:
+        devices = load_devices(os.getenv("DEVICES_FILE"), os.getenv("DEVICES"),
+                               default_host=os.getenv("ISG_HOST", "192.168.1.118"),
+                               default_id=os.getenv("DEVICE_ID", DEFAULT_DEVICE))
+    except (OSError, ValueError, KeyError) as e:
+        raise SystemExit(f"Invalid device configuration: {e}")
+    POLL_INTERVALS = {
+        '1,0': float(os.getenv("POLL_INTERVAL_STATUS", "0")),
+        '1,1': float(os.getenv("POLL_INTERVAL_WP", "0")),
+        # Die Energiewerte ändern sich höchstens stündlich
+        '1,8': float(os.getenv("POLL_INTERVAL_ENERGY", "60")),
+    }
 
     # Datenbankverbindung aufbauen
-    conn = psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-        )
+    conn = connect()
     conn.autocommit = True
 
-    create_schema()
+    # Monatspartitionen: PARTITION_MONTHS_AHEAD im Voraus anlegen,
+    # nach DATA_RETENTION_MONTHS löschen (0 = nie)
+    PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+    data_retention_months = int(os.getenv("DATA_RETENTION_MONTHS", "0"))
+
+    if args.command == 'migrate-numeric':
+        create_schema()
+        migrate_numeric()
+        conn.close()
+        raise SystemExit(0)
+
+    # Tage, die tier aus data in die kalte Stufe verschoben hat
+    cold_dir = os.getenv("COLD_DIR", "cold")
+    cold_days = ColdStore(cold_dir).days() if os.path.isdir(cold_dir) else []
+
+    # Verdichtete Tabellen rollup_minute/_hour/_day für ROLLUP_FIELDS (Standard: DEFAULT_FIELDS)
+    rollup_fields = [field.strip() for field in os.getenv("ROLLUP_FIELDS", "").split(',') if field.strip()]
+    rollup_fields = rollup_fields or DEFAULT_FIELDS
+    unknown_fields = set(rollup_fields) - set(VALUE_COLUMNS)
+    if unknown_fields:
+        raise SystemExit(f"Unknown ROLLUP_FIELDS {', '.join(sorted(unknown_fields))}")
+
+    if args.command == 'rebuild-rollups':
+        refuse_cold_days('rebuild-rollups', cold_days, args.since)
+        create_schema()
+        with conn.cursor() as cur:
+            cur.execute(ROLLUP_SCHEMA)
+            cur.execute(number_function_sql())
+        numeric = number_column_types() <= set(NUMERIC_TYPES)
+        start = time.perf_counter()
+        rebuild_rollups(conn, rollup_fields, numeric, args.since)
+        print(f"Rebuilt rollups in {time.perf_counter() - start:.1f}s.")
+        conn.close()
+        raise SystemExit(0)
+
+    if args.command == 'rebuild-events':
+        refuse_cold_days('rebuild-events', cold_days, args.since)
+        create_schema()
+        with conn.cursor() as cur:
+            cur.execute(EVENTS_SCHEMA)
+        rebuild_events(conn, args.since)
+        conn.close()
+        raise SystemExit(0)
+
+    # Rohseiten für reextract aufheben, leer = aus
+    archive_dir = os.getenv("ARCHIVE_DIR")
+
+    if args.command == 'reextract':
+        if not archive_dir:
+            raise SystemExit("reextract needs ARCHIVE_DIR.")
+        columns = [column.strip() for column in args.columns.split(',')] if args.columns else VALUE_COLUMNS
+        unknown_columns = set(columns) - set(VALUE_COLUMNS)
+        if unknown_columns:
+            raise SystemExit(f"Unknown columns {', '.join(sorted(unknown_columns))}")
+        create_schema()
+        backfill(archive_dir, columns, args.since, args.until, args.workers, args.overwrite,
+                 args.insert_missing, cold_days)
+        conn.close()
+        raise SystemExit(0)
+
+    if args.command == 'export':
+        columns = [column.strip() for column in args.columns.split(',')] if args.columns else VALUE_COLUMNS
+        unknown_columns = set(columns) - set(VALUE_COLUMNS)
+        if unknown_columns:
+            raise SystemExit(f"Unknown columns {', '.join(sorted(unknown_columns))}")
+        column_types = dict(data_column_types(), timestamp='timestamp without time zone', device_id='text',
+                            missing_pages='text')
+        export_days(conn, connect, os.getenv("EXPORT_DIR", "export"), KEY_COLUMNS + columns, column_types,
+                    args.since, args.until, args.format, args.workers, args.overwrite, cold_dir)
+        conn.close()
+        raise SystemExit(0)
+
+    if args.command == 'tier':
+        # Spaltenorientierte Tagesdateien, lesbar über coldstore.ColdStore bzw. read_range (beide Stufen)
+        create_schema()
+        column_types = dict(data_column_types(), timestamp='timestamp without time zone', device_id='text',
+                            missing_pages='text')
+        store = ColdStore(cold_dir)
+        tier_data(conn, store, DATA_COLUMNS, column_types, int(os.getenv("COLD_AFTER_DAYS", "90")))
+        store.close()
+        conn.close()
+        raise SystemExit(0)
+
+    if args.command == 'migrate-partitions':
+        create_schema()
+        if migrate_partitions(conn, PARTITION_MONTHS_AHEAD):
+            create_schema()
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('data_changes')")
+                if cur.fetchone()[0] is not None:
+                    cur.execute(CHANGES_SCHEMA)
+        conn.close()
+        raise SystemExit(0)
+
+    # Neue Installationen können direkt mit typisierten Spalten starten,
+    # bestehende Tabellen werden erst durch migrate-numeric umgestellt
+    column_types = number_column_types()
+    NUMERIC_STORAGE = column_types <= set(NUMERIC_TYPES) if column_types else env_flag("NUMERIC_STORAGE")
+    create_schema('REAL' if NUMERIC_STORAGE else 'TEXT', partitioned=env_flag("PARTITIONING"))
+    if env_flag("NUMERIC_STORAGE") and not NUMERIC_STORAGE:
+        print("NUMERIC_STORAGE is set but table data has TEXT columns, run 'scraper.py migrate-numeric'.")
+    partitioned = is_partitioned(conn)
+    if env_flag("PARTITIONING") and not partitioned:
+        print("PARTITIONING is set but table data is not partitioned, run 'scraper.py migrate-partitions'.")
+
+    if RECORD_MODE != 'full':
+        # Nur Änderungen speichern: Totband je Feld, spätestens alle HEARTBEAT_SECONDS ein Wert
+        with conn.cursor() as cur:
+            cur.execute(CHANGES_SCHEMA)
+        for device in devices:
+            device.recorder = ChangeRecorder(VALUE_COLUMNS,
+                                             deadbands=parse_deadbands(os.getenv("DEADBANDS")),
+                                             default_deadband=float(os.getenv("DEADBAND_DEFAULT", "0")),
+                                             heartbeat=float(os.getenv("HEARTBEAT_SECONDS", "900")))
+            stats_sources[f'Changes {device.id}'] = device.recorder.stats
+
+    # Schreiben in Batches: Anzahl Zeilen bzw. maximales Alter in Sekunden.
+    # Bei Verbindungsabbruch wird in SPOOL_DIR zwischengespeichert.
+    writer = BatchWriter(connect,
+                         batch_size=int(os.getenv("WRITE_BATCH_SIZE", "30")),
+                         max_age=float(os.getenv("WRITE_MAX_AGE", "5")),
+                         queue_size=int(os.getenv("WRITE_QUEUE_SIZE", "3600")),
+                         spool=Spool(os.getenv("SPOOL_DIR", "spool")),
+                         replay_batch_size=int(os.getenv("SPOOL_REPLAY_BATCH_SIZE", "5000")),
+                         timer=stage_timer)
+    # PREPARED_INSERT=0 z.B. hinter einem Pooler im Transaktionsmodus, der keine PREPAREs kennt
+    if env_flag("PREPARED_INSERT", True):
+        writer.register('data', DATA_EXECUTE, prepare=DATA_PREPARE)
+    else:
+        writer.register('data', DATA_INSERT)
+    writer.register('data_changes', CHANGES_INSERT)
+    for resolution in RESOLUTIONS:
+        writer.register(f'rollup_{resolution}', rollup_insert(resolution), combine=combine_rows)
+    writer.register('derived', DERIVED_INSERT, combine=combine_derived)
+    writer.register('events', EVENTS_INSERT, combine=combine_events)
+    writer.start()
+    if archive_dir:
+        archive = PageArchive(archive_dir)
+        stats_sources['Archive'] = archive.stats
+    stats_sources['Writer'] = writer.stats
+    stats_sources['Pages'] = lambda: dict(page_stats)
+    stats_sources['Stages'] = stage_timer.stats
+
+    # Feste Termine auf der monotonen Uhr; MISSED_TICK_POLICY: skip, catch-up oder coalesce.
+    # Mehrere Geräte werden von höchstens SCRAPE_WORKERS Threads gleichzeitig abgefragt.
+    scrape_workers = int(os.getenv("SCRAPE_WORKERS", str(min(len(devices), 8))))
+    scrape_executor = ThreadPoolExecutor(scrape_workers, 'scrape') if scrape_workers > 1 else None
+    fetch_executor = ThreadPoolExecutor(max_workers=3 * scrape_workers, thread_name_prefix='fetch')
+    scheduler = DeadlineScheduler(executor=scrape_executor)
+    missed_tick_policy = os.getenv("MISSED_TICK_POLICY", "skip")
+    if missed_tick_policy not in POLICIES:
+        raise SystemExit(f"Unknown MISSED_TICK_POLICY {missed_tick_policy!r}, "
+                         f"expected one of {', '.join(POLICIES)}")
+    scrape_interval = float(os.getenv("SCRAPE_INTERVAL", "1"))
+    adaptive_polling = env_flag("ADAPTIVE_POLLING")
+    # Letzte HISTORY_SECONDS Sekunden je Gerät im Speicher (SampleRing), 0 = aus
+    history_seconds = float(os.getenv("HISTORY_SECONDS", "3600"))
+    # Gerät nach BREAKER_THRESHOLD Zyklen ohne Antwort pausieren, 0 = immer abfragen
+    breaker_threshold = int(os.getenv("BREAKER_THRESHOLD", "3"))
+    rollups = env_flag("ROLLUPS")
+    if rollups:
+        with conn.cursor() as cur:
+            cur.execute(ROLLUP_SCHEMA)
+    # Wärmeleistung, COP und Energien je DERIVED_RESOLUTION Sekunden in Tabelle derived
+    derived = env_flag("DERIVED")
+    derived_resolution = int(os.getenv("DERIVED_RESOLUTION", "60"))
+    if derived:
+        with conn.cursor() as cur:
+            cur.execute(DERIVED_SCHEMA)
+    # Verdichterläufe, Abtauvorgänge und NHZ-Betrieb als Zeilen in Tabelle events
+    events = env_flag("EVENTS")
+    if events:
+        with conn.cursor() as cur:
+            cur.execute(EVENTS_SCHEMA)
+    for i, device in enumerate(devices):
+        device.session = create_session()
+        interval = device.interval or scrape_interval
+        # Starts über das Intervall verteilen, damit nicht alle Geräte im selben Moment abgefragt werden
+        device.job = scheduler.add(partial(scrape_and_store, device), interval, missed_tick_policy,
+                                   name=f'scrape {device.id}', delay=i * interval / len(devices))
+        stats_sources[f'Device {device.id}'] = device.stats
+        stats_sources[f'Scheduler {device.id}'] = device.job.stats
+
+        if history_seconds > 0:
+            device.history = SampleRing(VALUE_COLUMNS, math.ceil(history_seconds / interval))
+            stats_sources[f'History {device.id}'] = device.history.stats
+
+        if breaker_threshold > 0:
+            device.breaker = CircuitBreaker(device.id, breaker_threshold,
+                                            float(os.getenv("BREAKER_COOLDOWN", "30")),
+                                            float(os.getenv("BREAKER_MAX_COOLDOWN", "600")))
+            stats_sources[f'Breaker {device.id}'] = device.breaker.stats
+
+        if adaptive_polling:
+            device.refresh_tracker = RefreshTracker(guard=float(os.getenv("ADAPTIVE_GUARD", "0.2")),
+                                                    retry=float(os.getenv("ADAPTIVE_RETRY", "0.25")))
+            stats_sources[f'Refresh {device.id}'] = device.refresh_tracker.stats
+
+        if rollups:
+            device.rollups = RollupAggregator(device.id, VALUE_COLUMNS, rollup_fields)
+            stats_sources[f'Rollups {device.id}'] = device.rollups.stats
+
+        if derived:
+            device.derived = DerivedMetrics(device.id, VALUE_COLUMNS, derived_resolution)
+            stats_sources[f'Derived {device.id}'] = device.derived.stats
+
+        if events:
+            device.events = EventDetector(device.id, VALUE_COLUMNS)
+            stats_sources[f'Events {device.id}'] = device.events.stats
+
+    if partitioned:
+        # Partitionen rechtzeitig vor dem Monatswechsel anlegen und abgelaufene Monate löschen
+        maintain_partitions(conn, PARTITION_MONTHS_AHEAD, data_retention_months)
+        scheduler.add(partial(partition_maintenance, PARTITION_MONTHS_AHEAD, data_retention_months),
+                      6 * 3600, 'skip', name='partitions', delay=6 * 3600)
+
+    # OpenMetrics unter http://<host>:METRICS_PORT/metrics, 0 = aus
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port:
+        metrics_server = MetricsServer((os.getenv("METRICS_BIND", "0.0.0.0"), metrics_port),
+                                       devices, VALUE_COLUMNS, stats_sources, UNITS).start()
+        stats_sources['Metrics'] = lambda: {'requests': metrics_server.requests}
+
+    stats_interval = int(os.getenv("STATS_INTERVAL", "300"))  # Sekunden, 0 = aus
+    if stats_interval > 0:
+        scheduler.add(report_stats, stats_interval, 'skip', delay=stats_interval)
+
+    # Profil der nächsten PROFILE_CYCLES Zyklen nach PROFILE_DIR, beim Start mit PROFILE_ON_START
+    # oder jederzeit per "kill -USR1"; PROFILE_MODE: cprofile oder sample
+    profile_mode = os.getenv("PROFILE_MODE", "cprofile")
+    if profile_mode not in PROFILE_MODES:
+        raise SystemExit(f"Unknown PROFILE_MODE {profile_mode!r}, expected one of {', '.join(PROFILE_MODES)}")
+    profiler = CycleProfiler(os.getenv("PROFILE_DIR", "profiles"), profile_mode)
+    profile_cycles = int(os.getenv("PROFILE_CYCLES", "60"))
+    stats_sources['Profiler'] = profiler.stats
+    if env_flag("PROFILE_ON_START"):
+        profiler.arm(profile_cycles)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.arm(profile_cycles))
+
+    # docker stop sendet SIGTERM, gepufferte Zeilen sollen trotzdem geschrieben werden
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
 
     try:
-        while True:
-            run_pending()
-            time.sleep(1)
+        scheduler.run()
     except KeyboardInterrupt:
         print("Stopped.")
+        scheduler.stop()
+        if scrape_executor is not None:
+            scrape_executor.shutdown()
+        # Angefangene Minuten der Verdichtung, abgeleitete Werte und offene Ereignisse noch schreiben
+        for device in devices:
+            if device.rollups is not None:
+                for resolution, row in device.rollups.flush():
+                    writer.put(f'rollup_{resolution}', row)
+            if device.derived is not None:
+                for row in device.derived.flush():
+                    writer.put('derived', row)
+            if device.events is not None:
+                for row in device.events.flush():
+                    writer.put('events', row)
+        writer.close()
+        if archive is not None:
+            archive.flush()
         conn.close()
@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Cannot spool value of type {type(value).__name__}")
+
+
+def _decode(value):
+    if '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+
+class Spool:
+    # Lokaler Zwischenspeicher für Zeilen, die nicht in die Datenbank geschrieben
+    # werden konnten. Jedes append() wird als eigenes gzip-Member an das aktuelle
+    # Segment angehängt und mit fsync gesichert; volle Segmente werden rotiert und
+    # beim Wiedereinspielen erst nach erfolgreichem Schreiben gelöscht.
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._rows = {}
+        for path in self.segments():
+            self._rows[path] = sum(1 for _ in self._read(path))
+        self._sequence = max((self._segment_number(path) for path in self._rows), default=0)
+        self._current = None
+
+    def segments(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.jsonl.gz'))
+        return [os.path.join(self.directory, name) for name in names]
+
+    @property
+    def rows(self):
+        # Wird auch vom Metrik-Thread gelesen, während der Writer-Thread _rows ändert
+        with self._lock:
+            return sum(self._rows.values())
+
+    @property
+    def size_bytes(self):
+        with self._lock:
+            paths = list(self._rows)
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass  # inzwischen eingespielt und gelöscht
+        return size
+
+    def append(self, items):
+        # items: Liste von (target, row)
+        lines = ''.join(json.dumps([target, list(row)], default=_encode) + '\n' for target, row in items)
+        with self._lock:
+            if self._current is None or os.path.getsize(self._current) >= self.segment_bytes:
+                self._sequence += 1
+                self._current = os.path.join(self.directory, f'{self._sequence:012d}.jsonl.gz')
+                self._rows[self._current] = 0
+            with open(self._current, 'ab') as f:
+                f.write(gzip.compress(lines.encode('utf-8')))
+                f.flush()
+                os.fsync(f.fileno())
+            self._rows[self._current] += len(items)
+
+    def oldest(self):
+        # Ältestes Segment samt Inhalt; das offene Segment wird dabei abgeschlossen
+        with self._lock:
+            if not self._rows:
+                return None, []
+            path = min(self._rows)
+            if path == self._current:
+                self._current = None
+        return path, list(self._read(path))
+
+    def remove(self, path):
+        with self._lock:
+            os.remove(path)
+            del self._rows[path]
+
+    def _read(self, path):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        target, row = json.loads(line, object_hook=_decode)
+                    except ValueError:
+                        continue
+                    yield target, tuple(row)
+        except (EOFError, OSError) as e:
+            # Abgebrochener Schreibvorgang am Segmentende
+            print(f"Spool segment {path} truncated: {e}")
+
+    @staticmethod
+    def _segment_number(path):
+        return int(os.path.basename(path).split('.', 1)[0])
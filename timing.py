@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def percentile(values, p):
+    # values aufsteigend sortiert
+    return values[min(int(p * len(values)), len(values) - 1)] if values else 0.0
+
+
+class StageTimer:
+    # Laufzeiten je Stufe (z.B. "fetch 1,1", "parse 1,1", "extract", "store", "insert") über die
+    # letzten window Messungen. record() ist ein deque.append und kann aus jedem Thread kommen.
+
+    def __init__(self, window=600):
+        self.window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        durations = self._stages.get(stage)
+        if durations is None:
+            with self._lock:
+                durations = self._stages.setdefault(stage, deque(maxlen=self.window))
+        durations.append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def stats(self):
+        stats = {}
+        for stage, durations in sorted(self._stages.items()):
+            values = sorted(durations)
+            name = stage.replace(' ', '_')
+            stats[f'{name}_p50_ms'] = percentile(values, 0.5) * 1000
+            stats[f'{name}_p95_ms'] = percentile(values, 0.95) * 1000
+            stats[f'{name}_p99_ms'] = percentile(values, 0.99) * 1000
+        return stats
@@ -0,0 +1,57 @@
+import re
+
+# Werte der ISG-Seiten: deutsches Zahlenformat mit Einheit, z.B. "21,5 °C", "12.418", "24,871 MWh".
+# Punkte sind Tausendertrennzeichen, das Komma ist das Dezimalzeichen.
+VALUE_PATTERN = r'^\s*([-+]?[0-9.]*[0-9](?:,[0-9]+)?)\s*(\S*)'
+_value_re = re.compile(VALUE_PATTERN)
+
+# Einheit auf der Seite -> (kanonische Einheit, Faktor)
+UNITS = {
+    '°C': ('°C', 1),
+    'K': ('K', 1),
+    'bar': ('bar', 1),
+    'l/min': ('l/min', 1),
+    'Wh': ('kWh', 0.001),
+    'kWh': ('kWh', 1),
+    'MWh': ('kWh', 1000),
+    'W': ('kW', 0.001),
+    'kW': ('kW', 1),
+    'Hz': ('Hz', 1),
+    '%': ('%', 1),
+    'h': ('h', 1),
+    'min': ('h', 1 / 60),
+    's': ('h', 1 / 3600),
+    'V': ('V', 1),
+    'A': ('A', 1),
+}
+
+
+def normalize_value(value):
+    # Liefert (Zahl, kanonische Einheit) oder (None, None), wenn der Wert keine Zahl ist
+    if value is None:
+        return None, None
+    match = _value_re.match(value)
+    if not match:
+        return None, None
+
+    number = float(match.group(1).replace('.', '').replace(',', '.'))
+    unit, factor = UNITS.get(match.group(2), (match.group(2) or None, 1))
+    if factor != 1:
+        number *= factor
+    return number, unit
+
+
+def to_number(value):
+    return normalize_value(value)[0]
+
+
+def number_function_sql(name='isg_number'):
+    # Gleiche Umrechnung in SQL, für die Migration bestehender TEXT-Spalten
+    factors = ' '.join(f"WHEN '{unit}' THEN {factor!r}" for unit, (_, factor) in UNITS.items() if factor != 1)
+    return f'''
+    CREATE OR REPLACE FUNCTION {name}(value TEXT) RETURNS DOUBLE PRECISION AS $$
+        SELECT replace(replace(m[1], '.', ''), ',', '.')::DOUBLE PRECISION
+               * CASE m[2] {factors} ELSE 1 END
+        FROM (SELECT regexp_match(value, '{VALUE_PATTERN}') AS m) AS parts
+    $$ LANGUAGE sql IMMUTABLE STRICT;
+'''
@@ -0,0 +1,291 @@
+import queue
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+
+_STOP = object()
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class BatchWriter:
+    # Schreibt Zeilen gesammelt aus einem eigenen Thread, damit eine langsame
+    # Datenbank den Abruf nie aufhält. Geflusht wird nach Anzahl oder Alter;
+    # ist die Warteschlange voll, wartet put() höchstens put_timeout Sekunden.
+    # Ist die Datenbank nicht erreichbar, landen die Batches im Spool und werden
+    # nach dem Wiederverbinden in großen Blöcken nachgeschrieben.
+
+    def __init__(self, connect, batch_size=30, max_age=5.0, queue_size=3600, put_timeout=0.2,
+                 spool=None, replay_batch_size=5000, reconnect_interval=1.0, max_reconnect_interval=60.0,
+                 timer=None):
+        self.connect = connect
+        self.timer = timer
+        self.conn = None
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.put_timeout = put_timeout
+        self.spool = spool
+        self.replay_batch_size = replay_batch_size
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.targets = {}
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_dropped = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.replay_rows_per_second = 0.0
+        self.reconnects = 0
+        self.last_flush_seconds = 0.0
+        self._retry_delay = reconnect_interval
+        self._next_connect = 0.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='writer', daemon=True)
+
+    def register(self, target, sql, template=None, combine=None, prepare=None):
+        # sql mit genau einem "VALUES %s" für execute_values; combine(rows) kann die Zeilen
+        # eines Batches vorher zusammenfassen (z.B. gleiche Schlüssel für ON CONFLICT).
+        # Mit prepare (PREPARE ...) läuft diese Anweisung einmal je Verbindung und sql ist das
+        # passende EXECUTE mit einem Platzhalter je Spalte, geschrieben per execute_batch.
+        self.targets[target] = (sql, template, combine, prepare)
+
+    def start(self):
+        self._connected()
+        self._thread.start()
+        return self
+
+    def put(self, target, row):
+        try:
+            self._queue.put((target, row), timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            print(f"Write queue full, dropping {target} row.")
+            return False
+
+    def close(self, timeout=30):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self.conn is not None:
+            self.conn.close()
+
+    def stats(self):
+        stats = {
+            'queue_depth': self._queue.qsize(),
+            'connected': self.conn is not None,
+            'reconnects': self.reconnects,
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'rows_dropped': self.rows_dropped,
+            'last_flush_seconds': self.last_flush_seconds,
+        }
+        if self.spool is not None:
+            stats.update({
+                'spool_rows': self.spool.rows,
+                'spool_segments': len(self.spool.segments()),
+                'spool_bytes': self.spool.size_bytes,
+                'rows_spooled': self.rows_spooled,
+                'rows_replayed': self.rows_replayed,
+                'replay_rows_per_second': self.replay_rows_per_second,
+            })
+        return stats
+
+    def _run(self):
+        batch = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = self.max_age if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_age
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush(batch)
+                batch = []
+                deadline = None
+
+            if not stopping and self.spool is not None and self.spool.rows:
+                self.replay()
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        if not self._connected():
+            self._spool(batch)
+            return False
+
+        try:
+            dropped = self._write(batch)
+        except CONNECTION_ERRORS as e:
+            print("Database connection lost:", e)
+            self._disconnect()
+            self._spool(batch)
+            return False
+        except psycopg2.Error as e:
+            # Nur noch Fehler beim Commit, der ganze Batch ist verloren
+            print("Database error:", e)
+            self.conn.rollback()
+            self.rows_dropped += len(batch)
+            return False
+
+        self.last_flush_seconds = time.perf_counter() - start
+        if self.timer is not None:
+            self.timer.record('insert', self.last_flush_seconds)
+        self.rows_written += len(batch) - dropped
+        self.rows_dropped += dropped
+        self.batches_written += 1
+        return True
+
+    def replay(self):
+        # Ein Spool-Segment pro Aufruf, damit neue Batches dazwischen geschrieben werden
+        if not self._connected():
+            return False
+
+        path, items = self.spool.oldest()
+        if path is None:
+            return False
+
+        start = time.perf_counter()
+        try:
+            # Ein Segment ist eine Transaktion: nach einem Abbruch wird es vollständig wiederholt,
+            # ohne dass bereits geschriebene Blöcke doppelt ankommen
+            dropped = 0
+            for i in range(0, len(items), self.replay_batch_size):
+                dropped += self._write(items[i:i + self.replay_batch_size], commit=False)
+            self.conn.commit()
+        except CONNECTION_ERRORS as e:
+            print("Database connection lost during spool replay:", e)
+            self._disconnect()
+            return False
+        except psycopg2.Error as e:
+            # Ein Segment mit unbrauchbaren Daten darf den Spool nicht dauerhaft blockieren
+            print(f"Database error replaying {path}, discarding {len(items)} rows:", e)
+            self.conn.rollback()
+            self.rows_dropped += len(items)
+            self.spool.remove(path)
+            return False
+
+        self.spool.remove(path)
+        elapsed = time.perf_counter() - start
+        self.rows_replayed += len(items) - dropped
+        self.rows_dropped += dropped
+        self.replay_rows_per_second = len(items) / elapsed if elapsed > 0 else 0.0
+        print(f"Replayed {len(items)} spooled rows in {elapsed:.1f}s, {self.spool.rows} rows left.")
+        return True
+
+    def _write(self, items, commit=True):
+        # -> Anzahl verworfener Zeilen. Jedes Ziel hat einen eigenen Savepoint: scheitert z.B. eine
+        # Rollup- oder Event-Zeile, bleiben die Rohdaten des Batches erhalten. Das gescheiterte Ziel wird
+        # zeilenweise wiederholt, verworfen werden nur die Zeilen, die selbst scheitern.
+        # Verbindungsfehler gehen an den Aufrufer (Spool bzw. Segment wiederholen).
+        rows = {}
+        for target, row in items:
+            rows.setdefault(target, []).append(row)
+
+        dropped = 0
+        with self.conn.cursor() as cur:
+            for target, target_rows in rows.items():
+                combine = self.targets[target][2]
+                if combine is not None:
+                    target_rows = combine(target_rows)
+                try:
+                    self._execute(cur, target, target_rows)
+                except CONNECTION_ERRORS:
+                    raise
+                except psycopg2.Error as e:
+                    print(f"Database error writing {target}, retrying {len(target_rows)} rows one by one:", e)
+                    failed = 0
+                    for row in target_rows:
+                        try:
+                            self._execute(cur, target, [row])
+                        except CONNECTION_ERRORS:
+                            raise
+                        except psycopg2.Error as e:
+                            failed += 1
+                            error = e
+                    if failed:
+                        print(f"Dropping {failed} {target} rows:", error)
+                    dropped += failed
+        if commit:
+            self.conn.commit()
+        return dropped
+
+    def _execute(self, cur, target, rows):
+        sql, template, _, prepare = self.targets[target]
+        cur.execute('SAVEPOINT write_target')
+        try:
+            if prepare is not None:
+                execute_batch(cur, sql, rows, page_size=len(rows))
+            else:
+                execute_values(cur, sql, rows, template=template, page_size=len(rows))
+        except CONNECTION_ERRORS:
+            raise
+        except psycopg2.Error:
+            cur.execute('ROLLBACK TO SAVEPOINT write_target')
+            raise
+        cur.execute('RELEASE SAVEPOINT write_target')
+
+    def _spool(self, batch):
+        if self.spool is None:
+            self.rows_dropped += len(batch)
+            return
+        try:
+            self.spool.append(batch)
+            self.rows_spooled += len(batch)
+        except OSError as e:
+            print("Spool error:", e)
+            self.rows_dropped += len(batch)
+
+    def _connected(self):
+        if self.conn is not None:
+            return True
+        if time.monotonic() < self._next_connect:
+            return False
+
+        try:
+            # Eigene Verbindung: ein Batch wird in genau einer Transaktion geschrieben
+            conn = self.connect()
+            conn.autocommit = False
+            self._prepare(conn)
+        except psycopg2.Error as e:
+            print(f"Database unavailable, retrying in {self._retry_delay:.0f}s:", e)
+            self._next_connect = time.monotonic() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, self.max_reconnect_interval)
+            return False
+
+        if self._next_connect:
+            self.reconnects += 1
+            print("Database connection re-established.")
+        self.conn = conn
+        self._retry_delay = self.reconnect_interval
+        return True
+
+    def _prepare(self, conn):
+        # Vorbereitete Anweisungen gelten nur für diese Verbindung, nach jedem Verbinden neu
+        statements = [prepare for _, _, _, prepare in self.targets.values() if prepare is not None]
+        if not statements:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute(';\n'.join(statements))
+            conn.commit()
+        except psycopg2.Error:
+            conn.close()
+            raise
+
+    def _disconnect(self):
+        try:
+            self.conn.close()
+        except psycopg2.Error:
+            pass
+        self.conn = None
+        self._next_connect = time.monotonic()